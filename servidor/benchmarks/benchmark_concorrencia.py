@@ -0,0 +1,89 @@
+"""
+Benchmark: instâncias necessárias por 1k RPS conforme a concorrência.
+
+Simula uma instância Firebase atendendo C requisições simultâneas: cada
+requisição passa pelo controle de admissão (configurado para C) e por
+process_proxy_serpro, com o gateway substituído por um transporte local
+de latência fixa (espera de rede, sem CPU). Com a instância saturada,
+mede RPS, p50/p99 e quantas instâncias seriam necessárias para 1000 RPS.
+
+O processo único com GIL representa a instância de 1 vCPU: o custo de
+CPU de cada requisição limita o ganho com concorrência alta.
+
+Uso (a partir do diretório servidor/):
+    python -m benchmarks.benchmark_concorrencia --concorrencias 1,8,32,80 --latencia 0.2
+"""
+
+import os
+import math
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.benchmark_hedging import TransporteCaudaLonga
+from benchmarks.benchmark_transport import BODY_CONSULTA, TOKEN_TRIAL, _percentil
+
+
+def _medir(concorrencia: int, duracao: float) -> Dict[str, Any]:
+    """Satura uma instância com `concorrencia` requisições simultâneas."""
+    from src.admission import AdmissionController, _configuracao_escalada
+    from src.business_logic import process_proxy_serpro
+
+    controlador = AdmissionController(_configuracao_escalada(concorrencia))
+    data = {
+        "endpoint": "/Consultar",
+        "body": BODY_CONSULTA,
+        "access_token": TOKEN_TRIAL,
+        "jwt_token": TOKEN_TRIAL,
+        "ambiente": "trial",
+    }
+    fim = time.perf_counter() + duracao
+
+    def trabalhador(_: int) -> List[float]:
+        latencias = []
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            prioridade = controlador.classificar("proxy_serpro", data)
+            with controlador.admitir(prioridade):
+                process_proxy_serpro(data)
+            latencias.append(time.perf_counter() - inicio)
+        return latencias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        latencias = [valor for lista in executor.map(trabalhador, range(concorrencia)) for valor in lista]
+    rps = len(latencias) / (time.perf_counter() - inicio)
+    return {
+        "concorrencia": concorrencia,
+        "rps": round(rps, 1),
+        "p50_ms": round(statistics.median(latencias) * 1000, 1),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 1),
+        "instancias_por_1k_rps": math.ceil(1000 / rps),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--concorrencias", default="1,8,32,80")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Latência do gateway (s)")
+    parser.add_argument("--duracao", type=float, default=5.0, help="Segundos por medição")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SERPRO_USO_BACKEND", "memoria")
+    from src import transport
+
+    # Gateway simulado no lugar do transporte HTTP/1.1 compartilhado
+    with transport._transportes_lock:
+        transport._transportes[transport.TRANSPORTE_HTTP1] = TransporteCaudaLonga(
+            args.latencia, args.latencia, 0.0
+        )
+
+    for concorrencia in (int(valor) for valor in args.concorrencias.split(",")):
+        resultado = _medir(concorrencia, args.duracao)
+        print(" | ".join(f"{chave}={valor}" for chave, valor in resultado.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: latência de cauda com e sem hedge.
+
+Simula o gateway com um transporte local de cauda longa (a maioria das
+respostas rápida, uma fração lenta) e mede p50/p99 de MtlsClient.post
+numa consulta do catálogo, sem e com SERPRO_HEDGE_ATIVO. Informa também
+a fração de chamadas extras, que deve ficar dentro do orçamento.
+
+Uso (a partir do diretório servidor/):
+    python -m benchmarks.benchmark_hedging --chamadas 2000 --lentas 0.05
+"""
+
+import os
+import json
+import random
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.benchmark_transport import BODY_CONSULTA, TOKEN_TRIAL, _percentil
+from src.transport import RespostaHttp, Transport
+
+
+class TransporteCaudaLonga(Transport):
+    """Responde em `rapida` segundos, ou em `lenta` com probabilidade `fracao_lenta`."""
+
+    nome = "simulado"
+
+    def __init__(self, rapida: float, lenta: float, fracao_lenta: float):
+        super().__init__()
+        self.rapida = rapida
+        self.lenta = lenta
+        self.fracao_lenta = fracao_lenta
+        self._corpo = json.dumps({"status": 200, "mensagens": [], "dados": "{}"}).encode()
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        time.sleep(self.lenta if random.random() < self.fracao_lenta else self.rapida)
+        return RespostaHttp(200, {"content-type": "application/json"}, self._corpo)
+
+
+def _medir(transporte: Transport, chamadas: int, concorrencia: int) -> Dict[str, float]:
+    from src.mtls_client import MtlsClient
+
+    def chamar(_: int) -> float:
+        inicio = time.perf_counter()
+        MtlsClient(ambiente="trial", transporte=transporte).post(
+            "/Consultar", BODY_CONSULTA, TOKEN_TRIAL, TOKEN_TRIAL
+        )
+        return time.perf_counter() - inicio
+
+    antes = transporte.estatisticas()["requisicoes"]
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        duracoes: List[float] = list(executor.map(chamar, range(chamadas)))
+    extras = transporte.estatisticas()["requisicoes"] - antes - chamadas
+    return {
+        "p50_ms": round(statistics.median(duracoes) * 1000, 1),
+        "p99_ms": round(_percentil(duracoes, 99) * 1000, 1),
+        "max_ms": round(max(duracoes) * 1000, 1),
+        "extras_pct": round(100 * extras / chamadas, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--chamadas", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--rapida", type=float, default=0.02)
+    parser.add_argument("--lenta", type=float, default=0.5)
+    parser.add_argument("--lentas", type=float, default=0.05, help="Fração de respostas lentas")
+    parser.add_argument("--orcamento", type=float, default=10)
+    args = parser.parse_args()
+
+    transporte = TransporteCaudaLonga(args.rapida, args.lenta, args.lentas)
+
+    os.environ["SERPRO_HEDGE_ATIVO"] = "0"
+    sem_hedge = _medir(transporte, args.chamadas, args.concorrencia)
+
+    os.environ["SERPRO_HEDGE_ATIVO"] = "1"
+    os.environ["SERPRO_HEDGE_ORCAMENTO"] = str(args.orcamento)
+    os.environ["SERPRO_HEDGE_PERCENTIL"] = str(round(100 * (1 - args.lentas), 1))
+    com_hedge = _medir(transporte, args.chamadas, args.concorrencia)
+
+    for nome, resultado in (("sem_hedge", sem_hedge), ("com_hedge", com_hedge)):
+        print(" | ".join([f"modo={nome}"] + [f"{chave}={valor}" for chave, valor in resultado.items()]))
+
+
+if __name__ == "__main__":
+    main()
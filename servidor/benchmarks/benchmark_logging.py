@@ -0,0 +1,93 @@
+"""
+Benchmark: custo do logging no caminho da requisição.
+
+Compara o logging síncrono anterior (basicConfig + f-strings + exc_info)
+com o pipeline assíncrono de src/structured_logging.py, medindo o tempo
+gasto pela thread da requisição em cada chamada de log. A saída vai para
+um arquivo temporário (escrita real em disco, sem poluir o terminal).
+
+Uso (a partir do diretório servidor/):
+    python -m benchmarks.benchmark_logging --chamadas 20000 --threads 8
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.benchmark_transport import _percentil
+from src.structured_logging import configurar_logging, definir_correlation_id, encerrar_logging
+
+logger = logging.getLogger("benchmark")
+
+
+def _requisicao_sincrona(i: int):
+    """Padrão anterior do localhost.py: f-strings avaliadas sempre."""
+    endpoint = "/Consultar"
+    logger.info(f"[proxy_serpro] Endpoint: {endpoint}")
+    logger.info(f"[proxy_serpro] OK para {endpoint}")
+    if i % 50 == 0:
+        try:
+            raise RuntimeError("falha simulada")
+        except RuntimeError as e:
+            logger.error(f"[proxy_serpro] Erro: {e}", exc_info=True)
+
+
+def _requisicao_estruturada(i: int):
+    """Padrão novo: argumentos preguiçosos e correlation_id por requisição."""
+    definir_correlation_id(f"req-{i}")
+    endpoint = "/Consultar"
+    logger.info("[proxy_serpro] Endpoint: %s", endpoint)
+    logger.info("[proxy_serpro] OK para %s", endpoint)
+    if i % 50 == 0:
+        try:
+            raise RuntimeError("falha simulada")
+        except RuntimeError as e:
+            logger.error("[proxy_serpro] Erro: %s", e, exc_info=True)
+
+
+def _medir(requisicao: Callable[[int], None], chamadas: int, threads: int) -> Dict[str, float]:
+    def cronometrar(i: int) -> float:
+        inicio = time.perf_counter()
+        requisicao(i)
+        return time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        duracoes: List[float] = list(executor.map(cronometrar, range(chamadas)))
+    return {
+        "media_us": round(statistics.mean(duracoes) * 1e6, 1),
+        "p50_us": round(statistics.median(duracoes) * 1e6, 1),
+        "p99_us": round(_percentil(duracoes, 99) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--chamadas", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    raiz = logging.getLogger()
+    with tempfile.TemporaryFile("w") as destino:
+        # Antes: handler síncrono escrevendo na thread da requisição
+        handler = logging.StreamHandler(destino)
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        raiz.addHandler(handler)
+        raiz.setLevel(logging.INFO)
+        antes = _medir(_requisicao_sincrona, args.chamadas, args.threads)
+        raiz.removeHandler(handler)
+
+        # Depois: fila + listener com JSON e redação
+        configurar_logging(stream=destino)
+        depois = _medir(_requisicao_estruturada, args.chamadas, args.threads)
+        encerrar_logging()
+
+    for nome, resultado in (("sincrono", antes), ("fila_json", depois)):
+        print(" | ".join([f"modo={nome}"] + [f"{chave}={valor}" for chave, valor in resultado.items()]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: process_proxy_serpro reproduzindo um cassete gravado.
+
+Reenvia cada chamada de API gravada (modo SERPRO_CASSETE_MODO=gravar) pelo
+process_proxy_serpro com o cassete em modo reprodução: sem rede, com a
+latência original. O custo próprio do servidor é a diferença entre a
+latência medida e a gravada.
+
+Uso (a partir do diretório servidor/):
+    python -m benchmarks.benchmark_replay --cassete /tmp/serpro_cassete.jsonl --concorrencia 20
+"""
+
+import os
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.benchmark_transport import TOKEN_TRIAL, _percentil
+
+
+def _chamadas(caminho: str) -> List[Dict[str, Any]]:
+    """Chamadas de API do cassete (autenticações ficam de fora)."""
+    from src.dados_codec import carregar_json
+
+    chamadas = []
+    with open(caminho, "rb") as arquivo:
+        for linha in arquivo:
+            if not linha.strip():
+                continue
+            registro = carregar_json(linha)
+            if not registro.get("servico"):
+                continue
+            chamadas.append({
+                "endpoint": "/" + registro["url"].rstrip("/").rsplit("/", 1)[-1],
+                "body": carregar_json(registro["requisicao"]["corpo"]),
+                "latencia_gravada": registro["latencia_ms"] / 1000,
+            })
+    return chamadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cassete", default="/tmp/serpro_cassete.jsonl")
+    parser.add_argument("--concorrencia", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--fator-latencia", type=float, default=1.0)
+    args = parser.parse_args()
+
+    # Configura o cassete antes de criar qualquer MtlsClient
+    os.environ["SERPRO_CASSETE_MODO"] = "reproduzir"
+    os.environ["SERPRO_CASSETE_ARQUIVO"] = args.cassete
+    os.environ["SERPRO_CASSETE_FATOR_LATENCIA"] = str(args.fator_latencia)
+    from src.business_logic import process_proxy_serpro
+
+    chamadas = _chamadas(args.cassete) * args.repeticoes
+    if not chamadas:
+        print("Cassete sem chamadas de API")
+        return
+
+    def executar(chamada: Dict[str, Any]) -> float:
+        inicio = time.perf_counter()
+        process_proxy_serpro({
+            "endpoint": chamada["endpoint"],
+            "body": chamada["body"],
+            "access_token": TOKEN_TRIAL,
+            "jwt_token": TOKEN_TRIAL,
+            "ambiente": "trial",
+        })
+        return time.perf_counter() - inicio - chamada["latencia_gravada"] * args.fator_latencia
+
+    erros = 0
+    custos: List[float] = []
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        for futuro in [executor.submit(executar, chamada) for chamada in chamadas]:
+            try:
+                custos.append(futuro.result())
+            except Exception:
+                erros += 1
+    duracao = time.perf_counter() - inicio_total
+
+    resultado = {
+        "chamadas": len(chamadas),
+        "erros": erros,
+        "rps": round(len(chamadas) / duracao, 1),
+    }
+    if custos:
+        resultado.update({
+            "custo_p50_ms": round(statistics.median(custos) * 1000, 2),
+            "custo_p95_ms": round(_percentil(custos, 95) * 1000, 2),
+            "custo_p99_ms": round(_percentil(custos, 99) * 1000, 2),
+        })
+    print(" | ".join(f"{chave}={valor}" for chave, valor in resultado.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: HTTP/1.1 (requests) x HTTP/2 (httpx) contra o gateway SERPRO.
+
+Dispara N chamadas concorrentes de consulta no ambiente trial (sem
+certificado) usando cada transporte e compara conexões abertas e latência.
+
+Uso (a partir do diretório servidor/):
+    python -m benchmarks.benchmark_transport --requisicoes 200 --concorrencia 20
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+from src.mtls_client import MtlsClient
+from src.transport import Http1Transport, Http2Transport, Transport, HAS_HTTP2
+
+# Token fixo do ambiente trial (mesmo do MtlsClient.authenticate)
+TOKEN_TRIAL = "06aef429-a981-3ec5-a1f8-71d38d86481e"
+
+# Consulta simples do catálogo (CCMEI - Consultar Dados)
+BODY_CONSULTA = {
+    "contratante": {"numero": "00000000000000", "tipo": 2},
+    "autorPedidoDados": {"numero": "00000000000000", "tipo": 2},
+    "contribuinte": {"numero": "00000000000000", "tipo": 2},
+    "pedidoDados": {
+        "idSistema": "CCMEI",
+        "idServico": "DADOSCCMEI122",
+        "versaoSistema": "1.0",
+        "dados": ""
+    }
+}
+
+
+def _percentil(valores: List[float], percentil: float) -> float:
+    """Percentil por vizinho mais próximo."""
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(percentil / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def executar(transporte: Transport, requisicoes: int, concorrencia: int) -> Dict[str, Any]:
+    """Executa a carga com um transporte e resume os resultados."""
+    client = MtlsClient(ambiente="trial", transporte=transporte)
+    latencias: List[float] = []
+    erros = 0
+
+    def chamada(_):
+        inicio = time.perf_counter()
+        client.post("/Consultar", BODY_CONSULTA, TOKEN_TRIAL, TOKEN_TRIAL)
+        return time.perf_counter() - inicio
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        futuros = [executor.submit(chamada, i) for i in range(requisicoes)]
+        for futuro in futuros:
+            try:
+                latencias.append(futuro.result())
+            except Exception:
+                erros += 1
+    duracao = time.perf_counter() - inicio_total
+    transporte.close()
+
+    resultado = transporte.estatisticas()
+    resultado.update({
+        "erros": erros,
+        "rps": round(requisicoes / duracao, 1),
+    })
+    if latencias:
+        resultado.update({
+            "p50_ms": round(statistics.median(latencias) * 1000, 1),
+            "p95_ms": round(_percentil(latencias, 95) * 1000, 1),
+            "p99_ms": round(_percentil(latencias, 99) * 1000, 1),
+        })
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requisicoes", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, default=10)
+    parser.add_argument("--max-conexoes-http2", type=int, default=2)
+    args = parser.parse_args()
+
+    transportes: List[Transport] = [Http1Transport()]
+    if HAS_HTTP2:
+        transportes.append(Http2Transport(max_conexoes=args.max_conexoes_http2))
+    else:
+        print("httpx[http2] não instalado: executando apenas HTTP/1.1")
+
+    for transporte in transportes:
+        resultado = executar(transporte, args.requisicoes, args.concorrencia)
+        print(" | ".join(f"{chave}={valor}" for chave, valor in resultado.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,46 @@ TODA a lógica de negócio está em business_logic.py
 """
 
 import logging
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+from typing import Dict, Any, List, Optional
+
+import anyio
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
 # Importar lógica de negócio centralizada
 from src.business_logic import (
     process_autenticar_serpro,
     process_autenticar_procurador,
-    process_proxy_serpro
+    process_proxy_serpro,
+    process_registrar_certificado,
+    process_remover_certificado,
+    process_consultar_uso,
+    process_criar_job,
+    process_consultar_job,
+    process_resultados_job,
+    process_cancelar_job,
+    process_renovar_tokens_job,
+    process_exportar_job,
+    retomar_jobs_pendentes
 )
-
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+from src.affinity import EncaminhamentoError, obter_roteador
+from src.prewarm import obter_preaquecedor
+from src.transport import obter_transporte
+from src.certificate_registry import CertificadoNaoRegistradoError
+from src.jobs import JobNaoEncontradoError
+from src.admission import SobrecargaError, HEADER_PRIORIDADE, obter_controlador
+from src.deadline import DeadlineExcedidoError, HEADER_TIMEOUT, prazo_da_rota
+from src.service_catalog import prazo_do_servico
+from src.idempotency import HEADER_IDEMPOTENCIA, HEADER_REQUEST_TAG, headers_repeticao
+from src.tenant_scope import HEADER_ACCESS_TOKEN, HEADER_CERTIFICADO, CredencialAusenteError
+from src.structured_logging import HEADER_CORRELACAO, configurar_logging, definir_correlation_id
+from src.dados_codec import carregar_json
+from src.documento_binario import DocumentoBinario
+
+# Configurar logging (JSON assíncrono, fora do caminho da requisição)
+configurar_logging()
 logger = logging.getLogger(__name__)
 
 # Criar app FastAPI
@@ -29,6 +55,13 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Controle de admissão por prioridade
+controlador = obter_controlador()
+
+# Afinidade de tenant entre instâncias (None se não configurada)
+roteador = obter_roteador()
+ROTAS_AFINIDADE = ("/autenticar_serpro", "/autenticar_procurador", "/proxy_serpro")
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +72,56 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def correlacionar_requisicao(request: Request, call_next):
+    """Propaga o correlation_id (header ou gerado) para os logs e a resposta."""
+    correlation_id = definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
+    response = await call_next(request)
+    response.headers[HEADER_CORRELACAO] = correlation_id
+    return response
+
+
+@app.middleware("http")
+async def rotear_por_afinidade(request: Request, call_next):
+    """Encaminha a requisição para a instância dona do tenant, se não for esta."""
+    if roteador is None or request.method != "POST" or request.url.path not in ROTAS_AFINIDADE:
+        return await call_next(request)
+
+    corpo = await request.body()
+    try:
+        data = carregar_json(corpo)
+    except ValueError:
+        return await call_next(request)
+
+    destino = roteador.destino(data, dict(request.headers))
+    if destino is None:
+        return await call_next(request)
+
+    rota = request.url.path.strip("/")
+    try:
+        deadline = prazo_da_rota(
+            rota,
+            request.headers.get(HEADER_TIMEOUT),
+            prazo_do_servico(data) if rota == "proxy_serpro" else None
+        )
+    except ValueError:
+        return await call_next(request)
+
+    try:
+        resposta = await anyio.to_thread.run_sync(
+            roteador.encaminhar, destino, request.url.path, corpo, dict(request.headers), deadline
+        )
+    except DeadlineExcedidoError as e:
+        return JSONResponse(status_code=504, content={"detail": str(e)})
+    except EncaminhamentoError as e:
+        return JSONResponse(status_code=502, content={"detail": str(e)})
+    if resposta is None:
+        # Conexão com a dona não estabelecida: nada foi executado lá, processa aqui
+        return await call_next(request)
+    status, headers, conteudo = resposta
+    return Response(content=conteudo, status_code=status, headers=headers)
+
+
 # ===== MODELS =====
 
 class AutenticarSerproRequest(BaseModel):
@@ -49,6 +132,8 @@ class AutenticarSerproRequest(BaseModel):
     ambiente: str = "trial"
     certificado_base64: Optional[str] = None
     certificado_senha: Optional[str] = None
+    certificado_handle: Optional[str] = None
+    forcar_renovacao: bool = False
 
 
 class AutenticarProcuradorRequest(BaseModel):
@@ -64,6 +149,9 @@ class AutenticarProcuradorRequest(BaseModel):
     certificado_senha: Optional[str] = None
     certificado_procurador_base64: Optional[str] = None
     certificado_procurador_senha: Optional[str] = None
+    certificado_handle: Optional[str] = None
+    certificado_procurador_handle: Optional[str] = None
+    forcar_renovacao: bool = False
 
 
 class ProxySerproRequest(BaseModel):
@@ -75,10 +163,60 @@ class ProxySerproRequest(BaseModel):
     ambiente: str = "trial"
     certificado_base64: Optional[str] = None
     certificado_senha: Optional[str] = None
+    certificado_handle: Optional[str] = None
+    formato_resposta: str = "json"
+    campo_documento: Optional[str] = None
+    nome_arquivo: Optional[str] = None
+    decodificar_dados: bool = False
+    cache_ttl: Optional[int] = None
+
+
+class RegistrarCertificadoRequest(BaseModel):
+    certificado_base64: str
+    certificado_senha: str
+    ttl_segundos: Optional[int] = None
+
+
+class RemoverCertificadoRequest(BaseModel):
+    certificado_handle: str
+
+
+class CriarJobRequest(BaseModel):
+    template: Dict[str, Any]
+    contribuintes: List[str]
+    concorrencia: Optional[int] = None
+    taxa_por_segundo: Optional[float] = None
+    tentativas: Optional[int] = None
+
+
+class RenovarTokensJobRequest(BaseModel):
+    access_token: str
+    jwt_token: str
+    expires_in: Optional[int] = None
+    procurador_token: Optional[str] = None
 
 
 # ===== ENDPOINTS =====
 
+@app.on_event("startup")
+async def configurar_threadpool():
+    """Threadpool comporta todas as vagas de admissão (executando + fila)."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, controlador.capacidade_total)
+
+
+@app.on_event("startup")
+def retomar_jobs():
+    """Retoma os jobs de fan-out sem dono vivo (queda ou novo deploy)."""
+    retomar_jobs_pendentes()
+
+
+@app.on_event("startup")
+async def iniciar_preaquecimento():
+    """Abre conexões mTLS dos certificados registrados (SERPRO_PREAQUECER_CONEXOES)."""
+    obter_preaquecedor()
+
+
 @app.get("/")
 async def root():
     """Health check."""
@@ -90,68 +228,386 @@ async def root():
         "endpoints": [
             "POST /autenticar_serpro",
             "POST /autenticar_procurador",
-            "POST /proxy_serpro"
-        ]
+            "POST /proxy_serpro",
+            "POST /registrar_certificado",
+            "POST /remover_certificado",
+            "GET /uso",
+            "POST /jobs",
+            "GET /jobs/{job_id}",
+            "GET /jobs/{job_id}/resultados",
+            "GET /jobs/{job_id}/exportar",
+            "POST /jobs/{job_id}/cancelar",
+            "POST /jobs/{job_id}/tokens",
+            "GET /afinidade"
+        ],
+        "admissao": controlador.estatisticas(),
+        "transporte": obter_transporte().estatisticas()
     }
 
 
 @app.post("/autenticar_serpro")
-async def autenticar_serpro(request: AutenticarSerproRequest):
+def autenticar_serpro(
+    request: AutenticarSerproRequest,
+    x_prioridade: Optional[str] = Header(None, alias=HEADER_PRIORIDADE),
+    x_request_timeout: Optional[str] = Header(None, alias=HEADER_TIMEOUT)
+):
     """Endpoint FastAPI: Autenticar SERPRO."""
     try:
-        logger.info(f"[autenticar_serpro] Ambiente: {request.ambiente}")
+        logger.info("[autenticar_serpro] Ambiente: %s", request.ambiente)
 
         # Chamar lógica centralizada (sem Secret Manager)
-        result = process_autenticar_serpro(request.model_dump(), get_secret_fn=None)
+        data = request.model_dump()
+        deadline = prazo_da_rota("autenticar_serpro", x_request_timeout)
+        prioridade = controlador.classificar("autenticar_serpro", data, x_prioridade)
+        with controlador.admitir(prioridade, deadline):
+            result = process_autenticar_serpro(data, get_secret_fn=None, deadline=deadline)
 
-        logger.info(f"[autenticar_serpro] OK para {request.contratante_numero}")
+        logger.info("[autenticar_serpro] OK para %s", request.contratante_numero)
         return result
+    except SobrecargaError as e:
+        logger.warning("[autenticar_serpro] %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExcedidoError as e:
+        logger.warning("[autenticar_serpro] %s", e, extra={"etapas": deadline.etapas})
+        raise HTTPException(status_code=504, detail=str(e))
+    except CertificadoNaoRegistradoError as e:
+        logger.warning("[autenticar_serpro] %s", e)
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
-        logger.error(f"[autenticar_serpro] Erro de validação: {e}")
+        logger.error("[autenticar_serpro] Erro de validação: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"[autenticar_serpro] Erro: {e}", exc_info=True)
+        logger.error("[autenticar_serpro] Erro: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/autenticar_procurador")
-async def autenticar_procurador(request: AutenticarProcuradorRequest):
+def autenticar_procurador(
+    request: AutenticarProcuradorRequest,
+    x_prioridade: Optional[str] = Header(None, alias=HEADER_PRIORIDADE),
+    x_request_timeout: Optional[str] = Header(None, alias=HEADER_TIMEOUT)
+):
     """Endpoint FastAPI: Autenticar Procurador."""
     try:
-        logger.info(f"[autenticar_procurador] Ambiente: {request.ambiente}")
+        logger.info("[autenticar_procurador] Ambiente: %s", request.ambiente)
 
         # Chamar lógica centralizada (sem Secret Manager)
-        result = process_autenticar_procurador(request.model_dump(), get_secret_fn=None)
+        data = request.model_dump()
+        deadline = prazo_da_rota("autenticar_procurador", x_request_timeout)
+        prioridade = controlador.classificar("autenticar_procurador", data, x_prioridade)
+        with controlador.admitir(prioridade, deadline):
+            result = process_autenticar_procurador(data, get_secret_fn=None, deadline=deadline)
 
-        logger.info(f"[autenticar_procurador] OK para {request.autor_pedido_dados_numero}")
+        logger.info("[autenticar_procurador] OK para %s", request.autor_pedido_dados_numero)
         return result
+    except SobrecargaError as e:
+        logger.warning("[autenticar_procurador] %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExcedidoError as e:
+        logger.warning("[autenticar_procurador] %s", e, extra={"etapas": deadline.etapas})
+        raise HTTPException(status_code=504, detail=str(e))
+    except CertificadoNaoRegistradoError as e:
+        logger.warning("[autenticar_procurador] %s", e)
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
-        logger.error(f"[autenticar_procurador] Erro de validação: {e}")
+        logger.error("[autenticar_procurador] Erro de validação: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"[autenticar_procurador] Erro: {e}", exc_info=True)
+        logger.error("[autenticar_procurador] Erro: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/proxy_serpro")
-async def proxy_serpro(request: ProxySerproRequest):
+def proxy_serpro(
+    request: ProxySerproRequest,
+    response: Response,
+    x_prioridade: Optional[str] = Header(None, alias=HEADER_PRIORIDADE),
+    x_request_timeout: Optional[str] = Header(None, alias=HEADER_TIMEOUT),
+    idempotency_key: Optional[str] = Header(None, alias=HEADER_IDEMPOTENCIA),
+    x_request_tag: Optional[str] = Header(None, alias=HEADER_REQUEST_TAG)
+):
     """Endpoint FastAPI: Proxy SERPRO."""
     try:
-        logger.info(f"[proxy_serpro] Endpoint: {request.endpoint}")
+        logger.info("[proxy_serpro] Endpoint: %s", request.endpoint)
 
         # Chamar lógica centralizada (sem Secret Manager)
-        result = process_proxy_serpro(request.model_dump(), get_secret_fn=None)
+        data = request.model_dump()
+        data["idempotency_key"] = idempotency_key
+        data["request_tag"] = x_request_tag
+        deadline = prazo_da_rota("proxy_serpro", x_request_timeout, prazo_do_servico(data))
+        prioridade = controlador.classificar("proxy_serpro", data, x_prioridade)
+        with controlador.admitir(prioridade, deadline):
+            result = process_proxy_serpro(data, get_secret_fn=None, deadline=deadline)
+
+        logger.info("[proxy_serpro] OK para %s", request.endpoint)
+
+        # Documento extraído: streaming binário (pdf ou multipart)
+        # Resultado guardado por idempotência leva Idempotent-Replayed
+        if isinstance(result, DocumentoBinario):
+            return StreamingResponse(
+                result.iter_conteudo(),
+                media_type=result.media_type,
+                headers={**result.headers, **headers_repeticao()}
+            )
+        response.headers.update(headers_repeticao())
+        return result
+    except SobrecargaError as e:
+        logger.warning("[proxy_serpro] %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExcedidoError as e:
+        logger.warning("[proxy_serpro] %s", e, extra={"etapas": deadline.etapas})
+        raise HTTPException(status_code=504, detail=str(e))
+    except CertificadoNaoRegistradoError as e:
+        logger.warning("[proxy_serpro] %s", e)
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        logger.error("[proxy_serpro] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[proxy_serpro] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/registrar_certificado")
+async def registrar_certificado(request: RegistrarCertificadoRequest):
+    """Endpoint FastAPI: Registrar certificado e obter handle."""
+    try:
+        result = process_registrar_certificado(request.model_dump(), get_secret_fn=None)
+
+        logger.info("[registrar_certificado] OK para %s", result['fingerprint'])
+        return result
+    except ValueError as e:
+        logger.error("[registrar_certificado] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[registrar_certificado] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/remover_certificado")
+async def remover_certificado(request: RemoverCertificadoRequest):
+    """Endpoint FastAPI: Remover certificado registrado."""
+    try:
+        return process_remover_certificado(request.model_dump(), get_secret_fn=None)
+    except ValueError as e:
+        logger.error("[remover_certificado] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[remover_certificado] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        logger.info(f"[proxy_serpro] OK para {request.endpoint}")
+
+@app.get("/uso")
+def consultar_uso(
+    tenant: Optional[str] = None,
+    servico: Optional[str] = None,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    ordenar: str = "chamadas",
+    limite: int = 50,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Uso por contratante e serviço (da credencial enviada nos headers)."""
+    try:
+        return process_consultar_uso({
+            "certificado_handle": x_certificado_handle,
+            "access_token": x_access_token,
+            "tenant": tenant,
+            "servico": servico,
+            "desde": desde,
+            "ate": ate,
+            "ordenar": ordenar,
+            "limite": limite
+        })
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except CertificadoNaoRegistradoError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        logger.error("[uso] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[uso] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs")
+def criar_job(request: CriarJobRequest):
+    """Endpoint FastAPI: Criar job de fan-out (um serviço, vários contribuintes)."""
+    try:
+        result = process_criar_job(request.model_dump())
+
+        logger.info("[jobs] Job %s criado com %s itens", result["job_id"], result["total"])
         return result
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except CertificadoNaoRegistradoError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
-        logger.error(f"[proxy_serpro] Erro de validação: {e}")
+        logger.error("[jobs] Erro de validação: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"[proxy_serpro] Erro: {e}", exc_info=True)
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _credencial(x_certificado_handle: Optional[str], x_access_token: Optional[str]) -> Dict[str, Any]:
+    """Credencial dona do job (headers X-Certificado-Handle / X-Access-Token)."""
+    return {"certificado_handle": x_certificado_handle, "access_token": x_access_token}
+
+
+@app.get("/jobs/{job_id}")
+def consultar_job(
+    job_id: str,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Progresso de um job."""
+    try:
+        return process_consultar_job({"job_id": job_id, **_credencial(x_certificado_handle, x_access_token)})
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (JobNaoEncontradoError, CertificadoNaoRegistradoError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}/resultados")
+def resultados_job(
+    job_id: str,
+    pagina: int = 1,
+    tamanho: int = 100,
+    estado: Optional[str] = None,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Resultados paginados de um job."""
+    try:
+        return process_resultados_job({
+            "job_id": job_id,
+            "pagina": pagina,
+            "tamanho": tamanho,
+            "estado": estado,
+            **_credencial(x_certificado_handle, x_access_token)
+        })
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (JobNaoEncontradoError, CertificadoNaoRegistradoError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        logger.error("[jobs] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs/{job_id}/exportar")
+def exportar_job(
+    job_id: str,
+    formato: Optional[str] = None,
+    estado: Optional[str] = None,
+    incluir_dados: bool = False,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Resultados do job em Parquet, Arrow IPC ou CSV."""
+    try:
+        result = process_exportar_job({
+            "job_id": job_id,
+            "formato": formato,
+            "estado": estado,
+            "incluir_dados": incluir_dados,
+            **_credencial(x_certificado_handle, x_access_token)
+        })
+        logger.info("[jobs] Job %s exportado: %s linhas em %s", job_id, result.linhas, result.formato)
+        return StreamingResponse(
+            result.iter_conteudo(),
+            media_type=result.media_type,
+            headers=result.headers
+        )
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (JobNaoEncontradoError, CertificadoNaoRegistradoError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        logger.error("[jobs] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/cancelar")
+def cancelar_job(
+    job_id: str,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Cancelar job em execução."""
+    try:
+        return process_cancelar_job({"job_id": job_id, **_credencial(x_certificado_handle, x_access_token)})
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (JobNaoEncontradoError, CertificadoNaoRegistradoError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/tokens")
+def renovar_tokens_job(
+    job_id: str,
+    request: RenovarTokensJobRequest,
+    x_certificado_handle: Optional[str] = Header(None, alias=HEADER_CERTIFICADO),
+    x_access_token: Optional[str] = Header(None, alias=HEADER_ACCESS_TOKEN)
+):
+    """Endpoint FastAPI: Tokens novos para um job em 'aguardando_tokens'."""
+    try:
+        return process_renovar_tokens_job({
+            "job_id": job_id,
+            "novo_access_token": request.access_token,
+            "novo_jwt_token": request.jwt_token,
+            "expires_in": request.expires_in,
+            "procurador_token": request.procurador_token,
+            **_credencial(x_certificado_handle, x_access_token)
+        })
+    except CredencialAusenteError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (JobNaoEncontradoError, CertificadoNaoRegistradoError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        logger.error("[jobs] Erro de validação: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[jobs] Erro: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/afinidade")
+def consultar_afinidade():
+    """Endpoint FastAPI: Membros e contadores da afinidade de tenant."""
+    if roteador is None:
+        return {"ativo": False}
+    return {"ativo": True, **roteador.estatisticas()}
+
+
 # ===== EXECUTAR SERVIDOR =====
 
 if __name__ == "__main__":
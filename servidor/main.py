@@ -5,34 +5,87 @@ Este arquivo APENAS define os endpoints do Firebase.
 TODA a lógica de negócio está em business_logic.py
 """
 
+import os
 import json
+import logging
 from typing import Any, Dict, Optional
 from firebase_functions import https_fn, options
 from firebase_admin import initialize_app, auth
-from google.cloud import secretmanager
+from google.api_core import exceptions as google_exceptions
 
 # Importar lógica de negócio centralizada
 from src.business_logic import (
     process_autenticar_serpro,
     process_autenticar_procurador,
-    process_proxy_serpro
+    process_proxy_serpro,
+    process_registrar_certificado,
+    process_remover_certificado,
+    process_consultar_uso
 )
+from src.certificate_registry import CertificadoNaoRegistradoError
+from src.admission import (
+    SobrecargaError,
+    HEADER_PRIORIDADE,
+    concorrencia_da_instancia,
+    obter_controlador
+)
+from src.deadline import Deadline, DeadlineExcedidoError, HEADER_TIMEOUT, prazo_da_rota
+from src.service_catalog import prazo_do_servico
+from src.idempotency import HEADER_IDEMPOTENCIA, HEADER_REQUEST_TAG, headers_repeticao
+from src.tenant_scope import CredencialAusenteError, credencial_dos_headers
+from src.structured_logging import (
+    HEADER_CORRELACAO,
+    configurar_logging,
+    definir_correlation_id,
+    obter_correlation_id
+)
+from src.documento_binario import DocumentoBinario
+from src.dados_codec import serializar_json
+from src.secret_manager import acessar_segredo
+from src.prewarm import obter_preaquecedor
 
 # Inicializar Firebase Admin
 initialize_app()
 
+# Logging JSON assíncrono (stdout é coletado pelo Cloud Logging)
+configurar_logging()
+logger = logging.getLogger(__name__)
+
+# Concorrência por instância (SERPRO_CONCORRENCIA, lida do .env no deploy).
+# Acima de 1 a instância precisa de CPU inteira; clientes, caches e pools
+# compartilhados do processo são thread-safe.
+CONCORRENCIA = concorrencia_da_instancia()
+if CONCORRENCIA > 1:
+    options.set_global_options(
+        concurrency=CONCORRENCIA,
+        cpu=int(os.environ.get("SERPRO_CPU", 1)),
+        memory=options.MemoryOption(int(os.environ.get("SERPRO_MEMORIA_MB", 512)))
+    )
+
+# Controle de admissão por prioridade (classes proporcionais à concorrência)
+controlador = obter_controlador()
+
+# Conexões mTLS abertas na partida da instância (SERPRO_PREAQUECER_CONEXOES)
+obter_preaquecedor()
+
 # Configurar CORS
 cors_options = options.CorsOptions(
     cors_origins="*",
-    cors_methods=["POST", "OPTIONS"]
+    cors_methods=["GET", "POST", "OPTIONS"]
 )
 
 
-def _get_secret(secret_name: str) -> str:
+def _get_secret(secret_name: str, timeout: Optional[float] = None) -> str:
     """Busca valor do Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    response = client.access_secret_version(request={"name": secret_name})
-    return response.payload.data.decode("UTF-8").strip()
+    try:
+        return acessar_segredo(secret_name, timeout=timeout)
+    except google_exceptions.DeadlineExceeded as e:
+        raise DeadlineExcedidoError("secret_manager") from e
+
+
+def _get_secret_no_prazo(deadline: Deadline):
+    """get_secret_fn com timeout igual ao prazo da etapa (sem a reserva da etapa final)."""
+    return lambda secret_name: _get_secret(secret_name, timeout=deadline.disponivel("secret_manager"))
 
 
 def _verify_firebase_token(request: https_fn.Request) -> Optional[Dict]:
@@ -45,74 +98,213 @@ def _verify_firebase_token(request: https_fn.Request) -> Optional[Dict]:
     try:
         return auth.verify_id_token(token)
     except Exception as e:
-        print(f"[INFO] Token verification failed (non-blocking): {e}")
+        logger.info("Token verification failed (non-blocking): %s", e)
         return None
 
 
-def _error_response(message: str, status: int = 400) -> https_fn.Response:
+def _headers_correlacao() -> Dict[str, str]:
+    """Header com o correlation_id da requisição corrente."""
+    correlation_id = obter_correlation_id()
+    return {HEADER_CORRELACAO: correlation_id} if correlation_id else {}
+
+
+def _error_response(
+    message: str,
+    status: int = 400,
+    headers: Optional[Dict[str, str]] = None
+) -> https_fn.Response:
     """Cria resposta de erro."""
     return https_fn.Response(
         json.dumps({"error": message, "status": status}),
         status=status,
-        headers={"Content-Type": "application/json"}
+        headers={"Content-Type": "application/json", **_headers_correlacao(), **(headers or {})}
     )
 
 
-def _success_response(data: Dict[str, Any]) -> https_fn.Response:
+def _success_response(
+    data: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None
+) -> https_fn.Response:
     """Cria resposta de sucesso."""
     return https_fn.Response(
-        json.dumps(data),
+        serializar_json(data),
         status=200,
-        headers={"Content-Type": "application/json"}
+        headers={"Content-Type": "application/json; charset=utf-8", **_headers_correlacao(), **(headers or {})}
+    )
+
+
+def _document_response(
+    documento: DocumentoBinario,
+    headers: Optional[Dict[str, str]] = None
+) -> https_fn.Response:
+    """Cria resposta binária em streaming (pdf ou multipart)."""
+    return https_fn.Response(
+        documento.iter_conteudo(),
+        status=200,
+        headers={**documento.headers, **_headers_correlacao(), **(headers or {})},
+        direct_passthrough=True
     )
 
 
 @https_fn.on_request(cors=cors_options)
 def autenticar_serpro(request: https_fn.Request) -> https_fn.Response:
     """Endpoint Firebase: Autenticar SERPRO."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
     try:
         data = request.get_json()
         _verify_firebase_token(request)  # Opcional
 
-        # Chamar lógica centralizada
-        result = process_autenticar_serpro(data, get_secret_fn=_get_secret)
+        # Chamar lógica centralizada (prazo conta desde a chegada, inclusive a fila)
+        deadline = prazo_da_rota("autenticar_serpro", request.headers.get(HEADER_TIMEOUT))
+        prioridade = controlador.classificar(
+            "autenticar_serpro", data, request.headers.get(HEADER_PRIORIDADE)
+        )
+        with controlador.admitir(prioridade, deadline):
+            result = process_autenticar_serpro(
+                data, get_secret_fn=_get_secret_no_prazo(deadline), deadline=deadline
+            )
 
         return _success_response(result)
+    except SobrecargaError as e:
+        return _error_response(str(e), 503, {"Retry-After": str(e.retry_after)})
+    except DeadlineExcedidoError as e:
+        logger.warning("[autenticar_serpro] %s", e)
+        return _error_response(str(e), 504)
+    except CertificadoNaoRegistradoError as e:
+        return _error_response(str(e), 404)
     except ValueError as e:
         return _error_response(str(e), 400)
     except Exception as e:
+        logger.error("[autenticar_serpro] Erro: %s", e, exc_info=True)
         return _error_response(str(e), 500)
 
 
 @https_fn.on_request(cors=cors_options)
 def autenticar_procurador(request: https_fn.Request) -> https_fn.Response:
     """Endpoint Firebase: Autenticar Procurador."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
     try:
         data = request.get_json()
         _verify_firebase_token(request)  # Opcional
 
-        # Chamar lógica centralizada
-        result = process_autenticar_procurador(data, get_secret_fn=_get_secret)
+        # Chamar lógica centralizada (prazo conta desde a chegada, inclusive a fila)
+        deadline = prazo_da_rota("autenticar_procurador", request.headers.get(HEADER_TIMEOUT))
+        prioridade = controlador.classificar(
+            "autenticar_procurador", data, request.headers.get(HEADER_PRIORIDADE)
+        )
+        with controlador.admitir(prioridade, deadline):
+            result = process_autenticar_procurador(
+                data, get_secret_fn=_get_secret_no_prazo(deadline), deadline=deadline
+            )
 
         return _success_response(result)
+    except SobrecargaError as e:
+        return _error_response(str(e), 503, {"Retry-After": str(e.retry_after)})
+    except DeadlineExcedidoError as e:
+        logger.warning("[autenticar_procurador] %s", e)
+        return _error_response(str(e), 504)
+    except CertificadoNaoRegistradoError as e:
+        return _error_response(str(e), 404)
     except ValueError as e:
         return _error_response(str(e), 400)
     except Exception as e:
+        logger.error("[autenticar_procurador] Erro: %s", e, exc_info=True)
         return _error_response(str(e), 500)
 
 
 @https_fn.on_request(cors=cors_options)
 def proxy_serpro(request: https_fn.Request) -> https_fn.Response:
     """Endpoint Firebase: Proxy SERPRO."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
+    try:
+        data = request.get_json()
+        _verify_firebase_token(request)  # Opcional
+
+        # Chamar lógica centralizada (prazo conta desde a chegada, inclusive a fila)
+        data["idempotency_key"] = request.headers.get(HEADER_IDEMPOTENCIA)
+        data["request_tag"] = request.headers.get(HEADER_REQUEST_TAG)
+        deadline = prazo_da_rota("proxy_serpro", request.headers.get(HEADER_TIMEOUT), prazo_do_servico(data))
+        prioridade = controlador.classificar(
+            "proxy_serpro", data, request.headers.get(HEADER_PRIORIDADE)
+        )
+        with controlador.admitir(prioridade, deadline):
+            result = process_proxy_serpro(
+                data, get_secret_fn=_get_secret_no_prazo(deadline), deadline=deadline
+            )
+
+        # Resultado guardado por idempotência leva Idempotent-Replayed
+        if isinstance(result, DocumentoBinario):
+            return _document_response(result, headers_repeticao())
+        return _success_response(result, headers_repeticao())
+    except SobrecargaError as e:
+        return _error_response(str(e), 503, {"Retry-After": str(e.retry_after)})
+    except DeadlineExcedidoError as e:
+        logger.warning("[proxy_serpro] %s", e)
+        return _error_response(str(e), 504)
+    except CertificadoNaoRegistradoError as e:
+        return _error_response(str(e), 404)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+    except Exception as e:
+        logger.error("[proxy_serpro] Erro: %s", e, exc_info=True)
+        return _error_response(str(e), 500)
+
+
+@https_fn.on_request(cors=cors_options)
+def registrar_certificado(request: https_fn.Request) -> https_fn.Response:
+    """Endpoint Firebase: Registrar certificado e obter handle."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
     try:
         data = request.get_json()
         _verify_firebase_token(request)  # Opcional
 
         # Chamar lógica centralizada
-        result = process_proxy_serpro(data, get_secret_fn=_get_secret)
+        result = process_registrar_certificado(data, get_secret_fn=_get_secret)
+
+        return _success_response(result)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+    except Exception as e:
+        logger.error("[registrar_certificado] Erro: %s", e, exc_info=True)
+        return _error_response(str(e), 500)
+
+
+@https_fn.on_request(cors=cors_options)
+def remover_certificado(request: https_fn.Request) -> https_fn.Response:
+    """Endpoint Firebase: Remover certificado registrado."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
+    try:
+        data = request.get_json()
+        _verify_firebase_token(request)  # Opcional
+
+        # Chamar lógica centralizada
+        result = process_remover_certificado(data, get_secret_fn=_get_secret)
+
+        return _success_response(result)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+    except Exception as e:
+        logger.error("[remover_certificado] Erro: %s", e, exc_info=True)
+        return _error_response(str(e), 500)
+
+
+@https_fn.on_request(cors=cors_options)
+def uso(request: https_fn.Request) -> https_fn.Response:
+    """Endpoint Firebase: Uso por contratante e serviço (query string; credencial nos headers)."""
+    definir_correlation_id(request.headers.get(HEADER_CORRELACAO))
+    try:
+        _verify_firebase_token(request)  # Opcional
+
+        # Chamar lógica centralizada
+        result = process_consultar_uso({**request.args, **credencial_dos_headers(request.headers)})
 
         return _success_response(result)
+    except CredencialAusenteError as e:
+        return _error_response(str(e), 401)
+    except CertificadoNaoRegistradoError as e:
+        return _error_response(str(e), 404)
     except ValueError as e:
         return _error_response(str(e), 400)
     except Exception as e:
+        logger.error("[uso] Erro: %s", e, exc_info=True)
         return _error_response(str(e), 500)
@@ -9,16 +9,38 @@ Este pacote contém toda a lógica de negócio compartilhada entre:
 from src.business_logic import (
     process_autenticar_serpro,
     process_autenticar_procurador,
-    process_proxy_serpro
+    process_proxy_serpro,
+    process_registrar_certificado,
+    process_remover_certificado,
+    process_consultar_uso,
+    process_criar_job,
+    process_consultar_job,
+    process_resultados_job,
+    process_cancelar_job,
+    process_exportar_job
 )
 from src.mtls_client import MtlsClient
+from src.certificate_registry import CertificateIdentity, CertificateRegistry
 from src.xml_signer import criar_termo_xml, assinar_xml
+from src.documento_binario import DocumentoBinario, extrair_documento
 
 __all__ = [
     "process_autenticar_serpro",
     "process_autenticar_procurador",
     "process_proxy_serpro",
+    "process_registrar_certificado",
+    "process_remover_certificado",
+    "process_consultar_uso",
+    "process_criar_job",
+    "process_consultar_job",
+    "process_resultados_job",
+    "process_cancelar_job",
+    "process_exportar_job",
     "MtlsClient",
+    "CertificateIdentity",
+    "CertificateRegistry",
     "criar_termo_xml",
     "assinar_xml",
+    "DocumentoBinario",
+    "extrair_documento",
 ]
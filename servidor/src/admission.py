@@ -0,0 +1,268 @@
+"""
+Controle de admissão com classes de prioridade.
+
+Cada classe tem concorrência máxima, fila limitada e espera máxima na
+fila. Quando a fila da classe está cheia (ou a espera estoura), a
+requisição é recusada imediatamente com SobrecargaError, que os wrappers
+convertem em HTTP 503 + Retry-After. Como as classes não compartilham
+vagas, rajadas de consultas em lote não atrasam /Declarar, /Emitir ou
+as autenticações.
+
+Configuração por ambiente (concorrencia,fila,espera_segundos):
+    SERPRO_ADMISSAO_CRITICA=16,64,10
+    SERPRO_ADMISSAO_NORMAL=8,32,5
+    SERPRO_ADMISSAO_LOTE=4,8,2
+    SERPRO_ADMISSAO_ATIVA=0  (desliga o controle)
+
+Com SERPRO_CONCORRENCIA (requisições simultâneas por instância Firebase)
+acima dos padrões, as classes não configuradas explicitamente crescem até
+ela (lote mantém sua fração), para que a instância não enfileire nem
+recuse requisições que a plataforma já lhe entregou.
+"""
+
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator, Mapping
+
+from src.deadline import Deadline, DeadlineExcedidoError
+from src.service_catalog import servico_da_requisicao
+
+PRIORIDADE_CRITICA = "critica"
+PRIORIDADE_NORMAL = "normal"
+PRIORIDADE_LOTE = "lote"
+PRIORIDADES = (PRIORIDADE_CRITICA, PRIORIDADE_NORMAL, PRIORIDADE_LOTE)
+
+# Header opcional para o cliente escolher a classe
+HEADER_PRIORIDADE = "X-Prioridade"
+
+# (concorrência, fila, espera máxima em segundos)
+CONFIGURACAO_PADRAO = {
+    PRIORIDADE_CRITICA: (16, 64, 10.0),
+    PRIORIDADE_NORMAL: (8, 32, 5.0),
+    PRIORIDADE_LOTE: (4, 8, 2.0),
+}
+
+# Endpoints SERPRO que alteram estado ou emitem documentos
+ENDPOINTS_CRITICOS = ("/Declarar", "/Emitir", "/Apoiar")
+
+# Rotas do servidor sempre críticas
+ROTAS_CRITICAS = ("autenticar_serpro", "autenticar_procurador")
+
+
+class SobrecargaError(Exception):
+    """Requisição recusada por sobrecarga da classe de prioridade."""
+
+    def __init__(self, classe: str, retry_after: int):
+        self.classe = classe
+        self.retry_after = retry_after
+        super().__init__(
+            f"Servidor sobrecarregado (prioridade '{classe}'). "
+            f"Tente novamente em {retry_after}s."
+        )
+
+
+class _Classe:
+    """Estado de uma classe de prioridade."""
+
+    def __init__(self, nome: str, concorrencia: int, fila: int, espera: float):
+        self.nome = nome
+        self.concorrencia = concorrencia
+        self.fila = fila
+        self.espera = espera
+        self.ativos = 0
+        self.aguardando = 0
+        self.admitidas = 0
+        self.recusadas = 0
+        # Média móvel exponencial da duração (estimativa do Retry-After)
+        self.duracao_media = 1.0
+        self.condicao = threading.Condition()
+
+    def retry_after(self) -> int:
+        """Estimativa de quando haverá vaga (1 a 30 segundos)."""
+        estimativa = (self.aguardando + 1) * self.duracao_media / max(1, self.concorrencia)
+        return max(1, min(30, math.ceil(estimativa)))
+
+
+class AdmissionController:
+    """Controla quantas requisições de cada prioridade executam ao mesmo tempo."""
+
+    def __init__(self, configuracao: Optional[Dict[str, tuple]] = None, ativo: bool = True):
+        """
+        Args:
+            configuracao: {prioridade: (concorrencia, fila, espera_segundos)}
+            ativo: False admite tudo sem limites
+        """
+        configuracao = configuracao or CONFIGURACAO_PADRAO
+        self.ativo = ativo
+        self._classes = {
+            nome: _Classe(nome, *configuracao.get(nome, CONFIGURACAO_PADRAO[nome]))
+            for nome in PRIORIDADES
+        }
+
+    @property
+    def capacidade_execucao(self) -> int:
+        """Máximo de requisições executando ao mesmo tempo (soma das classes)."""
+        return sum(classe.concorrencia for classe in self._classes.values())
+
+    @property
+    def capacidade_total(self) -> int:
+        """Máximo de requisições simultâneas (executando + na fila)."""
+        return sum(classe.concorrencia + classe.fila for classe in self._classes.values())
+
+    def classificar(
+        self,
+        rota: str,
+        data: Optional[Mapping[str, Any]] = None,
+        prioridade: Optional[str] = None
+    ) -> str:
+        """
+        Define a prioridade da requisição.
+
+        Args:
+            rota: Nome da rota do servidor (ex: 'proxy_serpro')
+            data: Corpo da requisição (endpoint/idServico para o proxy)
+            prioridade: Valor do header X-Prioridade, se enviado
+        """
+        if prioridade and prioridade.lower() in PRIORIDADES:
+            return prioridade.lower()
+
+        if rota in ROTAS_CRITICAS:
+            return PRIORIDADE_CRITICA
+
+        data = data or {}
+        servico = servico_da_requisicao(data)
+        if servico is not None:
+            return servico.prioridade
+
+        if data.get("endpoint") in ENDPOINTS_CRITICOS:
+            return PRIORIDADE_CRITICA
+
+        pedido = (data.get("body") or {}).get("pedidoDados") or {}
+        if "LOTE" in str(pedido.get("idServico", "")).upper():
+            return PRIORIDADE_LOTE
+
+        return PRIORIDADE_NORMAL
+
+    @contextmanager
+    def admitir(self, prioridade: str, deadline: Optional[Deadline] = None) -> Iterator[None]:
+        """
+        Reserva uma vaga na classe durante a execução do bloco.
+
+        Args:
+            prioridade: Classe de prioridade
+            deadline: Prazo da requisição (limita a espera na fila)
+
+        Raises:
+            SobrecargaError: Se a fila estiver cheia ou a espera estourar
+            DeadlineExcedidoError: Se o prazo da requisição acabar na fila
+        """
+        if not self.ativo:
+            yield
+            return
+
+        classe = self._classes[prioridade]
+        with classe.condicao:
+            if classe.ativos >= classe.concorrencia:
+                # Fila cheia: recusa imediata (não acumula latência)
+                if classe.aguardando >= classe.fila:
+                    classe.recusadas += 1
+                    raise SobrecargaError(classe.nome, classe.retry_after())
+
+                espera = classe.espera
+                limitada_pelo_prazo = deadline is not None and deadline.disponivel("fila") < espera
+                if limitada_pelo_prazo:
+                    espera = max(0.0, deadline.disponivel("fila"))
+
+                classe.aguardando += 1
+                try:
+                    admitida = classe.condicao.wait_for(
+                        lambda: classe.ativos < classe.concorrencia,
+                        timeout=espera
+                    )
+                finally:
+                    classe.aguardando -= 1
+                if not admitida:
+                    classe.recusadas += 1
+                    if limitada_pelo_prazo:
+                        raise DeadlineExcedidoError("fila")
+                    raise SobrecargaError(classe.nome, classe.retry_after())
+
+            classe.ativos += 1
+            classe.admitidas += 1
+
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            duracao = time.monotonic() - inicio
+            with classe.condicao:
+                classe.ativos -= 1
+                classe.duracao_media = 0.8 * classe.duracao_media + 0.2 * duracao
+                classe.condicao.notify()
+
+    def estatisticas(self) -> Dict[str, Dict[str, Any]]:
+        """Ocupação e contadores por prioridade."""
+        resultado = {}
+        for nome, classe in self._classes.items():
+            with classe.condicao:
+                resultado[nome] = {
+                    "ativos": classe.ativos,
+                    "aguardando": classe.aguardando,
+                    "concorrencia": classe.concorrencia,
+                    "fila": classe.fila,
+                    "admitidas": classe.admitidas,
+                    "recusadas": classe.recusadas,
+                    "duracao_media_s": round(classe.duracao_media, 3),
+                }
+        return resultado
+
+
+def concorrencia_da_instancia() -> int:
+    """Requisições simultâneas por instância (SERPRO_CONCORRENCIA, padrão 1)."""
+    return max(1, int(os.environ.get("SERPRO_CONCORRENCIA", 1)))
+
+
+def _configuracao_escalada(concorrencia_instancia: int) -> Dict[str, tuple]:
+    """Padrões para a concorrência da instância: crítica e normal a ocupam inteira."""
+    base = CONFIGURACAO_PADRAO[PRIORIDADE_CRITICA][0]
+    if concorrencia_instancia <= base:
+        return dict(CONFIGURACAO_PADRAO)
+    configuracao = {}
+    for nome, (concorrencia, fila, espera) in CONFIGURACAO_PADRAO.items():
+        if nome == PRIORIDADE_LOTE:
+            concorrencia = math.ceil(concorrencia * concorrencia_instancia / base)
+        else:
+            concorrencia = concorrencia_instancia
+        configuracao[nome] = (concorrencia, max(fila, concorrencia_instancia), espera)
+    return configuracao
+
+
+def _configuracao_do_ambiente() -> Dict[str, tuple]:
+    """Lê SERPRO_ADMISSAO_<PRIORIDADE>=concorrencia,fila,espera."""
+    configuracao = _configuracao_escalada(concorrencia_da_instancia())
+    for nome in PRIORIDADES:
+        valor = os.environ.get(f"SERPRO_ADMISSAO_{nome.upper()}")
+        if not valor:
+            continue
+        concorrencia, fila, espera = valor.split(",")
+        configuracao[nome] = (int(concorrencia), int(fila), float(espera))
+    return configuracao
+
+
+_controlador_padrao: Optional[AdmissionController] = None
+_controlador_lock = threading.Lock()
+
+
+def obter_controlador() -> AdmissionController:
+    """Retorna o controlador compartilhado do processo (configurado por ambiente)."""
+    global _controlador_padrao
+    with _controlador_lock:
+        if _controlador_padrao is None:
+            _controlador_padrao = AdmissionController(
+                configuracao=_configuracao_do_ambiente(),
+                ativo=os.environ.get("SERPRO_ADMISSAO_ATIVA", "1") != "0"
+            )
+        return _controlador_padrao
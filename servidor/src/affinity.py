@@ -0,0 +1,338 @@
+"""
+Afinidade de tenant entre instâncias do proxy.
+
+Com várias instâncias atrás de um balanceador, cada contratante é atribuído
+a uma instância "dona" por hashing consistente (nós virtuais). A instância
+que recebe uma requisição de outro tenant a encaminha internamente para a
+dona, onde o token está em cache, o P12 enviado já foi extraído e as
+conexões mTLS estão abertas. Requisições encaminhadas levam o header
+X-Afinidade-Origem e nunca são reencaminhadas.
+
+Requisições com certificado_handle são sempre processadas onde chegam: o
+handle só existe no registro da instância que o emitiu (cada instância
+tem o seu registro), e a dona responderia 404.
+
+Mudanças de membros são suaves: com hashing consistente só ~1/N dos tenants
+muda de dona, e mesmo esses migram gradualmente ao longo da janela de
+transição (cada tenant troca de dona num instante fixado pelo seu hash),
+espalhando o aquecimento dos caches. Só quando a conexão com a dona nem
+chega a ser estabelecida a requisição é processada localmente: depois de
+enviada ela pode estar executando na dona, e repeti-la aqui duplicaria
+chamadas sem idempotência. Nesse caso o timeout vira 504 e as demais falhas
+502. A dona recebe em X-Request-Timeout só o prazo que ainda resta.
+
+Configuração por ambiente:
+    SERPRO_AFINIDADE_INSTANCIAS=http://a:8000,http://b:8000   (vazio = desligado)
+    SERPRO_AFINIDADE_ARQUIVO=/etc/serpro/instancias.txt       (uma URL por linha; relido a cada 10 s)
+    SERPRO_AFINIDADE_PROPRIA=http://a:8000                    (URL desta instância)
+    SERPRO_AFINIDADE_CHAVE=contratante                        (ou 'certificado')
+    SERPRO_AFINIDADE_TRANSICAO=120                            (segundos)
+    SERPRO_AFINIDADE_VNODES=128
+"""
+
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+import urllib3
+
+from src.deadline import Deadline, DeadlineExcedidoError, HEADER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+HEADER_ORIGEM = "X-Afinidade-Origem"
+
+CHAVE_CONTRATANTE = "contratante"
+CHAVE_CERTIFICADO = "certificado"
+
+VNODES_PADRAO = 128
+TRANSICAO_PADRAO = 120.0
+INTERVALO_RELEITURA = 10.0
+TIMEOUT_CONEXAO = 2.0
+
+# Headers que não atravessam o encaminhamento
+_HEADERS_SALTO = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+class EncaminhamentoError(Exception):
+    """A dona recebeu (ou pode ter recebido) a requisição e não respondeu."""
+
+
+def _sem_conexao(erro: requests.exceptions.RequestException) -> bool:
+    """Se a falha aconteceu antes de a requisição chegar à dona."""
+    if isinstance(erro, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(erro, requests.exceptions.ConnectionError):
+        return False
+    motivo = erro.args[0] if erro.args else None
+    motivo = getattr(motivo, "reason", motivo)
+    return isinstance(motivo, urllib3.exceptions.NewConnectionError)
+
+
+def _hash(valor: str) -> int:
+    """Hash estável de 64 bits (independe de PYTHONHASHSEED)."""
+    return int.from_bytes(hashlib.blake2b(valor.encode(), digest_size=8).digest(), "big")
+
+
+class AnelConsistente:
+    """Anel de hashing consistente com nós virtuais."""
+
+    def __init__(self, membros: Sequence[str], vnodes: int = VNODES_PADRAO):
+        self.membros = tuple(sorted(set(membros)))
+        pontos = sorted(
+            (_hash(f"{membro}#{indice}"), membro)
+            for membro in self.membros
+            for indice in range(vnodes)
+        )
+        self._hashes = [ponto for ponto, _ in pontos]
+        self._donos = [membro for _, membro in pontos]
+
+    def dono(self, chave: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        indice = bisect.bisect(self._hashes, _hash(chave)) % len(self._hashes)
+        return self._donos[indice]
+
+
+def chave_afinidade(data: Dict[str, Any], modo: str = CHAVE_CONTRATANTE) -> Optional[str]:
+    """
+    Chave de afinidade de uma requisição.
+
+    Modo 'certificado' usa o hash do P12 enviado; na falta dele (e no modo
+    'contratante') usa o contratante. Requisições com certificado_handle
+    não têm chave: o handle só vale na instância que o registrou.
+    """
+    if not isinstance(data, dict) or data.get("certificado_handle"):
+        return None
+    if modo == CHAVE_CERTIFICADO:
+        if data.get("certificado_base64"):
+            return "p12:" + hashlib.sha256(str(data["certificado_base64"]).encode()).hexdigest()
+    numero = data.get("contratante_numero")
+    if not numero and isinstance(data.get("body"), dict):
+        numero = (data["body"].get("contratante") or {}).get("numero")
+    numero = "".join(c for c in str(numero or "") if c.isdigit())
+    return f"contratante:{numero}" if numero else None
+
+
+class RoteadorAfinidade:
+    """Decide a instância dona de cada tenant e encaminha requisições."""
+
+    def __init__(
+        self,
+        propria: str,
+        membros: Sequence[str],
+        modo: str = CHAVE_CONTRATANTE,
+        transicao: float = TRANSICAO_PADRAO,
+        vnodes: int = VNODES_PADRAO,
+        arquivo: Optional[str] = None
+    ):
+        """
+        Args:
+            propria: URL desta instância (como aparece na lista de membros)
+            membros: URLs de todas as instâncias
+            modo: 'contratante' ou 'certificado'
+            transicao: Janela de migração gradual após mudança de membros (s)
+            vnodes: Nós virtuais por instância
+            arquivo: Arquivo com a lista de membros, relido periodicamente
+        """
+        self.propria = propria.rstrip("/")
+        self.modo = modo
+        self.transicao = transicao
+        self.vnodes = vnodes
+        self._arquivo = arquivo
+        self._mtime_arquivo: Optional[float] = None
+        self._proxima_releitura = 0.0
+        self._anel = AnelConsistente([m.rstrip("/") for m in membros], vnodes)
+        self._anel_anterior: Optional[AnelConsistente] = None
+        self._mudanca = 0.0
+        self._lock = threading.Lock()
+        self._sessao = requests.Session()
+        self._contadores = {
+            "locais": 0, "encaminhadas": 0, "falhas_encaminhamento": 0, "dona_indisponivel": 0,
+        }
+        self._contadores_lock = threading.Lock()
+
+    def _contar(self, chave: str):
+        with self._contadores_lock:
+            self._contadores[chave] += 1
+
+    @property
+    def membros(self) -> Tuple[str, ...]:
+        return self._anel.membros
+
+    def atualizar_membros(self, membros: Sequence[str]):
+        """Troca a lista de membros, iniciando a migração gradual."""
+        membros = [m.rstrip("/") for m in membros if m.strip()]
+        with self._lock:
+            if tuple(sorted(set(membros))) == self._anel.membros:
+                return
+            self._anel_anterior = self._anel
+            self._anel = AnelConsistente(membros, self.vnodes)
+            self._mudanca = time.monotonic()
+        logger.info("Membros de afinidade atualizados: %s", list(self._anel.membros))
+
+    def _reler_arquivo(self):
+        agora = time.monotonic()
+        if not self._arquivo or agora < self._proxima_releitura:
+            return
+        self._proxima_releitura = agora + INTERVALO_RELEITURA
+        try:
+            mtime = os.path.getmtime(self._arquivo)
+            if mtime == self._mtime_arquivo:
+                return
+            with open(self._arquivo, encoding="utf-8") as arquivo:
+                membros = [linha.strip() for linha in arquivo if linha.strip() and not linha.startswith("#")]
+            self._mtime_arquivo = mtime
+        except OSError as e:
+            logger.warning("Lista de instâncias indisponível (%s): mantendo membros atuais", e)
+            return
+        self.atualizar_membros(membros)
+
+    def dono(self, chave: str) -> Optional[str]:
+        """Instância dona da chave, considerando a migração em andamento."""
+        self._reler_arquivo()
+        with self._lock:
+            anel, anterior, mudanca = self._anel, self._anel_anterior, self._mudanca
+        novo = anel.dono(chave)
+        if anterior is None:
+            return novo
+        progresso = (time.monotonic() - mudanca) / self.transicao if self.transicao > 0 else 1.0
+        if progresso >= 1:
+            with self._lock:
+                if self._anel_anterior is anterior:
+                    self._anel_anterior = None
+            return novo
+        antigo = anterior.dono(chave)
+        # Dona antiga ainda presente: o tenant migra quando o progresso passa do seu hash
+        if antigo in anel.membros and (_hash(f"migracao:{chave}") / 2 ** 64) >= progresso:
+            return antigo
+        return novo
+
+    def destino(self, data: Dict[str, Any], headers: Dict[str, str]) -> Optional[str]:
+        """
+        URL da instância para onde encaminhar, ou None para processar aqui.
+
+        Args:
+            data: Corpo JSON da requisição
+            headers: Headers recebidos (encaminhadas nunca são reencaminhadas)
+        """
+        if any(chave.lower() == HEADER_ORIGEM.lower() for chave in headers):
+            return None
+        chave = chave_afinidade(data, self.modo)
+        dono = self.dono(chave) if chave else None
+        if dono is None or dono == self.propria:
+            self._contar("locais")
+            return None
+        return dono
+
+    def encaminhar(
+        self,
+        destino: str,
+        caminho: str,
+        corpo: bytes,
+        headers: Dict[str, str],
+        deadline: Deadline
+    ) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """
+        Encaminha a requisição para a instância dona.
+
+        Returns:
+            (status, headers, corpo) da dona, ou None se a conexão com ela
+            não foi estabelecida (o chamador processa localmente)
+
+        Raises:
+            DeadlineExcedidoError: Se o prazo esgotou antes ou durante a espera
+            EncaminhamentoError: Se a dona falhou depois de receber a requisição
+        """
+        # A dona executa a requisição inteira: recebe todo o prazo restante, com a reserva
+        leitura = deadline.restante()
+        if leitura <= 0:
+            raise DeadlineExcedidoError("afinidade")
+        repassados = {
+            k: v for k, v in headers.items()
+            if k.lower() not in _HEADERS_SALTO and k.lower() != HEADER_TIMEOUT.lower()
+        }
+        repassados[HEADER_ORIGEM] = self.propria
+        # Só o que resta do prazo: a dona não reinicia a contagem
+        repassados[HEADER_TIMEOUT] = f"{leitura:.3f}"
+        try:
+            resposta = self._sessao.post(
+                f"{destino}{caminho}",
+                data=corpo,
+                headers=repassados,
+                timeout=(min(TIMEOUT_CONEXAO, leitura), leitura)
+            )
+        except requests.exceptions.RequestException as e:
+            if _sem_conexao(e):
+                self._contar("dona_indisponivel")
+                logger.warning("Dona %s indisponível (%s): processando localmente", destino, e)
+                return None
+            self._contar("falhas_encaminhamento")
+            logger.warning("Encaminhamento para %s falhou (%s)", destino, e)
+            if isinstance(e, requests.exceptions.Timeout):
+                raise DeadlineExcedidoError("afinidade") from e
+            raise EncaminhamentoError(f"Instância {destino} falhou: {e}") from e
+        self._contar("encaminhadas")
+        retorno = {
+            k: v for k, v in resposta.headers.items()
+            if k.lower() not in _HEADERS_SALTO and k.lower() != "content-encoding"
+        }
+        return resposta.status_code, retorno, resposta.content
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Membros, migração em andamento e contadores de roteamento."""
+        with self._contadores_lock:
+            contadores = dict(self._contadores)
+        return {
+            "propria": self.propria,
+            "membros": list(self.membros),
+            "migrando": self._anel_anterior is not None,
+            **contadores,
+        }
+
+
+_roteador: Optional[RoteadorAfinidade] = None
+_roteador_lock = threading.Lock()
+_configurado = False
+
+
+def _membros_do_ambiente() -> Tuple[List[str], Optional[str]]:
+    arquivo = os.environ.get("SERPRO_AFINIDADE_ARQUIVO") or None
+    membros = [m.strip() for m in os.environ.get("SERPRO_AFINIDADE_INSTANCIAS", "").split(",") if m.strip()]
+    if arquivo and not membros and os.path.exists(arquivo):
+        with open(arquivo, encoding="utf-8") as conteudo:
+            membros = [linha.strip() for linha in conteudo if linha.strip() and not linha.startswith("#")]
+    return membros, arquivo
+
+
+def obter_roteador() -> Optional[RoteadorAfinidade]:
+    """Roteador do processo, ou None se a afinidade não estiver configurada."""
+    global _roteador, _configurado
+    with _roteador_lock:
+        if not _configurado:
+            _configurado = True
+            membros, arquivo = _membros_do_ambiente()
+            propria = os.environ.get("SERPRO_AFINIDADE_PROPRIA", "")
+            if (membros or arquivo) and propria:
+                modo = os.environ.get("SERPRO_AFINIDADE_CHAVE", CHAVE_CONTRATANTE).lower()
+                if modo not in (CHAVE_CONTRATANTE, CHAVE_CERTIFICADO):
+                    raise ValueError(f"SERPRO_AFINIDADE_CHAVE inválida: '{modo}'")
+                _roteador = RoteadorAfinidade(
+                    propria,
+                    membros,
+                    modo=modo,
+                    transicao=float(os.environ.get("SERPRO_AFINIDADE_TRANSICAO", TRANSICAO_PADRAO)),
+                    vnodes=int(os.environ.get("SERPRO_AFINIDADE_VNODES", VNODES_PADRAO)),
+                    arquivo=arquivo
+                )
+            elif membros or arquivo:
+                logger.warning("SERPRO_AFINIDADE_PROPRIA não definida: afinidade desligada")
+        return _roteador
@@ -5,12 +5,157 @@ Este arquivo contém TODA a lógica de autenticação e processamento.
 Ele é importado tanto por firebase.py quanto por localhost.py
 """
 
-import json
+import time
 import base64
-from typing import Dict, Any, Optional, List
+import hashlib
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, List, Union
 
 from src.mtls_client import MtlsClient
-from src.xml_signer import criar_termo_xml, assinar_xml
+from src.cache import LockIndisponivelError, obter_cache, obter_ou_calcular
+from src.deadline import Deadline, DeadlineExcedidoError
+from src.service_catalog import validar_requisicao
+from src.idempotency import (
+    chave_idempotencia,
+    hash_corpo,
+    janela_idempotencia,
+    marcar_repetida,
+    resultado_reaproveitavel
+)
+from src.usage import obter_contabilidade, servico_do_body, tenant_do_body
+from src.tenant_scope import escopo_da_credencial, escopo_do_chamador
+from src.columnar_export import ExportacaoColunar, exportar
+from src.jobs import CONCORRENCIA_PADRAO, TAXA_PADRAO, TENTATIVAS_PADRAO, obter_gerenciador
+from src.xml_signer import criar_termo_xml, assinar_xml_com_identidade
+from src.certificate_registry import CertificateIdentity, obter_registro
+from src.dados_codec import (
+    codificar_dados,
+    decodificar_dados,
+    decodificar_resposta,
+    preparar_body,
+    serializar_json
+)
+from src.documento_binario import (
+    DocumentoBinario,
+    extrair_documento,
+    FORMATO_JSON,
+    FORMATOS_RESPOSTA
+)
+
+# Margem de segurança para renovar tokens antes do vencimento (segundos)
+MARGEM_EXPIRACAO_TOKEN = 60
+
+# Validade assumida do token de procurador quando a API não informa (segundos)
+TTL_PROCURADOR_PADRAO = 3600
+
+# Endpoints cujas respostas podem ser reaproveitadas (somente leitura)
+ENDPOINTS_CACHEAVEIS = ("/Consultar",)
+
+# Espera máxima pelo lock de renovação quando não há prazo (segundos)
+ESPERA_LOCK_PADRAO = 30.0
+
+
+def _chave_cache(prefixo: str, *partes: Any) -> str:
+    """Monta chave de cache sem expor segredos (hash SHA-256 das partes)."""
+    digest = hashlib.sha256("\x1f".join(str(parte) for parte in partes).encode()).hexdigest()
+    return f"{prefixo}:{digest}"
+
+
+def _segundos_ate(data_hora: Optional[str]) -> Optional[float]:
+    """Converte data de expiração (HTTP-date ou ISO 8601) em segundos restantes."""
+    if not data_hora:
+        return None
+    try:
+        expiracao = parsedate_to_datetime(data_hora)
+    except (TypeError, ValueError):
+        try:
+            expiracao = datetime.fromisoformat(data_hora)
+        except ValueError:
+            return None
+    if expiracao.tzinfo is None:
+        return None
+    return expiracao.timestamp() - time.time()
+
+
+def _buscar_segredo(get_secret_fn, nome: str, deadline: Optional[Deadline]) -> str:
+    """Busca um secret dentro do prazo da requisição."""
+    if deadline is None:
+        return get_secret_fn(nome)
+    deadline.verificar("secret_manager")
+    inicio = time.monotonic()
+    try:
+        return get_secret_fn(nome)
+    finally:
+        deadline.registrar("secret_manager", inicio)
+
+
+def _obter_ou_calcular_no_prazo(
+    cache,
+    chave: str,
+    calcular,
+    ttl_fn,
+    deadline: Optional[Deadline],
+    etapa: str
+):
+    """obter_ou_calcular com espera pelo lock limitada ao prazo restante."""
+    if deadline is None:
+        return obter_ou_calcular(cache, chave, calcular, ttl_fn)
+    deadline.verificar(etapa)
+    try:
+        return obter_ou_calcular(
+            cache, chave, calcular, ttl_fn,
+            lock_timeout=min(ESPERA_LOCK_PADRAO, deadline.disponivel(etapa))
+        )
+    except LockIndisponivelError as e:
+        # Lock ocupado até o fim do prazo: é timeout da requisição, não erro interno
+        raise DeadlineExcedidoError(etapa) from e
+
+
+def _authenticate_cached(
+    client: MtlsClient,
+    data: Dict[str, Any],
+    ambiente: str,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Autentica OAuth2 reaproveitando o token do cache compartilhado.
+
+    O token fica no cache até `expires_in - MARGEM_EXPIRACAO_TOKEN`; na
+    resposta, `expires_in` reflete o tempo restante.
+    """
+    if ambiente == "trial":
+        return client.authenticate(
+            consumer_key=data["consumer_key"],
+            consumer_secret=data["consumer_secret"]
+        )
+
+    cache = obter_cache()
+    chave = _chave_cache(
+        "oauth", ambiente, data["consumer_key"], data["consumer_secret"],
+        client.certificate_fingerprint
+    )
+    if data.get("forcar_renovacao"):
+        cache.delete(chave)
+
+    def autenticar() -> Dict[str, Any]:
+        result = client.authenticate(
+            consumer_key=data["consumer_key"],
+            consumer_secret=data["consumer_secret"]
+        )
+        result["expira_em"] = time.time() + int(result.get("expires_in", 0))
+        return result
+
+    valor, _ = _obter_ou_calcular_no_prazo(
+        cache, chave, autenticar,
+        ttl_fn=lambda v: v["expira_em"] - time.time() - MARGEM_EXPIRACAO_TOKEN,
+        deadline=deadline,
+        etapa="autenticacao"
+    )
+
+    result = {campo: conteudo for campo, conteudo in valor.items() if campo != "expira_em"}
+    result["expires_in"] = max(0, int(valor["expira_em"] - time.time()))
+    return result
 
 
 def validate_request_data(data: Dict, required_fields: List[str]) -> Optional[str]:
@@ -41,13 +186,123 @@ def validate_request_data(data: Dict, required_fields: List[str]) -> Optional[st
     return None
 
 
-def process_autenticar_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+def _resolve_registered_identity(data: Dict, campo: str = "certificado_handle") -> Optional[CertificateIdentity]:
+    """Obtém a identidade de um certificado registrado, se o handle foi enviado."""
+    handle = data.get(campo)
+    if not handle:
+        return None
+    return obter_registro().obter(handle)
+
+
+def process_registrar_certificado(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Registra um certificado e devolve o handle opaco para as próximas chamadas.
+
+    Args:
+        data: Dados da requisição (certificado_base64 + certificado_senha,
+            ou cert_secret_name + cert_password_secret_name no Firebase)
+        get_secret_fn: Função opcional para buscar secrets (Firebase)
+
+    Returns:
+        Dict com certificado_handle, fingerprint, titular, valido_ate e expira_em
+    """
+    cert_base64 = data.get("certificado_base64")
+    cert_password = data.get("certificado_senha")
+
+    if get_secret_fn and not cert_base64:
+        cert_secret = data.get("cert_secret_name")
+        password_secret = data.get("cert_password_secret_name")
+
+        if cert_secret:
+            cert_base64 = get_secret_fn(cert_secret)
+        if password_secret:
+            cert_password = get_secret_fn(password_secret)
+
+    if not cert_base64:
+        raise ValueError("Campo obrigatório ausente: certificado_base64")
+    if not cert_password:
+        raise ValueError("Campo obrigatório ausente: certificado_senha")
+
+    ttl = data.get("ttl_segundos")
+    if ttl is not None and (not isinstance(ttl, int) or ttl <= 0):
+        raise ValueError("ttl_segundos deve ser um inteiro positivo")
+
+    try:
+        identidade = CertificateIdentity.from_p12(base64.b64decode(cert_base64), cert_password)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Certificado inválido ou senha incorreta: {e}")
+
+    return obter_registro().registrar(identidade, ttl=ttl)
+
+
+def process_remover_certificado(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Remove um certificado registrado.
+
+    Args:
+        data: Dados da requisição (certificado_handle)
+        get_secret_fn: Não utilizado (assinatura comum aos demais processos)
+
+    Returns:
+        Dict com o indicador `removido`
+    """
+    validation_error = validate_request_data(data, ["certificado_handle"])
+    if validation_error:
+        raise ValueError(validation_error)
+
+    return {"removido": obter_registro().remover(data["certificado_handle"])}
+
+
+def process_consultar_uso(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Consulta o uso contabilizado por contratante e serviço.
+
+    Só aparecem as chamadas feitas com a credencial de quem consulta.
+
+    Args:
+        data: certificado_handle (produção) ou access_token (trial) e
+            filtros opcionais (tenant, servico, desde, ate, ordenar, limite)
+        get_secret_fn: Não utilizado (assinatura comum aos demais processos)
+
+    Returns:
+        Dict com `servicos` (por tenant e serviço) e `tenants` (totais por tenant)
+
+    Raises:
+        CredencialAusenteError: Sem credencial de quem consulta
+    """
+    escopo = escopo_do_chamador(data)
+
+    limite = data.get("limite") or 50
+    try:
+        limite = int(limite)
+    except (TypeError, ValueError):
+        raise ValueError("limite deve ser um inteiro positivo")
+    if limite <= 0:
+        raise ValueError("limite deve ser um inteiro positivo")
+
+    return obter_contabilidade().consultar(
+        escopo,
+        tenant=data.get("tenant"),
+        servico=data.get("servico"),
+        desde=data.get("desde"),
+        ate=data.get("ate"),
+        ordenar=data.get("ordenar") or "chamadas",
+        limite=limite
+    )
+
+
+def process_autenticar_serpro(
+    data: Dict[str, Any],
+    get_secret_fn=None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
     """
     Processa autenticação SERPRO.
 
     Args:
         data: Dados da requisição
         get_secret_fn: Função opcional para buscar secrets (Firebase)
+        deadline: Prazo da requisição (opcional)
 
     Returns:
         Dict com tokens de autenticação
@@ -66,28 +321,29 @@ def process_autenticar_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[
     cert_base64 = data.get("certificado_base64")
     cert_password = data.get("certificado_senha")
 
+    identidade = _resolve_registered_identity(data)
+
     # Se não veio no body, tentar Secret Manager (se disponível)
-    if get_secret_fn and ambiente == "producao" and not cert_base64:
+    if get_secret_fn and ambiente == "producao" and not cert_base64 and not identidade:
         cert_secret = data.get("cert_secret_name")
         password_secret = data.get("cert_password_secret_name")
 
         if cert_secret:
-            cert_base64 = get_secret_fn(cert_secret)
+            cert_base64 = _buscar_segredo(get_secret_fn, cert_secret, deadline)
         if password_secret:
-            cert_password = get_secret_fn(password_secret)
+            cert_password = _buscar_segredo(get_secret_fn, password_secret, deadline)
 
     # Criar cliente mTLS
     client = MtlsClient(
         cert_base64=cert_base64,
         cert_password=cert_password,
-        ambiente=ambiente
+        ambiente=ambiente,
+        identidade=identidade,
+        deadline=deadline
     )
 
-    # Autenticar
-    result = client.authenticate(
-        consumer_key=data["consumer_key"],
-        consumer_secret=data["consumer_secret"]
-    )
+    # Autenticar (token compartilhado via cache)
+    result = _authenticate_cached(client, data, ambiente, deadline)
 
     # Adicionar dados extras
     result["contratante_numero"] = data["contratante_numero"]
@@ -96,13 +352,18 @@ def process_autenticar_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[
     return result
 
 
-def process_autenticar_procurador(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+def process_autenticar_procurador(
+    data: Dict[str, Any],
+    get_secret_fn=None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
     """
     Processa autenticação de procurador.
 
     Args:
         data: Dados da requisição
         get_secret_fn: Função opcional para buscar secrets (Firebase)
+        deadline: Prazo da requisição (opcional)
 
     Returns:
         Dict com tokens de autenticação + procurador_token
@@ -122,36 +383,31 @@ def process_autenticar_procurador(data: Dict[str, Any], get_secret_fn=None) -> D
     cert_base64 = data.get("certificado_base64")
     cert_password = data.get("certificado_senha")
 
+    identidade = _resolve_registered_identity(data)
+
     # Obter certificado do PROCURADOR (para assinar XML)
     procurador_cert_base64 = data.get("certificado_procurador_base64")
     procurador_cert_password = data.get("certificado_procurador_senha")
+    procurador_identidade = _resolve_registered_identity(data, "certificado_procurador_handle")
 
-
-    # Se não forneceu certificado procurador separado, usa o mesmo (fallback)
-    if not procurador_cert_base64:
-        procurador_cert_base64 = cert_base64
-        procurador_cert_password = cert_password
-    
-
-    if get_secret_fn and ambiente == "producao" and not cert_base64:
+    if get_secret_fn and ambiente == "producao" and not cert_base64 and not identidade:
         cert_secret = data.get("cert_secret_name")
         password_secret = data.get("cert_password_secret_name")
 
         if cert_secret and password_secret:
-            cert_base64 = get_secret_fn(cert_secret)
-            cert_password = get_secret_fn(password_secret)
+            cert_base64 = _buscar_segredo(get_secret_fn, cert_secret, deadline)
+            cert_password = _buscar_segredo(get_secret_fn, password_secret, deadline)
 
     # 1. OAuth2
     client = MtlsClient(
         cert_base64=cert_base64,
         cert_password=cert_password,
-        ambiente=ambiente
+        ambiente=ambiente,
+        identidade=identidade,
+        deadline=deadline
     )
 
-    auth_result = client.authenticate(
-        consumer_key=data["consumer_key"],
-        consumer_secret=data["consumer_secret"]
-    )
+    auth_result = _authenticate_cached(client, data, ambiente, deadline)
 
     # Trial mode
     if ambiente == "trial":
@@ -160,85 +416,141 @@ def process_autenticar_procurador(data: Dict[str, Any], get_secret_fn=None) -> D
         auth_result["procurador_token"] = "trial_procurador_token_simulado"
         return auth_result
 
-    # 2. Criar XML
+    # Se não forneceu certificado procurador separado, usa o mesmo (fallback)
+    if not procurador_identidade:
+        if procurador_cert_base64:
+            procurador_identidade = CertificateIdentity.from_p12(
+                base64.b64decode(procurador_cert_base64), procurador_cert_password
+            )
+        else:
+            procurador_identidade = client.resolve_identity()
+
     contribuinte = data.get("contribuinte_numero", data["contratante_numero"])
 
-    xml_termo = criar_termo_xml(
-        contratante_numero=data["contratante_numero"],
-        contratante_nome=data["contratante_nome"],
-        autor_numero=data["autor_pedido_dados_numero"],
-        autor_nome=data["autor_nome"]
-    )
+    def obter_token_procurador() -> Dict[str, Any]:
+        # 2. Criar XML
+        xml_termo = criar_termo_xml(
+            contratante_numero=data["contratante_numero"],
+            contratante_nome=data["contratante_nome"],
+            autor_numero=data["autor_pedido_dados_numero"],
+            autor_nome=data["autor_nome"]
+        )
+
+        # 3. Assinar XML - USAR CERTIFICADO DO PROCURADOR
+        if deadline is not None:
+            deadline.verificar("assinatura")
+        inicio = time.monotonic()
+        xml_assinado = assinar_xml_com_identidade(xml_termo, procurador_identidade)
+        if deadline is not None:
+            deadline.registrar("assinatura", inicio)
+
+        # 4. Enviar para API
+        xml_base64 = base64.b64encode(xml_assinado.encode()).decode()
+
+        # Limpar números para detectar tipo corretamente
+        contratante_limpo = data["contratante_numero"].replace(".", "").replace("-", "").replace("/", "")
+        autor_limpo = data["autor_pedido_dados_numero"].replace(".", "").replace("-", "").replace("/", "")
+        contribuinte_limpo = contribuinte.replace(".", "").replace("-", "").replace("/", "")
+
+        request_body = {
+            "contratante": {
+                "numero": contratante_limpo,
+                "tipo": 2 if len(contratante_limpo) == 14 else 1
+            },
+            "autorPedidoDados": {
+                "numero": autor_limpo,
+                "tipo": 2 if len(autor_limpo) == 14 else 1
+            },
+            "contribuinte": {
+                "numero": contribuinte_limpo,
+                "tipo": 2 if len(contribuinte_limpo) == 14 else 1
+            },
+            "pedidoDados": {
+                "idSistema": "AUTENTICAPROCURADOR",
+                "idServico": "ENVIOXMLASSINADO81",
+                "versaoSistema": "1.0",
+                "dados": codificar_dados({"xml": xml_base64})
+            }
+        }
 
-    # 3. Assinar XML - USAR CERTIFICADO DO PROCURADOR
-    procurador_cert_bytes = base64.b64decode(procurador_cert_base64)
-    xml_assinado = assinar_xml(xml_termo, procurador_cert_bytes, procurador_cert_password)
-
-    # 4. Enviar para API
-    xml_base64 = base64.b64encode(xml_assinado.encode()).decode()
-
-    # Limpar números para detectar tipo corretamente
-    contratante_limpo = data["contratante_numero"].replace(".", "").replace("-", "").replace("/", "")
-    autor_limpo = data["autor_pedido_dados_numero"].replace(".", "").replace("-", "").replace("/", "")
-    contribuinte_limpo = contribuinte.replace(".", "").replace("-", "").replace("/", "")
-
-    request_body = {
-        "contratante": {
-            "numero": contratante_limpo,
-            "tipo": 2 if len(contratante_limpo) == 14 else 1
-        },
-        "autorPedidoDados": {
-            "numero": autor_limpo,
-            "tipo": 2 if len(autor_limpo) == 14 else 1
-        },
-        "contribuinte": {
-            "numero": contribuinte_limpo,
-            "tipo": 2 if len(contribuinte_limpo) == 14 else 1
-        },
-        "pedidoDados": {
-            "idSistema": "AUTENTICAPROCURADOR",
-            "idServico": "ENVIOXMLASSINADO81",
-            "versaoSistema": "1.0",
-            "dados": json.dumps({"xml": xml_base64})
+        response = client.post(
+            endpoint="/Apoiar",
+            data=request_body,
+            access_token=auth_result["access_token"],
+            jwt_token=auth_result["jwt_token"]
+        )
+
+        # Extrair token (`dados` chega como string JSON no status 200)
+        dados = decodificar_dados(response.get("dados"))
+        procurador_token = None
+        if isinstance(dados, dict) and "autenticarProcuradorToken" in dados:
+            procurador_token = dados["autenticarProcuradorToken"]
+        elif "autenticarProcuradorToken" in response:
+            procurador_token = response["autenticarProcuradorToken"]
+
+        restante = _segundos_ate(dados.get("data_hora_expiracao") if isinstance(dados, dict) else None)
+        return {
+            "procurador_token": procurador_token,
+            "expira_em": time.time() + (restante if restante is not None else TTL_PROCURADOR_PADRAO)
         }
-    }
 
-    response = client.post(
-        endpoint="/Apoiar",
-        data=request_body,
-        access_token=auth_result["access_token"],
-        jwt_token=auth_result["jwt_token"]
+    # Token de procurador compartilhado via cache (um renovador por vez)
+    cache = obter_cache()
+    chave = _chave_cache(
+        "procurador", ambiente, data["contratante_numero"], data["autor_pedido_dados_numero"],
+        contribuinte, procurador_identidade.fingerprint
+    )
+    if data.get("forcar_renovacao"):
+        cache.delete(chave)
+
+    token, _ = _obter_ou_calcular_no_prazo(
+        cache, chave, obter_token_procurador,
+        ttl_fn=lambda v: (v["expira_em"] - time.time() - MARGEM_EXPIRACAO_TOKEN) if v["procurador_token"] else 0,
+        deadline=deadline,
+        etapa="procurador"
     )
-
-    # Extrair token
-    procurador_token = None
-    if "dados" in response and "autenticarProcuradorToken" in response.get("dados", {}):
-        procurador_token = response["dados"]["autenticarProcuradorToken"]
-    elif "autenticarProcuradorToken" in response:
-        procurador_token = response["autenticarProcuradorToken"]
 
     # Resposta
     result = {
         **auth_result,
         "contratante_numero": data["contratante_numero"],
         "autor_pedido_dados_numero": data["autor_pedido_dados_numero"],
-        "procurador_token": procurador_token,
+        "procurador_token": token["procurador_token"],
         "contribuinte_numero": contribuinte
     }
 
     return result
 
 
-def process_proxy_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+def process_proxy_serpro(
+    data: Dict[str, Any],
+    get_secret_fn=None,
+    deadline: Optional[Deadline] = None
+) -> Union[Dict[str, Any], DocumentoBinario]:
     """
     Processa proxy genérico SERPRO.
 
     Args:
         data: Dados da requisição
         get_secret_fn: Função opcional para buscar secrets (Firebase)
+        deadline: Prazo da requisição (opcional)
+
+    Campos opcionais de entrega (`data`):
+        formato_resposta: 'json' (padrão), 'pdf' ou 'multipart'
+        campo_documento: Campo de `dados` que contém o documento Base64
+        nome_arquivo: Nome sugerido para o documento
+        decodificar_dados: Se True, devolve `dados` já decodificado (objeto)
+        cache_ttl: Segundos para reaproveitar respostas de /Consultar (opcional)
+        idempotency_key: Chave de idempotência (header Idempotency-Key)
+        request_tag: Header X-Request-Tag, chave implícita de /Declarar e /Emitir
+            (com SERPRO_IDEMPOTENCIA_IMPLICITA)
+
+    `body.pedidoDados.dados` pode ser enviado como objeto; o servidor o
+    codifica na string JSON exigida pela API SERPRO.
 
     Returns:
-        Dict com resposta da API SERPRO
+        Dict com resposta da API SERPRO, ou DocumentoBinario quando
+        `formato_resposta` pede entrega binária e a resposta contém documento
     """
     # Validar dados
     validation_error = validate_request_data(data, [
@@ -247,26 +559,39 @@ def process_proxy_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[str,
     if validation_error:
         raise ValueError(validation_error)
 
+    # Combinações inválidas voltam como 400 sem chamada bilhetada
+    servico_catalogo = validar_requisicao(data["endpoint"], data["body"])
+
+    formato_resposta = data.get("formato_resposta") or FORMATO_JSON
+    if formato_resposta not in FORMATOS_RESPOSTA:
+        raise ValueError(
+            f"formato_resposta inválido: '{formato_resposta}'. "
+            f"Use {', '.join(FORMATOS_RESPOSTA)}."
+        )
+
     ambiente = data.get("ambiente", "trial")
 
-    # Obter certificado
+    # Obter certificado (handle registrado dispensa o P12)
     cert_base64 = data.get("certificado_base64")
     cert_password = data.get("certificado_senha")
+    identidade = _resolve_registered_identity(data)
 
-    if get_secret_fn and ambiente == "producao":
+    if get_secret_fn and ambiente == "producao" and not identidade:
         cert_secret = data.get("cert_secret_name")
         password_secret = data.get("cert_password_secret_name")
 
         if cert_secret:
-            cert_base64 = get_secret_fn(cert_secret)
+            cert_base64 = _buscar_segredo(get_secret_fn, cert_secret, deadline)
         if password_secret:
-            cert_password = get_secret_fn(password_secret)
+            cert_password = _buscar_segredo(get_secret_fn, password_secret, deadline)
 
     # Criar cliente
     client = MtlsClient(
         cert_base64=cert_base64,
         cert_password=cert_password,
-        ambiente=ambiente
+        ambiente=ambiente,
+        identidade=identidade,
+        deadline=deadline
     )
 
     # Headers adicionais
@@ -274,13 +599,269 @@ def process_proxy_serpro(data: Dict[str, Any], get_secret_fn=None) -> Dict[str,
     if data.get("procurador_token"):
         headers["autenticar_procurador_token"] = data["procurador_token"]
 
-    # Fazer requisição
-    result = client.post(
-        endpoint=data["endpoint"],
-        data=data["body"],
-        access_token=data["access_token"],
-        jwt_token=data["jwt_token"],
-        headers=headers
+    # Fazer requisição (dados estruturado é codificado uma única vez aqui)
+    body = preparar_body(data["body"])
+
+    # Contabilização de uso por contratante e serviço (sem I/O no caminho)
+    contabilidade = obter_contabilidade()
+    tenant = tenant_do_body(body)
+    servico = servico_do_body(body)
+
+    # Escopo da credencial: certificado em produção; no trial (sem mTLS), o access_token
+    if ambiente == "producao":
+        escopo = escopo_da_credencial(fingerprint=client.certificate_fingerprint)
+    else:
+        escopo = escopo_da_credencial(access_token=data["access_token"])
+
+    def executar() -> Dict[str, Any]:
+        erro = True
+        try:
+            resposta = client.post(
+                endpoint=data["endpoint"],
+                data=body,
+                access_token=data["access_token"],
+                jwt_token=data["jwt_token"],
+                headers=headers
+            )
+            erro = False
+            return resposta
+        finally:
+            if client.ultima_chamada:
+                contabilidade.registrar_chamada(escopo, tenant, servico, erro=erro, **client.ultima_chamada)
+
+    chave_idem = chave_idempotencia(
+        ambiente, data["endpoint"], body, escopo,
+        chave_cliente=data.get("idempotency_key"),
+        request_tag=data.get("request_tag")
     )
 
+    cache_ttl = data.get("cache_ttl")
+    marcar_repetida(False)
+    if chave_idem:
+        # Primeiro resultado de sucesso é reaproveitado; duplicatas simultâneas esperam o lock
+        corpo = hash_corpo(body)
+        janela = janela_idempotencia(implicita=not data.get("idempotency_key"))
+        registro, repetida = _obter_ou_calcular_no_prazo(
+            obter_cache(), chave_idem,
+            lambda: {"corpo": corpo, "resultado": executar()},
+            ttl_fn=lambda v: janela if resultado_reaproveitavel(v["resultado"]) else 0,
+            deadline=deadline,
+            etapa="serpro"
+        )
+        if repetida and registro["corpo"] != corpo:
+            raise ValueError("Idempotency-Key já utilizada com outro corpo de requisição")
+        if repetida:
+            contabilidade.registrar_cache_hit(escopo, tenant, servico)
+            marcar_repetida(True)
+        result = dict(registro["resultado"])
+    elif cache_ttl and (
+        servico_catalogo.cacheavel if servico_catalogo else data["endpoint"] in ENDPOINTS_CACHEAVEIS
+    ):
+        # Chave inclui o access_token: só reaproveita para quem já tem acesso
+        chave = _chave_cache(
+            "resposta", ambiente, data["endpoint"], data["access_token"],
+            data.get("procurador_token") or "", serializar_json(body).decode()
+        )
+        result, hit = _obter_ou_calcular_no_prazo(
+            obter_cache(), chave, executar,
+            ttl_fn=lambda v: cache_ttl if v.get("status") == 200 else 0,
+            deadline=deadline,
+            etapa="serpro"
+        )
+        if hit:
+            contabilidade.registrar_cache_hit(escopo, tenant, servico)
+        # Cópia rasa: o processamento abaixo não deve alterar a entrada do cache
+        result = dict(result)
+    else:
+        result = executar()
+
+    # Entrega binária: sem documento (ex.: erro de negócio), mantém o JSON
+    if formato_resposta != FORMATO_JSON:
+        documento = extrair_documento(
+            result,
+            formato=formato_resposta,
+            campo_documento=data.get("campo_documento"),
+            nome_arquivo=data.get("nome_arquivo")
+        )
+        if documento:
+            return documento
+
+    if data.get("decodificar_dados"):
+        decodificar_resposta(result)
+
     return result
+
+
+def _gerenciador_jobs():
+    return obter_gerenciador(process_proxy_serpro)
+
+
+def retomar_jobs_pendentes() -> List[str]:
+    """Retoma os jobs sem dono vivo (chamado na partida do servidor)."""
+    return _gerenciador_jobs().retomar_pendentes()
+
+
+def _escopo_do_template(template: Dict[str, Any]) -> str:
+    """Escopo da credencial do template: o mesmo que process_proxy_serpro contabiliza."""
+    if template.get("ambiente", "trial") != "producao":
+        return escopo_da_credencial(access_token=template.get("access_token"))
+    identidade = _resolve_registered_identity(template)
+    if identidade is None:
+        if not template.get("certificado_base64") or not template.get("certificado_senha"):
+            raise ValueError("Certificado não fornecido para ambiente de produção")
+        identidade = CertificateIdentity.from_p12(
+            base64.b64decode(template["certificado_base64"]), template["certificado_senha"]
+        )
+    return escopo_da_credencial(fingerprint=identidade.fingerprint)
+
+
+def _inteiro(data: Dict[str, Any], campo: str, padrao: Any, conversor=int):
+    valor = data.get(campo)
+    if valor is None or valor == "":
+        return padrao
+    try:
+        return conversor(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{campo} deve ser numérico")
+
+
+def process_criar_job(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Cria um job de fan-out: um serviço para vários contribuintes.
+
+    Args:
+        data: `template` (mesmos campos do proxy_serpro; o contribuinte do
+            body é substituído item a item, e `expires_in` dos tokens),
+            `contribuintes` (lista de CPF/CNPJ) e, opcionais,
+            `concorrencia`, `taxa_por_segundo` e `tentativas`
+        get_secret_fn: Não utilizado (o template deve trazer certificado
+            ou handle registrado)
+
+    Returns:
+        Dict com job_id e progresso inicial (o job pertence à credencial
+        do template: handle/certificado em produção, access_token no trial)
+    """
+    validation_error = validate_request_data(data, ["template", "contribuintes"])
+    if validation_error:
+        raise ValueError(validation_error)
+    if not isinstance(data["template"], dict):
+        raise ValueError("template deve ser um objeto")
+    if not isinstance(data["contribuintes"], list):
+        raise ValueError("contribuintes deve ser uma lista")
+
+    return _gerenciador_jobs().criar(
+        data["template"],
+        data["contribuintes"],
+        _escopo_do_template(data["template"]),
+        concorrencia=_inteiro(data, "concorrencia", CONCORRENCIA_PADRAO),
+        taxa_por_segundo=_inteiro(data, "taxa_por_segundo", TAXA_PADRAO, float),
+        tentativas=_inteiro(data, "tentativas", TENTATIVAS_PADRAO)
+    )
+
+
+def process_consultar_job(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Progresso de um job.
+
+    Args:
+        data: job_id e a credencial dona do job (certificado_handle ou
+            access_token)
+
+    Raises:
+        CredencialAusenteError: Sem credencial
+        JobNaoEncontradoError: job_id desconhecido para a credencial
+    """
+    validation_error = validate_request_data(data, ["job_id"])
+    if validation_error:
+        raise ValueError(validation_error)
+    return _gerenciador_jobs().progresso(data["job_id"], escopo_do_chamador(data))
+
+
+def process_resultados_job(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Resultados paginados de um job.
+
+    Args:
+        data: job_id, credencial dona do job (certificado_handle ou
+            access_token) e, opcionais, pagina, tamanho e estado
+            (pendente/ok/erro)
+        get_secret_fn: Não utilizado
+
+    Returns:
+        Dict com a página de itens (contribuinte, estado, erro, resultado)
+    """
+    validation_error = validate_request_data(data, ["job_id"])
+    if validation_error:
+        raise ValueError(validation_error)
+    return _gerenciador_jobs().resultados(
+        data["job_id"],
+        escopo_do_chamador(data),
+        pagina=_inteiro(data, "pagina", 1),
+        tamanho=_inteiro(data, "tamanho", 100),
+        estado=data.get("estado") or None
+    )
+
+
+def process_cancelar_job(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """Cancela um job em execução (itens já processados são mantidos)."""
+    validation_error = validate_request_data(data, ["job_id"])
+    if validation_error:
+        raise ValueError(validation_error)
+    return _gerenciador_jobs().cancelar(data["job_id"], escopo_do_chamador(data))
+
+
+def process_renovar_tokens_job(data: Dict[str, Any], get_secret_fn=None) -> Dict[str, Any]:
+    """
+    Entrega tokens novos a um job em 'aguardando_tokens' e o retoma.
+
+    Args:
+        data: job_id, credencial dona do job (certificado_handle ou
+            access_token atual no trial), novo_access_token, novo_jwt_token
+            e, opcionais, expires_in e procurador_token
+        get_secret_fn: Não utilizado
+
+    Returns:
+        Dict com o progresso do job
+    """
+    validation_error = validate_request_data(data, ["job_id", "novo_access_token", "novo_jwt_token"])
+    if validation_error:
+        raise ValueError(validation_error)
+    return _gerenciador_jobs().renovar_tokens(
+        data["job_id"],
+        escopo_do_chamador(data),
+        data["novo_access_token"],
+        data["novo_jwt_token"],
+        expires_in=data.get("expires_in"),
+        procurador_token=data.get("procurador_token")
+    )
+
+
+def process_exportar_job(data: Dict[str, Any], get_secret_fn=None) -> ExportacaoColunar:
+    """
+    Exporta os resultados de um job em formato colunar.
+
+    Args:
+        data: job_id, credencial dona do job (certificado_handle ou
+            access_token) e, opcionais, formato (parquet/arrow/csv), estado
+            (pendente/ok/erro) e incluir_dados (achata `dados` em colunas)
+        get_secret_fn: Não utilizado
+
+    Returns:
+        ExportacaoColunar pronta para streaming
+    """
+    validation_error = validate_request_data(data, ["job_id"])
+    if validation_error:
+        raise ValueError(validation_error)
+
+    gerenciador = _gerenciador_jobs()
+    job_id = data["job_id"]
+    escopo = escopo_do_chamador(data)
+    estado = data.get("estado") or None
+    incluir_dados = data.get("incluir_dados") in (True, "true", "1", 1)
+    return exportar(
+        lambda: gerenciador.iterar_itens(job_id, escopo, estado=estado),
+        gerenciador.pedido(job_id, escopo),
+        formato=data.get("formato"),
+        incluir_dados=incluir_dados,
+        nome_base=f"job-{job_id}"
+    )
@@ -0,0 +1,386 @@
+"""
+Cache compartilhado de tokens e respostas.
+
+Backends disponíveis (SERPRO_CACHE_BACKEND):
+- memory: dicionário do processo (padrão)
+- sqlite: arquivo local, compartilhado entre workers do mesmo host
+- redis: qualquer servidor com protocolo Redis, compartilhado entre instâncias
+
+Cada entrada tem TTL próprio. Nos backends persistentes os valores são
+cifrados (SERPRO_CHAVE_CIFRAGEM deve ser igual em todas as instâncias).
+O lock distribuído evita que várias instâncias renovem o mesmo token ao
+mesmo tempo; enquanto o dono está vivo, a validade do lock é renovada
+periodicamente, então ele não expira no meio de uma chamada lenta.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.dados_codec import carregar_json, serializar_json
+from src.encryption import Cifrador, obter_cifrador
+
+# Import condicional do cliente Redis (opcional)
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+# Variáveis de ambiente
+ENV_BACKEND = "SERPRO_CACHE_BACKEND"
+ENV_URL = "SERPRO_CACHE_URL"
+ENV_MAX_ENTRADAS = "SERPRO_CACHE_MAX_ENTRADAS"
+
+CAMINHO_SQLITE_PADRAO = "/tmp/serpro_cache.db"
+
+
+class LockIndisponivelError(TimeoutError):
+    """Não foi possível obter o lock dentro do tempo limite."""
+
+
+class CacheBackend(ABC):
+    """Interface comum dos backends de cache."""
+
+    @abstractmethod
+    def get(self, chave: str) -> Optional[Any]:
+        """Retorna o valor ou None se ausente/expirado."""
+
+    @abstractmethod
+    def set(self, chave: str, valor: Any, ttl: float):
+        """Grava valor serializável em JSON com TTL em segundos."""
+
+    @abstractmethod
+    def delete(self, chave: str):
+        """Remove a entrada."""
+
+    @abstractmethod
+    def lock(self, nome: str, timeout: float = 10.0, ttl: float = 30.0):
+        """
+        Context manager de lock exclusivo pelo nome.
+
+        Args:
+            nome: Nome do lock
+            timeout: Tempo máximo de espera para adquirir
+            ttl: Validade do lock se o dono morrer (renovada enquanto ele vive)
+
+        Raises:
+            LockIndisponivelError: Se não adquirir dentro do timeout
+        """
+
+
+@contextmanager
+def _renovando(renovar: Callable[[], bool], ttl: float) -> Iterator[None]:
+    """
+    Renova a validade de um lock distribuído a cada ttl/3 enquanto o bloco roda.
+
+    `renovar` devolve False quando o lock já não pertence ao dono (expirou e
+    foi tomado); a renovação então para e o fato é registrado.
+    """
+    parar = threading.Event()
+
+    def executar():
+        while not parar.wait(max(0.05, ttl / 3)):
+            try:
+                if not renovar():
+                    logger.warning("Lock perdido durante a execução (validade %ss)", ttl)
+                    return
+            except Exception as e:
+                logger.warning("Falha ao renovar lock: %s", e)
+
+    thread = threading.Thread(target=executar, name="renovar-lock", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        thread.join()
+
+
+class MemoryCache(CacheBackend):
+    """Cache em memória do processo, com LRU limitado."""
+
+    def __init__(self, max_entradas: int = 10000):
+        self._max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Um lock por nome, descartado quando ninguém mais o usa ([lock, usuarios])
+        self._locks: Dict[str, List[Any]] = {}
+        self._locks_guarda = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.time():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada[1]
+
+    def set(self, chave, valor, ttl):
+        with self._lock:
+            self._entradas[chave] = (time.time() + ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self._max_entradas:
+                self._entradas.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    @contextmanager
+    def lock(self, nome, timeout=10.0, ttl=30.0):
+        # ttl não se aplica: o dono não pode morrer sem liberar dentro do processo
+        with self._locks_guarda:
+            entrada = self._locks.get(nome)
+            if entrada is None:
+                entrada = self._locks[nome] = [threading.RLock(), 0]
+            entrada[1] += 1
+        try:
+            if not entrada[0].acquire(timeout=timeout):
+                raise LockIndisponivelError(f"Lock '{nome}' indisponível")
+            try:
+                yield
+            finally:
+                entrada[0].release()
+        finally:
+            with self._locks_guarda:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._locks[nome]
+
+
+class _CacheCifrado(CacheBackend):
+    """Base dos backends persistentes: valores JSON cifrados."""
+
+    def __init__(self, cifrador: Optional[Cifrador] = None):
+        self._cifrador = cifrador or obter_cifrador()
+
+    def _empacotar(self, valor: Any) -> bytes:
+        return self._cifrador.cifrar(serializar_json(valor))
+
+    def _desempacotar(self, dados: bytes) -> Optional[Any]:
+        try:
+            return carregar_json(self._cifrador.decifrar(dados))
+        except ValueError:
+            # Chave trocada ou entrada corrompida: trata como ausente
+            return None
+
+
+class SQLiteCache(_CacheCifrado):
+    """Cache em arquivo SQLite (compartilhado entre processos do mesmo host)."""
+
+    def __init__(self, caminho: str = CAMINHO_SQLITE_PADRAO, cifrador: Optional[Cifrador] = None):
+        super().__init__(cifrador)
+        self._caminho = caminho
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(chave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL NOT NULL)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS locks "
+                "(nome TEXT PRIMARY KEY, dono TEXT NOT NULL, expira REAL NOT NULL)"
+            )
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Conexão por thread (sqlite3 não compartilha conexões entre threads)."""
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self._caminho, timeout=30, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def get(self, chave):
+        linha = self._conexao().execute(
+            "SELECT valor, expira FROM cache WHERE chave = ?", (chave,)
+        ).fetchone()
+        if linha is None:
+            return None
+        if linha[1] < time.time():
+            self.delete(chave)
+            return None
+        return self._desempacotar(linha[0])
+
+    def set(self, chave, valor, ttl):
+        conexao = self._conexao()
+        conexao.execute(
+            "INSERT OR REPLACE INTO cache (chave, valor, expira) VALUES (?, ?, ?)",
+            (chave, self._empacotar(valor), time.time() + ttl)
+        )
+        # Limpeza oportunista de entradas vencidas
+        conexao.execute("DELETE FROM cache WHERE expira < ?", (time.time(),))
+
+    def delete(self, chave):
+        self._conexao().execute("DELETE FROM cache WHERE chave = ?", (chave,))
+
+    @contextmanager
+    def lock(self, nome, timeout=10.0, ttl=30.0):
+        conexao = self._conexao()
+        dono = uuid.uuid4().hex
+        limite = time.monotonic() + timeout
+        while True:
+            agora = time.time()
+            conexao.execute("DELETE FROM locks WHERE nome = ? AND expira < ?", (nome, agora))
+            cursor = conexao.execute(
+                "INSERT OR IGNORE INTO locks (nome, dono, expira) VALUES (?, ?, ?)",
+                (nome, dono, agora + ttl)
+            )
+            if cursor.rowcount == 1:
+                break
+            if time.monotonic() >= limite:
+                raise LockIndisponivelError(f"Lock '{nome}' indisponível")
+            time.sleep(0.05)
+
+        def renovar() -> bool:
+            # Roda na thread de renovação: usa a conexão dela
+            cursor = self._conexao().execute(
+                "UPDATE locks SET expira = ? WHERE nome = ? AND dono = ?",
+                (time.time() + ttl, nome, dono)
+            )
+            return cursor.rowcount == 1
+
+        try:
+            with _renovando(renovar, ttl):
+                yield
+        finally:
+            conexao.execute("DELETE FROM locks WHERE nome = ? AND dono = ?", (nome, dono))
+
+
+class RedisCache(_CacheCifrado):
+    """Cache em servidor de protocolo Redis (compartilhado entre instâncias)."""
+
+    # Libera o lock apenas se ainda pertencer a quem o adquiriu
+    _SCRIPT_LIBERAR = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+    # Estende a validade apenas se o lock ainda pertencer ao dono
+    _SCRIPT_RENOVAR = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    )
+
+    def __init__(self, url: str, cifrador: Optional[Cifrador] = None, prefixo: str = "serpro:"):
+        if not HAS_REDIS:
+            raise ValueError("Backend redis requer o pacote 'redis' instalado")
+        super().__init__(cifrador)
+        self._redis = redis.Redis.from_url(url)
+        self._prefixo = prefixo
+        self._liberar = self._redis.register_script(self._SCRIPT_LIBERAR)
+        self._renovar = self._redis.register_script(self._SCRIPT_RENOVAR)
+
+    def get(self, chave):
+        dados = self._redis.get(self._prefixo + chave)
+        return None if dados is None else self._desempacotar(dados)
+
+    def set(self, chave, valor, ttl):
+        self._redis.set(self._prefixo + chave, self._empacotar(valor), px=max(1, int(ttl * 1000)))
+
+    def delete(self, chave):
+        self._redis.delete(self._prefixo + chave)
+
+    @contextmanager
+    def lock(self, nome, timeout=10.0, ttl=30.0):
+        chave = f"{self._prefixo}lock:{nome}"
+        dono = uuid.uuid4().hex
+        limite = time.monotonic() + timeout
+        while not self._redis.set(chave, dono, nx=True, px=int(ttl * 1000)):
+            if time.monotonic() >= limite:
+                raise LockIndisponivelError(f"Lock '{nome}' indisponível")
+            time.sleep(0.05)
+
+        def renovar() -> bool:
+            return bool(self._renovar(keys=[chave], args=[dono, int(ttl * 1000)]))
+
+        try:
+            with _renovando(renovar, ttl):
+                yield
+        finally:
+            self._liberar(keys=[chave], args=[dono])
+
+
+def obter_ou_calcular(
+    cache: CacheBackend,
+    chave: str,
+    calcular: Callable[[], Any],
+    ttl_fn: Callable[[Any], float],
+    lock_timeout: float = 30.0
+) -> Tuple[Any, bool]:
+    """
+    Lê do cache ou calcula com lock (apenas um renovador na frota).
+
+    Args:
+        cache: Backend de cache
+        chave: Chave da entrada
+        calcular: Função que produz o valor em caso de miss
+        ttl_fn: Função que define o TTL a partir do valor (<= 0 não grava)
+        lock_timeout: Espera máxima pelo lock de renovação
+
+    Returns:
+        Tupla (valor, veio_do_cache)
+    """
+    valor = cache.get(chave)
+    if valor is not None:
+        return valor, True
+
+    with cache.lock(f"renovar:{chave}", timeout=lock_timeout, ttl=lock_timeout):
+        # Outra instância pode ter renovado enquanto esperávamos o lock
+        valor = cache.get(chave)
+        if valor is not None:
+            return valor, True
+
+        valor = calcular()
+        ttl = ttl_fn(valor)
+        if ttl > 0:
+            cache.set(chave, valor, ttl)
+        return valor, False
+
+
+_cache_padrao: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def criar_cache(backend: str, url: Optional[str] = None) -> CacheBackend:
+    """
+    Cria um backend de cache.
+
+    Args:
+        backend: 'memory', 'sqlite' ou 'redis'
+        url: Caminho do arquivo (sqlite) ou URL redis://
+    """
+    if backend == "memory":
+        return MemoryCache(max_entradas=int(os.environ.get(ENV_MAX_ENTRADAS, 10000)))
+    if backend == "sqlite":
+        return SQLiteCache(url or CAMINHO_SQLITE_PADRAO)
+    if backend == "redis":
+        if not url:
+            raise ValueError(f"{ENV_URL} obrigatória para o backend redis")
+        return RedisCache(url)
+    raise ValueError(f"Backend de cache inválido: '{backend}'. Use memory, sqlite ou redis.")
+
+
+def obter_cache() -> CacheBackend:
+    """Retorna o cache compartilhado do processo (configurado por ambiente)."""
+    global _cache_padrao
+    with _cache_lock:
+        if _cache_padrao is None:
+            _cache_padrao = criar_cache(
+                os.environ.get(ENV_BACKEND, "memory").lower(),
+                os.environ.get(ENV_URL)
+            )
+        return _cache_padrao
@@ -0,0 +1,309 @@
+"""
+Gravação e reprodução (cassete) do tráfego com a API SERPRO.
+
+- Modo 'gravar': envolve o transporte real e acrescenta cada par
+  requisição/resposta, já sanitizado, a um arquivo JSON Lines (uma linha
+  por chamada, somente acréscimo). Headers e dados de 304 (ETag/Expires)
+  são preservados.
+- Modo 'reproduzir': responde a partir do cassete, sem rede, respeitando a
+  latência original de cada chamada. Permite medir mudanças em
+  business_logic.py de forma determinística com o formato real do tráfego.
+
+Configuração por ambiente:
+    SERPRO_CASSETE_MODO=gravar|reproduzir
+    SERPRO_CASSETE_ARQUIVO=/tmp/serpro_cassete.jsonl
+    SERPRO_CASSETE_FATOR_LATENCIA=1.0  (0 reproduz sem espera)
+
+Sanitização: tokens (Authorization, jwt_token, procurador), tokens de
+resposta e o ETag viram marcadores fixos; números de CPF/CNPJ têm os
+dígitos zerados. O cassete pode ser compartilhado sem expor credenciais.
+
+Na reprodução de tráfego de produção o cliente ainda precisa de um
+certificado (qualquer um, ex.: autoassinado) para montar as chaves de cache.
+"""
+
+import os
+import time
+import base64
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from src.dados_codec import carregar_json, serializar_json
+from src.deadline import DeadlineExcedidoError
+from src.transport import RespostaHttp, Transport
+
+MODO_GRAVAR = "gravar"
+MODO_REPRODUZIR = "reproduzir"
+
+ARQUIVO_PADRAO = "/tmp/serpro_cassete.jsonl"
+
+# Headers cujo valor nunca vai para o cassete
+HEADERS_SENSIVEIS = ("authorization", "jwt_token", "autenticar_procurador_token", "set-cookie")
+
+# Campos JSON com credenciais (requisição e resposta)
+CAMPOS_SENSIVEIS = (
+    "access_token", "jwt_token", "refresh_token", "id_token",
+    "autenticarProcuradorToken", "procurador_token",
+)
+
+# Campos com CPF/CNPJ
+CAMPOS_DOCUMENTO = ("numero", "cpf", "cnpj", "ni", "cpfCnpj")
+
+MARCADOR = "***"
+# Mantém o formato de UUID esperado pelo tratamento do 304 no MtlsClient
+TOKEN_FICTICIO = "00000000-0000-0000-0000-000000000000"
+
+
+class CasseteSemGravacaoError(LookupError):
+    """Nenhuma gravação no cassete corresponde à requisição."""
+
+
+def _mascarar_documento(valor: Any) -> Any:
+    """Zera os dígitos de CPF/CNPJ mantendo tamanho e pontuação."""
+    if isinstance(valor, str):
+        return "".join("0" if c.isdigit() else c for c in valor)
+    if isinstance(valor, int):
+        return 0
+    return valor
+
+
+def sanitizar(valor: Any) -> Any:
+    """Remove credenciais e documentos de uma estrutura JSON (recursivo)."""
+    if isinstance(valor, dict):
+        resultado = {}
+        for chave, conteudo in valor.items():
+            if chave in CAMPOS_SENSIVEIS and conteudo:
+                resultado[chave] = TOKEN_FICTICIO
+            elif chave in CAMPOS_DOCUMENTO:
+                resultado[chave] = _mascarar_documento(conteudo)
+            elif chave == "dados" and isinstance(conteudo, str):
+                resultado[chave] = _sanitizar_texto_json(conteudo)
+            else:
+                resultado[chave] = sanitizar(conteudo)
+        return resultado
+    if isinstance(valor, list):
+        return [sanitizar(item) for item in valor]
+    return valor
+
+
+def _sanitizar_texto_json(texto: str) -> str:
+    """Sanitiza `dados` (string JSON dentro do envelope); texto livre é mantido."""
+    try:
+        estrutura = carregar_json(texto)
+    except ValueError:
+        return texto
+    if not isinstance(estrutura, (dict, list)):
+        return texto
+    return serializar_json(sanitizar(estrutura)).decode("utf-8")
+
+
+def _sanitizar_corpo(corpo: bytes) -> bytes:
+    """Sanitiza corpo JSON; outros formatos (form, binário) são mantidos."""
+    try:
+        estrutura = carregar_json(corpo)
+    except ValueError:
+        return corpo
+    return serializar_json(sanitizar(estrutura))
+
+
+def _sanitizar_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    resultado = {}
+    for chave, valor in headers.items():
+        chave = chave.lower()
+        if chave in HEADERS_SENSIVEIS:
+            valor = MARCADOR
+        elif chave == "etag":
+            # ETag do 304 carrega o token de procurador ("prefixo:UUID")
+            valor = f'"autenticar_procurador_token:{TOKEN_FICTICIO}"'
+        resultado[chave] = valor
+    return resultado
+
+
+def _codificar_corpo(corpo: bytes) -> Dict[str, str]:
+    """Texto UTF-8 fica legível; binário vai em Base64."""
+    try:
+        return {"corpo": corpo.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"corpo_b64": base64.b64encode(corpo).decode("ascii")}
+
+
+def _decodificar_corpo(registro: Dict[str, Any]) -> bytes:
+    if "corpo_b64" in registro:
+        return base64.b64decode(registro["corpo_b64"])
+    return registro.get("corpo", "").encode("utf-8")
+
+
+def _servico(corpo: bytes) -> str:
+    """idSistema/idServico do pedido (vazio para autenticação)."""
+    try:
+        pedido = carregar_json(corpo).get("pedidoDados") or {}
+    except (ValueError, AttributeError):
+        return ""
+    return f"{pedido.get('idSistema', '')}/{pedido.get('idServico', '')}"
+
+
+def _chaves(url: str, corpo_sanitizado: bytes) -> Tuple[str, str, str]:
+    """Chaves de correspondência, da mais específica para a mais genérica."""
+    caminho = urlsplit(url).path
+    servico = _servico(corpo_sanitizado)
+    exata = hashlib.sha256(caminho.encode() + b"\x1f" + corpo_sanitizado).hexdigest()
+    return exata, f"{caminho}|{servico}", caminho
+
+
+class GravadorTransport(Transport):
+    """Encaminha ao transporte real e grava cada chamada no cassete."""
+
+    nome = "gravar"
+
+    def __init__(self, interno: Transport, caminho: str = ARQUIVO_PADRAO):
+        super().__init__()
+        self.interno = interno
+        self.caminho = caminho
+        self._arquivo_lock = threading.Lock()
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        inicio = time.perf_counter()
+        resposta = self.interno.post(url, headers, body, identidade=identidade, timeout=timeout)
+        latencia = time.perf_counter() - inicio
+
+        corpo_requisicao = _sanitizar_corpo(body)
+        registro = {
+            "url": url,
+            "servico": _servico(corpo_requisicao),
+            "latencia_ms": round(latencia * 1000, 1),
+            "requisicao": {
+                "headers": _sanitizar_headers(headers),
+                **_codificar_corpo(corpo_requisicao),
+            },
+            "resposta": {
+                "status": resposta.status_code,
+                "reason": resposta.reason,
+                "http_version": resposta.http_version,
+                "headers": _sanitizar_headers(resposta.headers),
+                **_codificar_corpo(_sanitizar_corpo(resposta.content)),
+            },
+        }
+        linha = serializar_json(registro) + b"\n"
+        with self._arquivo_lock:
+            # Uma escrita por linha em modo append: o arquivo só cresce
+            with open(self.caminho, "ab") as arquivo:
+                arquivo.write(linha)
+        self._contar("gravadas")
+        return resposta
+
+    def estatisticas(self) -> Dict[str, Any]:
+        resultado = super().estatisticas()
+        resultado["interno"] = self.interno.estatisticas()
+        return resultado
+
+    def close(self):
+        self.interno.close()
+
+
+class ReprodutorTransport(Transport):
+    """
+    Responde a partir do cassete, sem rede.
+
+    A correspondência procura, nesta ordem: mesmo caminho e corpo
+    sanitizado; mesmo caminho e serviço; mesmo caminho. Havendo várias
+    gravações para a chave, elas são usadas em rodízio.
+    """
+
+    nome = "reproduzir"
+
+    def __init__(self, caminho: str = ARQUIVO_PADRAO, fator_latencia: float = 1.0):
+        """
+        Args:
+            caminho: Arquivo do cassete
+            fator_latencia: Multiplicador da latência gravada (0 = sem espera)
+        """
+        super().__init__()
+        self.fator_latencia = fator_latencia
+        self._indices: List[Dict[str, List[Dict[str, Any]]]] = [defaultdict(list) for _ in range(3)]
+        self._posicoes: Dict[Tuple[int, str], int] = defaultdict(int)
+        self._carregar(caminho)
+
+    def _carregar(self, caminho: str):
+        with open(caminho, "rb") as arquivo:
+            for linha in arquivo:
+                if not linha.strip():
+                    continue
+                registro = carregar_json(linha)
+                corpo = _decodificar_corpo(registro["requisicao"])
+                for indice, chave in zip(self._indices, _chaves(registro["url"], corpo)):
+                    indice[chave].append(registro)
+
+    def _encontrar(self, url: str, body: bytes) -> Dict[str, Any]:
+        chaves = _chaves(url, _sanitizar_corpo(body))
+        with self._lock:
+            for nivel, (indice, chave) in enumerate(zip(self._indices, chaves)):
+                gravacoes = indice.get(chave)
+                if gravacoes:
+                    posicao = self._posicoes[(nivel, chave)]
+                    self._posicoes[(nivel, chave)] = posicao + 1
+                    self._estatisticas[f"correspondencia_{nivel}"] = (
+                        self._estatisticas.get(f"correspondencia_{nivel}", 0) + 1
+                    )
+                    return gravacoes[posicao % len(gravacoes)]
+        raise CasseteSemGravacaoError(f"Nenhuma gravação para {urlsplit(url).path}")
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        registro = self._encontrar(url, body)
+
+        espera = registro["latencia_ms"] / 1000 * self.fator_latencia
+        limite = timeout[1] if isinstance(timeout, tuple) else timeout
+        if limite is not None and espera > limite:
+            # Reproduz também o estouro de prazo que a latência real causaria
+            time.sleep(limite)
+            raise DeadlineExcedidoError("leitura")
+        if espera > 0:
+            time.sleep(espera)
+
+        resposta = registro["resposta"]
+        return RespostaHttp(
+            status_code=resposta["status"],
+            headers=resposta["headers"],
+            content=_decodificar_corpo(resposta),
+            reason=resposta.get("reason", ""),
+            http_version=resposta.get("http_version", "HTTP/1.1")
+        )
+
+
+_cassete: Optional[Transport] = None
+_cassete_lock = threading.Lock()
+
+
+def obter_cassete(interno: Optional[Transport] = None) -> Optional[Transport]:
+    """
+    Transporte de cassete configurado por ambiente, ou None se desligado.
+
+    Args:
+        interno: Transporte real usado no modo 'gravar'
+    """
+    modo = os.environ.get("SERPRO_CASSETE_MODO", "").lower()
+    if not modo:
+        return None
+
+    global _cassete
+    with _cassete_lock:
+        if _cassete is None:
+            caminho = os.environ.get("SERPRO_CASSETE_ARQUIVO", ARQUIVO_PADRAO)
+            if modo == MODO_GRAVAR:
+                if interno is None:
+                    raise ValueError("Modo 'gravar' requer o transporte real")
+                _cassete = GravadorTransport(interno, caminho)
+            elif modo == MODO_REPRODUZIR:
+                _cassete = ReprodutorTransport(
+                    caminho,
+                    fator_latencia=float(os.environ.get("SERPRO_CASSETE_FATOR_LATENCIA", 1.0))
+                )
+            else:
+                raise ValueError(
+                    f"SERPRO_CASSETE_MODO inválido: '{modo}'. Use '{MODO_GRAVAR}' ou '{MODO_REPRODUZIR}'."
+                )
+        return _cassete
@@ -0,0 +1,284 @@
+"""
+Registro de certificados digitais no servidor.
+
+O cliente registra o certificado P12 uma única vez e recebe um handle
+opaco. As requisições seguintes enviam apenas `certificado_handle`,
+evitando reenviar o P12 (vários KB) e decodificá-lo a cada chamada.
+
+A identidade já extraída (chave + certificado em PEM) fica cifrada em
+memória e, opcionalmente, em disco, com expiração.
+"""
+
+import os
+import json
+import logging
+import time
+import hashlib
+import secrets
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.hazmat.backends import default_backend
+
+from src.encryption import ENV_CHAVE, Cifrador, obter_cifrador
+
+logger = logging.getLogger(__name__)
+
+# Variáveis de ambiente
+ENV_DIRETORIO = "SERPRO_CERT_REGISTRY_DIR"
+ENV_TTL = "SERPRO_CERT_REGISTRY_TTL"
+
+# Validade padrão de um registro (12 horas)
+TTL_PADRAO = 12 * 60 * 60
+
+
+class CertificadoNaoRegistradoError(ValueError):
+    """Handle desconhecido ou expirado: o cliente deve registrar novamente."""
+
+
+@dataclass(frozen=True)
+class CertificateIdentity:
+    """Identidade mTLS já extraída de um P12."""
+
+    fingerprint: str
+    cert_pem: bytes
+    key_pem: bytes
+    titular: str
+    valido_ate: Optional[str] = None
+
+    @classmethod
+    def from_p12(cls, p12_bytes: bytes, password: Optional[str]) -> "CertificateIdentity":
+        """
+        Extrai chave privada e certificado de um arquivo P12.
+
+        Raises:
+            ValueError: Se o P12 for inválido ou a senha estiver incorreta
+        """
+        private_key, certificate, _ = pkcs12.load_key_and_certificates(
+            p12_bytes,
+            password.encode() if password else None,
+            default_backend()
+        )
+        if private_key is None or certificate is None:
+            raise ValueError("Certificado P12 sem chave privada ou certificado")
+
+        try:
+            valido_ate = certificate.not_valid_after_utc.isoformat()
+        except AttributeError:
+            # cryptography < 42
+            valido_ate = certificate.not_valid_after.replace(tzinfo=timezone.utc).isoformat()
+
+        return cls(
+            fingerprint=hashlib.sha256(
+                certificate.public_bytes(serialization.Encoding.DER)
+            ).hexdigest(),
+            cert_pem=certificate.public_bytes(serialization.Encoding.PEM),
+            key_pem=private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ),
+            titular=certificate.subject.rfc4514_string(),
+            valido_ate=valido_ate
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serializa a identidade (para cifragem)."""
+        return json.dumps({
+            "fingerprint": self.fingerprint,
+            "cert_pem": self.cert_pem.decode(),
+            "key_pem": self.key_pem.decode(),
+            "titular": self.titular,
+            "valido_ate": self.valido_ate,
+        }).encode()
+
+    @classmethod
+    def from_bytes(cls, dados: bytes) -> "CertificateIdentity":
+        """Reconstrói a identidade serializada por to_bytes()."""
+        valores = json.loads(dados)
+        return cls(
+            fingerprint=valores["fingerprint"],
+            cert_pem=valores["cert_pem"].encode(),
+            key_pem=valores["key_pem"].encode(),
+            titular=valores["titular"],
+            valido_ate=valores.get("valido_ate")
+        )
+
+
+class CertificateRegistry:
+    """Armazena identidades cifradas indexadas por handle opaco."""
+
+    def __init__(
+        self,
+        cifrador: Optional[Cifrador] = None,
+        diretorio: Optional[str] = None,
+        ttl_padrao: int = TTL_PADRAO
+    ):
+        """
+        Inicializa o registro.
+
+        Args:
+            cifrador: Cifrador dos registros (padrão: cifrador do processo)
+            diretorio: Diretório para persistir registros cifrados (opcional)
+            ttl_padrao: Validade padrão de um registro em segundos
+        """
+        self._cifrador = cifrador or obter_cifrador()
+        if diretorio and self._cifrador.efemero:
+            # Registros gravados com chave efêmera seriam ilegíveis após um restart
+            logger.warning(
+                "%s definido sem %s: registros ficam só em memória", ENV_DIRETORIO, ENV_CHAVE
+            )
+            diretorio = None
+        self._diretorio = diretorio
+        self._ttl_padrao = ttl_padrao
+        self._registros: Dict[str, Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+        if diretorio:
+            os.makedirs(diretorio, mode=0o700, exist_ok=True)
+
+    def _caminho(self, handle: str) -> str:
+        """Arquivo de persistência do handle."""
+        return os.path.join(self._diretorio, f"{handle}.cert")
+
+    def registrar(
+        self,
+        identidade: CertificateIdentity,
+        ttl: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Registra uma identidade e devolve o handle.
+
+        Args:
+            identidade: Identidade extraída do P12
+            ttl: Validade em segundos (padrão: ttl_padrao)
+
+        Returns:
+            Dict com certificado_handle, fingerprint, titular e expira_em
+        """
+        handle = secrets.token_urlsafe(32)
+        expira_em = time.time() + (ttl or self._ttl_padrao)
+        token = self._cifrador.cifrar(identidade.to_bytes())
+
+        with self._lock:
+            self._remover_expirados()
+            self._registros[handle] = (token, expira_em)
+
+        if self._diretorio:
+            fd = os.open(self._caminho(handle), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": token.decode(), "expira_em": expira_em}, f)
+
+        return {
+            "certificado_handle": handle,
+            "fingerprint": identidade.fingerprint,
+            "titular": identidade.titular,
+            "valido_ate": identidade.valido_ate,
+            "expira_em": datetime.fromtimestamp(expira_em, timezone.utc).isoformat(),
+        }
+
+    def obter(self, handle: str) -> CertificateIdentity:
+        """
+        Obtém a identidade registrada.
+
+        Raises:
+            CertificadoNaoRegistradoError: Se o handle for desconhecido ou expirado
+        """
+        with self._lock:
+            registro = self._registros.get(handle)
+
+        if registro is None and self._diretorio:
+            registro = self._carregar_do_disco(handle)
+
+        if registro is None or registro[1] < time.time():
+            self.remover(handle)
+            raise CertificadoNaoRegistradoError(
+                "certificado_handle desconhecido ou expirado. Registre o certificado novamente."
+            )
+
+        try:
+            return CertificateIdentity.from_bytes(self._cifrador.decifrar(registro[0]))
+        except ValueError:
+            # Cifrado com outra chave (ex.: SERPRO_CHAVE_CIFRAGEM trocada): registrar de novo
+            self.remover(handle)
+            raise CertificadoNaoRegistradoError(
+                "certificado_handle ilegível com a chave atual. Registre o certificado novamente."
+            )
+
+    def remover(self, handle: str) -> bool:
+        """Remove um registro. Retorna True se existia."""
+        with self._lock:
+            existia = self._registros.pop(handle, None) is not None
+
+        if self._diretorio and _handle_valido(handle):
+            caminho = self._caminho(handle)
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+                existia = True
+        return existia
+
+    def identidades(self) -> List[CertificateIdentity]:
+        """Identidades registradas e não expiradas (inclusive as persistidas em disco)."""
+        if self._diretorio:
+            for nome in os.listdir(self._diretorio):
+                handle = nome[:-len(".cert")]
+                if nome.endswith(".cert") and handle not in self._registros:
+                    self._carregar_do_disco(handle)
+
+        agora = time.time()
+        with self._lock:
+            tokens = [token for token, expira in self._registros.values() if expira >= agora]
+
+        unicas: Dict[str, CertificateIdentity] = {}
+        for token in tokens:
+            try:
+                identidade = CertificateIdentity.from_bytes(self._cifrador.decifrar(token))
+            except ValueError:
+                continue
+            unicas.setdefault(identidade.fingerprint, identidade)
+        return list(unicas.values())
+
+    def _carregar_do_disco(self, handle: str) -> Optional[Tuple[bytes, float]]:
+        """Carrega registro persistido por outra execução do processo."""
+        if not _handle_valido(handle):
+            return None
+        caminho = self._caminho(handle)
+        if not os.path.exists(caminho):
+            return None
+
+        with open(caminho) as f:
+            valores = json.load(f)
+        registro = (valores["token"].encode(), valores["expira_em"])
+
+        with self._lock:
+            self._registros[handle] = registro
+        return registro
+
+    def _remover_expirados(self):
+        """Descarta registros vencidos (chamado com o lock adquirido)."""
+        agora = time.time()
+        for handle in [h for h, (_, expira) in self._registros.items() if expira < agora]:
+            del self._registros[handle]
+
+
+def _handle_valido(handle: str) -> bool:
+    """Evita path traversal ao montar o caminho do arquivo."""
+    return bool(handle) and all(c.isalnum() or c in "-_" for c in handle)
+
+
+_registro_padrao: Optional[CertificateRegistry] = None
+
+
+def obter_registro() -> CertificateRegistry:
+    """Retorna o registro compartilhado do processo (configurado por ambiente)."""
+    global _registro_padrao
+    if _registro_padrao is None:
+        _registro_padrao = CertificateRegistry(
+            diretorio=os.environ.get(ENV_DIRETORIO) or None,
+            ttl_padrao=int(os.environ.get(ENV_TTL, TTL_PADRAO))
+        )
+    return _registro_padrao
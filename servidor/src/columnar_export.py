@@ -0,0 +1,351 @@
+"""
+Exportação colunar de resultados em massa (jobs de fan-out).
+
+Cada item vira uma linha com os campos do envelope SERPRO achatados
+(status, idSistema, idServico, contribuinte, mensagens) e, opcionalmente,
+o `dados` já decodificado e achatado em colunas `dados.<caminho>`.
+
+Formatos:
+    parquet  (pyarrow; um row group por bloco)
+    arrow    (Arrow IPC stream; um record batch por bloco)
+    csv      (sempre disponível; fallback quando pyarrow não está instalado)
+
+Os itens são lidos e gravados em blocos: o pico de memória depende do
+tamanho do bloco, não do número de contribuintes. Com `dados`, uma
+primeira passada descobre as colunas e seus tipos (o esquema Parquet/Arrow
+é fixo), e a segunda grava. A saída vai para um arquivo temporário e é
+entregue em streaming.
+"""
+
+import csv
+import io
+import logging
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.dados_codec import decodificar_dados, serializar_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+FORMATO_PARQUET = "parquet"
+FORMATO_ARROW = "arrow"
+FORMATO_CSV = "csv"
+FORMATOS_EXPORTACAO = (FORMATO_PARQUET, FORMATO_ARROW, FORMATO_CSV)
+
+_CONTENT_TYPES = {
+    FORMATO_PARQUET: "application/vnd.apache.parquet",
+    FORMATO_ARROW: "application/vnd.apache.arrow.stream",
+    FORMATO_CSV: "text/csv; charset=utf-8",
+}
+
+TAMANHO_BLOCO_PADRAO = 1000
+# Colunas de `dados` além deste limite ficam agrupadas em `dados_extra` (JSON)
+MAX_COLUNAS_DADOS = 200
+# Acima disto o arquivo temporário sai da memória para o disco
+LIMITE_MEMORIA_ARQUIVO = 8 * 1024 * 1024
+TAMANHO_LEITURA = 64 * 1024
+
+# Colunas fixas: (nome, tipo)
+COLUNAS_ENVELOPE = (
+    ("indice", "int"),
+    ("contribuinte", "str"),
+    ("estado", "str"),
+    ("tentativas", "int"),
+    ("erro", "str"),
+    ("status", "int"),
+    ("id_sistema", "str"),
+    ("id_servico", "str"),
+    ("versao_sistema", "str"),
+    ("response_id", "str"),
+    ("mensagens_codigos", "str"),
+    ("mensagens_textos", "str"),
+)
+
+
+def resolver_formato(formato: Optional[str]) -> str:
+    """
+    Formato efetivo da exportação.
+
+    Sem pyarrow, parquet/arrow caem para csv (com aviso no log).
+
+    Raises:
+        ValueError: Formato desconhecido
+    """
+    formato = (formato or (FORMATO_PARQUET if HAS_PYARROW else FORMATO_CSV)).lower()
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"formato inválido: '{formato}'. Use {', '.join(FORMATOS_EXPORTACAO)}.")
+    if formato != FORMATO_CSV and not HAS_PYARROW:
+        logger.warning("pyarrow não instalado: exportação em csv em vez de %s", formato)
+        return FORMATO_CSV
+    return formato
+
+
+def achatar(valor: Any, prefixo: str, destino: Dict[str, Any]):
+    """Achata objetos em chaves com ponto; listas viram JSON."""
+    if isinstance(valor, dict):
+        for chave, item in valor.items():
+            achatar(item, f"{prefixo}.{chave}", destino)
+    elif isinstance(valor, list):
+        destino[prefixo] = serializar_json(valor).decode("utf-8")
+    else:
+        destino[prefixo] = valor
+
+
+def linha_do_item(
+    item: Dict[str, Any],
+    pedido: Dict[str, Any],
+    incluir_dados: bool = False
+) -> Dict[str, Any]:
+    """
+    Linha achatada de um item de job.
+
+    Args:
+        item: Item (indice, contribuinte, estado, tentativas, erro, resultado)
+        pedido: pedidoDados do template (idSistema, idServico, versaoSistema)
+        incluir_dados: Se True, acrescenta `dados` decodificado em colunas
+    """
+    resultado = item.get("resultado") or {}
+    mensagens = resultado.get("mensagens") or []
+    linha = {
+        "indice": item.get("indice"),
+        "contribuinte": item.get("contribuinte"),
+        "estado": item.get("estado"),
+        "tentativas": item.get("tentativas"),
+        "erro": item.get("erro"),
+        "status": resultado.get("status"),
+        "id_sistema": pedido.get("idSistema"),
+        "id_servico": pedido.get("idServico"),
+        "versao_sistema": pedido.get("versaoSistema"),
+        "response_id": resultado.get("responseId"),
+        "mensagens_codigos": " | ".join(str(m.get("codigo", "")) for m in mensagens if isinstance(m, dict)) or None,
+        "mensagens_textos": " | ".join(str(m.get("texto", "")) for m in mensagens if isinstance(m, dict)) or None,
+    }
+    if incluir_dados and resultado.get("dados") not in (None, ""):
+        try:
+            dados = decodificar_dados(resultado["dados"])
+        except ValueError:
+            dados = resultado["dados"]
+        achatar(dados, "dados", linha)
+    return linha
+
+
+def _tipo_de(valor: Any) -> str:
+    if isinstance(valor, bool):
+        return "bool"
+    if isinstance(valor, int):
+        return "int"
+    if isinstance(valor, float):
+        return "float"
+    return "str"
+
+
+def _combinar_tipos(atual: Optional[str], novo: str) -> str:
+    if atual is None or atual == novo:
+        return novo
+    if {atual, novo} == {"int", "float"}:
+        return "float"
+    return "str"
+
+
+def descobrir_colunas_dados(linhas: Iterable[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    Colunas `dados.*` presentes nas linhas e o tipo comum de cada uma.
+
+    Tipos divergentes entre contribuintes viram texto; int+float viram float.
+    """
+    tipos: Dict[str, Optional[str]] = {}
+    for linha in linhas:
+        for chave, valor in linha.items():
+            if not chave.startswith("dados"):
+                continue
+            if valor is None:
+                tipos.setdefault(chave, None)
+            else:
+                tipos[chave] = _combinar_tipos(tipos.get(chave), _tipo_de(valor))
+    colunas = [(chave, tipo or "str") for chave, tipo in tipos.items()]
+    if len(colunas) > MAX_COLUNAS_DADOS:
+        colunas = colunas[:MAX_COLUNAS_DADOS] + [("dados_extra", "str")]
+    return colunas
+
+
+def _normalizar(valor: Any, tipo: str) -> Any:
+    """Converte o valor para o tipo da coluna (None permanece None)."""
+    if valor is None:
+        return None
+    if tipo == "str":
+        if isinstance(valor, str):
+            return valor
+        if isinstance(valor, bool):
+            return "true" if valor else "false"
+        return str(valor)
+    if tipo == "float":
+        return float(valor)
+    return valor
+
+
+class _EscritorCsv:
+    def __init__(self, arquivo, colunas: List[Tuple[str, str]]):
+        self._texto = io.TextIOWrapper(arquivo, encoding="utf-8", newline="", write_through=True)
+        self._nomes = [nome for nome, _ in colunas]
+        self._writer = csv.writer(self._texto)
+        self._writer.writerow(self._nomes)
+
+    def escrever(self, colunas: Dict[str, List[Any]]):
+        self._writer.writerows(zip(*(colunas[nome] for nome in self._nomes)))
+
+    def fechar(self):
+        self._texto.flush()
+        # O arquivo continua aberto para a leitura
+        self._texto.detach()
+
+
+class _SemFechar:
+    """Repassa escritas ao arquivo, mas ignora close() (pyarrow fecha o destino)."""
+
+    closed = False
+
+    def __init__(self, arquivo):
+        self._arquivo = arquivo
+
+    def write(self, dados) -> int:
+        return self._arquivo.write(dados)
+
+    def tell(self) -> int:
+        return self._arquivo.tell()
+
+    def flush(self):
+        self._arquivo.flush()
+
+    def close(self):
+        self.closed = True
+
+
+class _EscritorArrow:
+    _TIPOS = {"int": "int64", "float": "float64", "bool": "bool_", "str": "string"}
+
+    def __init__(self, arquivo, colunas: List[Tuple[str, str]], formato: str):
+        arquivo = _SemFechar(arquivo)
+        self._esquema = pa.schema([(nome, getattr(pa, self._TIPOS[tipo])()) for nome, tipo in colunas])
+        if formato == FORMATO_PARQUET:
+            self._writer = pq.ParquetWriter(arquivo, self._esquema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(arquivo, self._esquema)
+
+    def escrever(self, colunas: Dict[str, List[Any]]):
+        lote = pa.record_batch(
+            [pa.array(colunas[campo.name], type=campo.type) for campo in self._esquema],
+            schema=self._esquema
+        )
+        self._writer.write_batch(lote)
+
+    def fechar(self):
+        self._writer.close()
+
+
+class ExportacaoColunar:
+    """Resultado exportado, pronto para streaming (interface de DocumentoBinario)."""
+
+    def __init__(self, arquivo, formato: str, nome_arquivo: str, linhas: int):
+        self._arquivo = arquivo
+        self.formato = formato
+        self.nome_arquivo = nome_arquivo
+        self.linhas = linhas
+        self.media_type = _CONTENT_TYPES[formato]
+        self._arquivo.seek(0, io.SEEK_END)
+        self.tamanho = self._arquivo.tell()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers HTTP da resposta."""
+        return {
+            "Content-Type": self.media_type,
+            "Content-Disposition": f'attachment; filename="{self.nome_arquivo}"',
+            "Content-Length": str(self.tamanho),
+            "X-Linhas": str(self.linhas),
+        }
+
+    def iter_conteudo(self, tamanho_bloco: int = TAMANHO_LEITURA) -> Iterator[bytes]:
+        """Gera o arquivo em blocos e o descarta ao final."""
+        try:
+            self._arquivo.seek(0)
+            while True:
+                bloco = self._arquivo.read(tamanho_bloco)
+                if not bloco:
+                    return
+                yield bloco
+        finally:
+            self._arquivo.close()
+
+
+def exportar(
+    itens: Callable[[], Iterable[Dict[str, Any]]],
+    pedido: Dict[str, Any],
+    formato: Optional[str] = None,
+    incluir_dados: bool = False,
+    nome_base: str = "resultados",
+    tamanho_bloco: int = TAMANHO_BLOCO_PADRAO
+) -> ExportacaoColunar:
+    """
+    Exporta itens de resultado em formato colunar.
+
+    Args:
+        itens: Fábrica de iteradores de itens (chamada duas vezes com
+            `incluir_dados`: descoberta de colunas e gravação)
+        pedido: pedidoDados comum aos itens (idSistema, idServico, versaoSistema)
+        formato: parquet, arrow ou csv (padrão: parquet se pyarrow instalado)
+        incluir_dados: Acrescenta `dados` decodificado em colunas
+        nome_base: Nome do arquivo sem extensão
+        tamanho_bloco: Linhas por bloco (row group / record batch)
+
+    Raises:
+        ValueError: Formato inválido
+    """
+    formato = resolver_formato(formato)
+    colunas = list(COLUNAS_ENVELOPE)
+    colunas_dados: List[Tuple[str, str]] = []
+    if incluir_dados:
+        colunas_dados = descobrir_colunas_dados(
+            linha_do_item(item, pedido, True) for item in itens()
+        )
+        colunas += colunas_dados
+    conhecidas = {nome for nome, _ in colunas}
+
+    arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_ARQUIVO)
+    escritor = _EscritorCsv(arquivo, colunas) if formato == FORMATO_CSV else _EscritorArrow(arquivo, colunas, formato)
+
+    def gravar(bloco: List[Dict[str, Any]]):
+        escritor.escrever({
+            nome: [_normalizar(linha.get(nome), tipo) for linha in bloco]
+            for nome, tipo in colunas
+        })
+
+    total = 0
+    bloco: List[Dict[str, Any]] = []
+    try:
+        for item in itens():
+            linha = linha_do_item(item, pedido, incluir_dados)
+            if colunas_dados and colunas_dados[-1][0] == "dados_extra":
+                extras = {k: v for k, v in linha.items() if k.startswith("dados.") and k not in conhecidas}
+                linha["dados_extra"] = serializar_json(extras).decode("utf-8") if extras else None
+            bloco.append(linha)
+            if len(bloco) >= tamanho_bloco:
+                gravar(bloco)
+                total += len(bloco)
+                bloco = []
+        if bloco or total == 0:
+            gravar(bloco)
+            total += len(bloco)
+        escritor.fechar()
+    except Exception:
+        arquivo.close()
+        raise
+
+    extensao = "arrows" if formato == FORMATO_ARROW else formato
+    return ExportacaoColunar(arquivo, formato, f"{nome_base}.{extensao}", total)
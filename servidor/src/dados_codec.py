@@ -0,0 +1,84 @@
+"""
+Codificação do campo `dados` das mensagens SERPRO.
+
+A API SERPRO trafega `pedidoDados.dados` e o `dados` da resposta como
+strings JSON dentro do envelope JSON. Este módulo centraliza a
+(de)serialização para que o servidor aceite `dados` estruturado, devolva
+`dados` já decodificado quando solicitado e use orjson quando disponível.
+"""
+
+import json
+from typing import Any, Dict, Union
+
+# Import condicional do orjson (opcional, mais rápido)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def carregar_json(conteudo: Union[str, bytes]) -> Any:
+    """
+    Decodifica JSON de str ou bytes.
+
+    Raises:
+        ValueError: Se o conteúdo não for JSON válido
+    """
+    if HAS_ORJSON:
+        return orjson.loads(conteudo)
+    if isinstance(conteudo, bytes):
+        conteudo = conteudo.decode("utf-8")
+    return json.loads(conteudo)
+
+
+def serializar_json(valor: Any) -> bytes:
+    """Codifica em JSON compacto UTF-8 (sem escapar acentos)."""
+    if HAS_ORJSON:
+        return orjson.dumps(valor)
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def codificar_dados(dados: Any) -> str:
+    """
+    Converte `dados` para a string JSON esperada pela API SERPRO.
+
+    Strings são mantidas como estão (já codificadas pelo cliente).
+    """
+    if isinstance(dados, str):
+        return dados
+    return serializar_json(dados).decode("utf-8")
+
+
+def decodificar_dados(dados: Any) -> Any:
+    """
+    Converte o `dados` da resposta em estrutura Python.
+
+    Retorna o valor original se não for uma string JSON válida
+    (ex.: string vazia ou texto simples).
+    """
+    if not isinstance(dados, str) or not dados:
+        return dados
+    try:
+        return carregar_json(dados)
+    except ValueError:
+        return dados
+
+
+def preparar_body(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Codifica `pedidoDados.dados` quando enviado como objeto.
+
+    Retorna uma cópia rasa do body apenas se houver alteração.
+    """
+    pedido = body.get("pedidoDados")
+    if not isinstance(pedido, dict) or "dados" not in pedido or isinstance(pedido["dados"], str):
+        return body
+    return {**body, "pedidoDados": {**pedido, "dados": codificar_dados(pedido["dados"])}}
+
+
+def decodificar_resposta(resposta: Dict[str, Any]) -> Dict[str, Any]:
+    """Substitui o `dados` da resposta pela estrutura decodificada."""
+    if "dados" in resposta:
+        resposta["dados"] = decodificar_dados(resposta["dados"])
+    return resposta
@@ -0,0 +1,149 @@
+"""
+Prazos (deadlines) de ponta a ponta por requisição.
+
+Cada requisição recebe um orçamento de tempo, vindo do header
+X-Request-Timeout (segundos) ou do padrão da rota. O orçamento é consumido
+pelas etapas (fila, Secret Manager, assinatura, autenticação, chamada
+SERPRO) e os timeouts de conexão/leitura de cada chamada de rede saem do
+que resta. Ao esgotar, a etapa seguinte não é iniciada e
+DeadlineExcedidoError é lançado (os wrappers respondem HTTP 504).
+
+Uma fração do orçamento (SERPRO_PRAZO_RESERVA, padrão 0.5) fica reservada
+à etapa final da rota (a chamada que atende a requisição): as etapas
+anteriores só usam o que sobra além da reserva, então uma autenticação
+lenta não consome o prazo inteiro. O timeout de leitura entregue ao
+transporte limita a resposta inteira, não só cada leitura do socket.
+"""
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+# Header opcional com o orçamento da requisição, em segundos
+HEADER_TIMEOUT = "X-Request-Timeout"
+
+# Orçamento padrão por rota (segundos); sobrescrito por SERPRO_PRAZO_<ROTA>
+PRAZOS_PADRAO: Dict[str, float] = {
+    "autenticar_serpro": 20.0,
+    "autenticar_procurador": 30.0,
+    "proxy_serpro": 30.0,
+}
+
+# Limites aceitos no header (evita orçamento absurdo vindo do cliente)
+PRAZO_MINIMO = 1.0
+PRAZO_MAXIMO = 120.0
+
+# Timeout máximo só para estabelecer conexão (TCP + TLS)
+CONNECT_TIMEOUT_MAXIMO = 5.0
+
+# Fração do orçamento reservada à etapa final (SERPRO_PRAZO_RESERVA)
+RESERVA_PADRAO = 0.5
+
+# Etapa(s) final(is) de cada rota: só elas usam a reserva
+ETAPAS_FINAIS: Dict[str, Tuple[str, ...]] = {
+    "autenticar_serpro": ("autenticacao",),
+    "autenticar_procurador": ("procurador", "serpro"),
+    "proxy_serpro": ("serpro",),
+}
+
+
+class DeadlineExcedidoError(TimeoutError):
+    """Prazo da requisição esgotado antes ou durante uma etapa."""
+
+    def __init__(self, etapa: str):
+        self.etapa = etapa
+        super().__init__(f"Prazo da requisição esgotado na etapa '{etapa}'")
+
+
+class Deadline:
+    """Orçamento de tempo de uma requisição."""
+
+    def __init__(
+        self,
+        orcamento: float,
+        etapas_finais: Tuple[str, ...] = (),
+        reserva: float = 0.0
+    ):
+        """
+        Args:
+            orcamento: Tempo total disponível em segundos
+            etapas_finais: Etapas que podem usar a reserva
+            reserva: Fração do orçamento guardada para as etapas finais
+        """
+        self.orcamento = orcamento
+        self.etapas_finais = etapas_finais
+        self.reserva = orcamento * reserva if etapas_finais else 0.0
+        self._limite = time.monotonic() + orcamento
+        self.etapas: Dict[str, float] = {}
+
+    def restante(self) -> float:
+        """Segundos restantes (pode ser negativo)."""
+        return self._limite - time.monotonic()
+
+    def disponivel(self, etapa: str) -> float:
+        """Segundos que a etapa pode usar (etapas não finais deixam a reserva)."""
+        if etapa in self.etapas_finais:
+            return self.restante()
+        return self.restante() - self.reserva
+
+    def verificar(self, etapa: str):
+        """
+        Garante que ainda há prazo para iniciar a etapa.
+
+        Raises:
+            DeadlineExcedidoError: Se o prazo da etapa já esgotou
+        """
+        if self.disponivel(etapa) <= 0:
+            raise DeadlineExcedidoError(etapa)
+
+    def timeouts(self, etapa: str) -> Tuple[float, float]:
+        """
+        Timeouts (connect, read) para uma chamada de rede da etapa.
+
+        O read é o tempo total da resposta (os transportes o aplicam à
+        leitura inteira).
+
+        Raises:
+            DeadlineExcedidoError: Se o prazo da etapa já esgotou
+        """
+        self.verificar(etapa)
+        disponivel = self.disponivel(etapa)
+        return min(CONNECT_TIMEOUT_MAXIMO, disponivel), disponivel
+
+    def registrar(self, etapa: str, inicio: float):
+        """Acumula a duração de uma etapa (diagnóstico de onde o prazo foi gasto)."""
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + (time.monotonic() - inicio)
+
+
+def prazo_da_rota(
+    rota: str,
+    cabecalho: Optional[str] = None,
+    padrao: Optional[float] = None
+) -> Deadline:
+    """
+    Cria o Deadline da requisição.
+
+    Precedência: header > SERPRO_PRAZO_<ROTA> > padrao (serviço) > padrão da rota.
+
+    Args:
+        rota: Nome da rota (ex: 'proxy_serpro')
+        cabecalho: Valor do header X-Request-Timeout, se enviado
+        padrao: Prazo padrão do serviço chamado (catálogo), se conhecido
+
+    Raises:
+        ValueError: Se o header não for numérico
+    """
+    orcamento = float(os.environ.get(
+        f"SERPRO_PRAZO_{rota.upper()}", padrao or PRAZOS_PADRAO.get(rota, 30.0)
+    ))
+    if cabecalho:
+        try:
+            orcamento = float(cabecalho)
+        except ValueError:
+            raise ValueError(f"{HEADER_TIMEOUT} inválido: '{cabecalho}'")
+        orcamento = max(PRAZO_MINIMO, min(PRAZO_MAXIMO, orcamento))
+    return Deadline(
+        orcamento,
+        etapas_finais=ETAPAS_FINAIS.get(rota, ()),
+        reserva=float(os.environ.get("SERPRO_PRAZO_RESERVA", RESERVA_PADRAO))
+    )
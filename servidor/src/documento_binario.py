@@ -0,0 +1,270 @@
+"""
+Entrega binária de documentos retornados pela API SERPRO.
+
+Serviços de emissão (DAS do PGMEI, certificado CCMEI, guias DCTFWeb, etc.)
+retornam o PDF como string Base64 dentro do campo `dados`. Este módulo
+extrai o documento no servidor e o entrega como binário, decodificando
+o Base64 em blocos para manter o pico de memória limitado.
+"""
+
+import re
+import base64
+import binascii
+import json
+import uuid
+from urllib.parse import quote
+from typing import Dict, Any, Optional, Iterator, List, Tuple
+
+from src.dados_codec import decodificar_dados
+
+# Formatos aceitos em `formato_resposta`
+FORMATO_JSON = "json"
+FORMATO_PDF = "pdf"
+FORMATO_MULTIPART = "multipart"
+FORMATOS_RESPOSTA = (FORMATO_JSON, FORMATO_PDF, FORMATO_MULTIPART)
+
+# Campos que carregam documentos Base64 nos retornos conhecidos (ordem de prioridade)
+CAMPOS_DOCUMENTO = (
+    "pdf",
+    "PDFByteArrayBase64",
+    "pdfDarf",
+    "pdfNotificacao",
+    "demonstrativoPdf",
+    "declaracaoPdf",
+    "reciboPdf",
+)
+
+# Tamanho padrão do bloco de saída (bytes decodificados)
+TAMANHO_BLOCO_PADRAO = 64 * 1024
+
+# Alfabeto Base64 com quebras de linha/espaços; '=' só no final
+_BASE64_VALIDO = re.compile(r"[A-Za-z0-9+/\r\n ]*(?:=[\r\n ]*){0,2}")
+_NOME_ARQUIVO_INVALIDO = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def validar_base64(conteudo: str):
+    """
+    Valida alfabeto e comprimento do Base64 sem decodificá-lo.
+
+    A decodificação acontece durante o streaming, depois do status 200 e
+    do Content-Length; por isso o conteúdo é conferido antes.
+
+    Raises:
+        ValueError: Se o conteúdo não for Base64 válido
+    """
+    if not _BASE64_VALIDO.fullmatch(conteudo):
+        raise ValueError("Documento Base64 inválido: caractere fora do alfabeto")
+    comprimento = len(conteudo) - conteudo.count("\n") - conteudo.count("\r") - conteudo.count(" ")
+    if comprimento % 4:
+        raise ValueError("Documento Base64 inválido: conteúdo truncado")
+
+
+def content_disposition(tipo: str, nome_arquivo: str) -> str:
+    """
+    Valor do Content-Disposition com o nome do arquivo escapado.
+
+    `filename` leva só caracteres seguros (sem aspas nem CR/LF); o nome
+    original segue em `filename*` (RFC 5987).
+    """
+    seguro = _NOME_ARQUIVO_INVALIDO.sub("_", nome_arquivo) or "documento.pdf"
+    return f"{tipo}; filename=\"{seguro}\"; filename*=UTF-8''{quote(nome_arquivo, safe='')}"
+
+
+def _localizar_documento(
+    dados: Any,
+    campos: Tuple[str, ...],
+    caminho: str = ""
+) -> Optional[Tuple[str, str]]:
+    """
+    Procura recursivamente o primeiro campo de documento preenchido.
+
+    Returns:
+        Tupla (caminho, conteudo_base64) ou None se não encontrado
+    """
+    if isinstance(dados, dict):
+        for campo in campos:
+            valor = dados.get(campo)
+            if isinstance(valor, str) and valor:
+                return f"{caminho}.{campo}" if caminho else campo, valor
+        for chave, valor in dados.items():
+            encontrado = _localizar_documento(
+                valor, campos, f"{caminho}.{chave}" if caminho else chave
+            )
+            if encontrado:
+                return encontrado
+    elif isinstance(dados, list):
+        for indice, item in enumerate(dados):
+            encontrado = _localizar_documento(item, campos, f"{caminho}[{indice}]")
+            if encontrado:
+                return encontrado
+    return None
+
+
+def _remover_documento(dados: Any, caminho: str) -> Any:
+    """Remove o documento dos metadados (o binário segue em outra parte)."""
+    partes: List[Any] = []
+    for trecho in caminho.replace("[", ".[").split("."):
+        if not trecho:
+            continue
+        partes.append(int(trecho[1:-1]) if trecho.startswith("[") else trecho)
+
+    alvo = dados
+    for parte in partes[:-1]:
+        alvo = alvo[parte]
+    alvo[partes[-1]] = None
+    return dados
+
+
+def decodificar_base64_incremental(
+    conteudo: str,
+    tamanho_bloco: int = TAMANHO_BLOCO_PADRAO
+) -> Iterator[bytes]:
+    """
+    Decodifica Base64 em blocos, sem materializar o binário inteiro.
+
+    Espaços e quebras de linha são ignorados. Cada fatia de entrada é
+    alinhada em múltiplos de 4 caracteres antes de decodificar.
+
+    Raises:
+        ValueError: Se o conteúdo não for Base64 válido
+    """
+    # 4 caracteres Base64 -> 3 bytes
+    tamanho_entrada = max(4, (tamanho_bloco // 3) * 4)
+    resto = ""
+    try:
+        for inicio in range(0, len(conteudo), tamanho_entrada):
+            fatia = resto + "".join(conteudo[inicio:inicio + tamanho_entrada].split())
+            alinhado = len(fatia) - (len(fatia) % 4)
+            resto = fatia[alinhado:]
+            if alinhado:
+                yield base64.b64decode(fatia[:alinhado], validate=True)
+        if resto:
+            raise ValueError("Conteúdo Base64 truncado")
+    except binascii.Error as e:
+        raise ValueError(f"Documento Base64 inválido: {e}")
+
+
+class DocumentoBinario:
+    """Documento extraído de uma resposta SERPRO, pronto para streaming."""
+
+    def __init__(
+        self,
+        conteudo_base64: str,
+        metadados: Dict[str, Any],
+        nome_arquivo: str = "documento.pdf",
+        content_type: str = "application/pdf",
+        formato: str = FORMATO_PDF
+    ):
+        """
+        Args:
+            conteudo_base64: Documento codificado em Base64
+            metadados: Envelope da resposta sem o documento
+            nome_arquivo: Nome sugerido no Content-Disposition
+            content_type: MIME type do documento
+            formato: 'pdf' (binário puro) ou 'multipart' (metadados + binário)
+
+        Raises:
+            ValueError: Se o conteúdo não for Base64 válido
+        """
+        validar_base64(conteudo_base64)
+        self._conteudo_base64 = conteudo_base64
+        self.metadados = metadados
+        self.nome_arquivo = nome_arquivo
+        self.content_type = content_type
+        self.formato = formato
+        self.boundary = uuid.uuid4().hex
+
+    @property
+    def tamanho(self) -> int:
+        """Tamanho exato do documento decodificado, calculado sem decodificar."""
+        texto = self._conteudo_base64
+        comprimento = len(texto) - texto.count("\n") - texto.count("\r") - texto.count(" ")
+        padding = 2 if texto.rstrip().endswith("==") else 1 if texto.rstrip().endswith("=") else 0
+        return (comprimento // 4) * 3 - padding
+
+    @property
+    def media_type(self) -> str:
+        """Content-Type da resposta HTTP."""
+        if self.formato == FORMATO_MULTIPART:
+            return f'multipart/mixed; boundary="{self.boundary}"'
+        return self.content_type
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers HTTP da resposta binária."""
+        headers = {
+            "Content-Type": self.media_type,
+            "X-Serpro-Status": str(self.metadados.get("status", "")),
+        }
+        if self.formato == FORMATO_PDF:
+            headers["Content-Disposition"] = content_disposition("inline", self.nome_arquivo)
+            headers["Content-Length"] = str(self.tamanho)
+        return headers
+
+    def iter_bytes(self, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO) -> Iterator[bytes]:
+        """Gera o documento decodificado em blocos."""
+        return decodificar_base64_incremental(self._conteudo_base64, tamanho_bloco)
+
+    def iter_multipart(self, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO) -> Iterator[bytes]:
+        """Gera corpo multipart/mixed: parte JSON com metadados + parte binária."""
+        delimitador = f"--{self.boundary}\r\n".encode()
+        yield delimitador
+        yield b"Content-Type: application/json; charset=utf-8\r\n\r\n"
+        yield json.dumps(self.metadados, ensure_ascii=False).encode("utf-8")
+        yield b"\r\n" + delimitador
+        yield (
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Disposition: {content_disposition('attachment', self.nome_arquivo)}\r\n"
+            f"Content-Length: {self.tamanho}\r\n\r\n"
+        ).encode()
+        yield from self.iter_bytes(tamanho_bloco)
+        yield f"\r\n--{self.boundary}--\r\n".encode()
+
+    def iter_conteudo(self, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO) -> Iterator[bytes]:
+        """Gera o corpo HTTP conforme o formato solicitado."""
+        if self.formato == FORMATO_MULTIPART:
+            return self.iter_multipart(tamanho_bloco)
+        return self.iter_bytes(tamanho_bloco)
+
+
+def extrair_documento(
+    resposta: Dict[str, Any],
+    formato: str,
+    campo_documento: Optional[str] = None,
+    nome_arquivo: Optional[str] = None
+) -> Optional[DocumentoBinario]:
+    """
+    Extrai o documento Base64 do campo `dados` de uma resposta SERPRO.
+
+    Args:
+        resposta: Resposta JSON da API SERPRO
+        formato: 'pdf' ou 'multipart'
+        campo_documento: Nome do campo a procurar (padrão: CAMPOS_DOCUMENTO)
+        nome_arquivo: Nome sugerido para o arquivo
+
+    Returns:
+        DocumentoBinario, ou None se a resposta não contiver documento
+        (ex.: erro de negócio em `mensagens` com `dados` vazio)
+    """
+    dados = decodificar_dados(resposta.get("dados"))
+    if not isinstance(dados, (dict, list)):
+        return None
+
+    campos = (campo_documento,) if campo_documento else CAMPOS_DOCUMENTO
+    encontrado = _localizar_documento(dados, campos)
+    if not encontrado:
+        return None
+
+    caminho, conteudo = encontrado
+    metadados = {chave: valor for chave, valor in resposta.items() if chave != "dados"}
+    metadados["dados"] = _remover_documento(dados, caminho)
+    metadados["documento"] = {"campo": caminho}
+
+    documento = DocumentoBinario(
+        conteudo_base64=conteudo,
+        metadados=metadados,
+        nome_arquivo=nome_arquivo or "documento.pdf",
+        formato=formato
+    )
+    metadados["documento"]["tamanho"] = documento.tamanho
+    return documento
@@ -0,0 +1,70 @@
+"""
+Cifragem simétrica de valores sensíveis mantidos pelo servidor.
+
+Usado para guardar certificados registrados, tokens e entradas de cache
+cifrados em memória e em disco (Fernet: AES-128-CBC + HMAC-SHA256).
+"""
+
+import os
+import logging
+from typing import Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# Variável de ambiente com a chave Fernet (urlsafe Base64, 32 bytes)
+ENV_CHAVE = "SERPRO_CHAVE_CIFRAGEM"
+
+
+class Cifrador:
+    """Cifra e decifra bytes com chave Fernet."""
+
+    def __init__(self, chave: Optional[bytes] = None):
+        """
+        Inicializa o cifrador.
+
+        Args:
+            chave: Chave Fernet. Se omitida, usa SERPRO_CHAVE_CIFRAGEM ou
+                gera uma chave efêmera (dados cifrados não sobrevivem a restart)
+        """
+        # Chave efêmera: o que for cifrado não pode ser lido por outro processo
+        self.efemero = False
+        if chave is None:
+            chave_env = os.environ.get(ENV_CHAVE)
+            if chave_env:
+                chave = chave_env.encode()
+            else:
+                self.efemero = True
+                logger.warning(
+                    f"{ENV_CHAVE} não definida: usando chave efêmera do processo"
+                )
+                chave = Fernet.generate_key()
+        self._fernet = Fernet(chave)
+
+    def cifrar(self, dados: bytes) -> bytes:
+        """Cifra bytes."""
+        return self._fernet.encrypt(dados)
+
+    def decifrar(self, token: bytes) -> bytes:
+        """
+        Decifra bytes.
+
+        Raises:
+            ValueError: Se o token for inválido ou cifrado com outra chave
+        """
+        try:
+            return self._fernet.decrypt(token)
+        except InvalidToken:
+            raise ValueError("Valor cifrado inválido ou chave incorreta")
+
+
+_cifrador_padrao: Optional[Cifrador] = None
+
+
+def obter_cifrador() -> Cifrador:
+    """Retorna o cifrador compartilhado do processo."""
+    global _cifrador_padrao
+    if _cifrador_padrao is None:
+        _cifrador_padrao = Cifrador()
+    return _cifrador_padrao
@@ -0,0 +1,299 @@
+"""
+Requisições "hedged" para serviços idempotentes.
+
+Se a primeira tentativa não responde até o percentil configurado da
+latência recente do serviço (histograma por idServico), uma segunda
+tentativa idêntica é disparada em outra conexão; vale a resposta que
+chegar primeiro. Só se aplica a serviços marcados como idempotentes no
+catálogo (consultas); emissões e declarações nunca são duplicadas.
+
+A carga extra é limitada por um orçamento: cada chamada primária credita
+`orcamento`% de ficha e cada hedge consome uma ficha inteira, então os
+hedges nunca passam dessa fração das chamadas (com rajada limitada).
+
+Transportes síncronos não interrompem uma chamada em andamento: a
+tentativa perdedora é cancelada se ainda não começou; caso contrário, seu
+resultado é descartado e a conexão volta ao pool quando ela terminar.
+Toda tentativa enviada é cobrada pelo SERPRO: quem chama é avisado de
+cada tentativa extra para contabilizá-la.
+
+Sem hedge possível (histograma sem amostras, orçamento esgotado ou prazo
+curto) a chamada roda na própria thread de quem chama; o pool de threads,
+dimensionado pela capacidade de execução do controle de admissão (duas
+tentativas por requisição admitida), só é usado quando pode haver hedge.
+
+Configuração por ambiente:
+    SERPRO_HEDGE_ATIVO=0            (1 para habilitar)
+    SERPRO_HEDGE_PERCENTIL=95
+    SERPRO_HEDGE_ORCAMENTO=5        (% máximo de chamadas extras)
+    SERPRO_HEDGE_ATRASO_MINIMO=0.05 (segundos)
+    SERPRO_HEDGE_AMOSTRAS_MINIMAS=20
+"""
+
+import os
+import bisect
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from src.admission import obter_controlador
+from src.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Limites dos buckets (s): 5 ms a ~120 s em passos de 25%
+LIMITES_BUCKETS: List[float] = []
+_limite = 0.005
+while _limite < 120:
+    LIMITES_BUCKETS.append(round(_limite, 6))
+    _limite *= 1.25
+del _limite
+
+JANELA_PADRAO = 60.0
+MAX_FICHAS = 10.0
+
+
+class HistogramaLatencia:
+    """
+    Histograma de latências recentes (buckets logarítmicos).
+
+    Duas janelas se alternam a cada `janela` segundos; o percentil considera
+    a janela corrente e a anterior, esquecendo amostras antigas sem custo
+    por amostra.
+    """
+
+    def __init__(self, janela: float = JANELA_PADRAO):
+        self.janela = janela
+        self._atual = [0] * (len(LIMITES_BUCKETS) + 1)
+        self._anterior = [0] * (len(LIMITES_BUCKETS) + 1)
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rotacionar(self, agora: float):
+        decorrido = agora - self._inicio
+        if decorrido < self.janela:
+            return
+        # Mais de duas janelas sem rotação: as duas estão velhas
+        self._anterior = self._atual if decorrido < 2 * self.janela else [0] * len(self._atual)
+        self._atual = [0] * len(self._atual)
+        self._inicio = agora
+
+    def registrar(self, latencia: float):
+        indice = bisect.bisect_left(LIMITES_BUCKETS, latencia)
+        with self._lock:
+            self._rotacionar(time.monotonic())
+            self._atual[indice] += 1
+
+    def amostras(self) -> int:
+        with self._lock:
+            self._rotacionar(time.monotonic())
+            return sum(self._atual) + sum(self._anterior)
+
+    def percentil(self, percentil: float) -> Optional[float]:
+        """Limite superior do bucket que contém o percentil (None sem amostras)."""
+        with self._lock:
+            self._rotacionar(time.monotonic())
+            contagens = [a + b for a, b in zip(self._atual, self._anterior)]
+        total = sum(contagens)
+        if not total:
+            return None
+        alvo = percentil / 100 * total
+        acumulado = 0
+        for indice, contagem in enumerate(contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return LIMITES_BUCKETS[min(indice, len(LIMITES_BUCKETS) - 1)]
+        return LIMITES_BUCKETS[-1]
+
+
+class OrcamentoHedge:
+    """Fichas de hedge: +orcamento% por chamada primária, -1 por hedge."""
+
+    def __init__(self, percentual: float):
+        self.credito = percentual / 100
+        self._fichas = 0.0
+        self._lock = threading.Lock()
+
+    def creditar(self):
+        with self._lock:
+            self._fichas = min(MAX_FICHAS, self._fichas + self.credito)
+
+    def disponivel(self) -> bool:
+        """Se há ficha para um hedge agora (sem consumir)."""
+        with self._lock:
+            return self._fichas >= 1
+
+    def consumir(self) -> bool:
+        with self._lock:
+            if self._fichas >= 1:
+                self._fichas -= 1
+                return True
+            return False
+
+
+class Hedger:
+    """Executa chamadas com hedge conforme histogramas por serviço."""
+
+    def __init__(
+        self,
+        percentil: float = 95,
+        orcamento: float = 5,
+        atraso_minimo: float = 0.05,
+        amostras_minimas: int = 20,
+        max_threads: int = 64
+    ):
+        """
+        Args:
+            percentil: Percentil da latência recente que dispara o hedge
+            orcamento: Percentual máximo de chamadas extras
+            atraso_minimo: Atraso mínimo antes do hedge (segundos)
+            amostras_minimas: Amostras necessárias antes de confiar no histograma
+            max_threads: Threads para as tentativas com possível hedge
+                (duas por requisição simultânea)
+        """
+        self.percentil = percentil
+        self.orcamento = orcamento
+        self.atraso_minimo = atraso_minimo
+        self.amostras_minimas = amostras_minimas
+        self._orcamento = OrcamentoHedge(orcamento)
+        self._histogramas: Dict[str, HistogramaLatencia] = {}
+        self._histogramas_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="hedge")
+        self._contadores = {"chamadas": 0, "hedges": 0, "hedges_vencedores": 0, "sem_orcamento": 0}
+        self._contadores_lock = threading.Lock()
+
+    def _contar(self, chave: str):
+        with self._contadores_lock:
+            self._contadores[chave] += 1
+
+    def histograma(self, chave: str) -> HistogramaLatencia:
+        with self._histogramas_lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = HistogramaLatencia()
+            return histograma
+
+    def atraso(self, chave: str) -> Optional[float]:
+        """Atraso até o hedge (None enquanto não há amostras suficientes)."""
+        histograma = self.histograma(chave)
+        if histograma.amostras() < self.amostras_minimas:
+            return None
+        return max(self.atraso_minimo, histograma.percentil(self.percentil))
+
+    def _cronometrada(self, chave: str, tentativa: Callable[[], T]) -> Callable[[], T]:
+        histograma = self.histograma(chave)
+
+        def cronometrada() -> T:
+            inicio = time.monotonic()
+            resultado = tentativa()
+            # Perdedoras também contam: o histograma mede o serviço, não o hedge
+            histograma.registrar(time.monotonic() - inicio)
+            return resultado
+
+        return cronometrada
+
+    def _submeter(self, chave: str, tentativa: Callable[[], T]) -> Future:
+        return self._executor.submit(self._cronometrada(chave, tentativa))
+
+    def executar(
+        self,
+        chave: str,
+        tentativa: Callable[[], T],
+        deadline: Optional[Deadline] = None,
+        ao_tentativa_extra: Optional[Callable[[], None]] = None
+    ) -> T:
+        """
+        Executa `tentativa`, disparando uma segunda se a primeira demorar.
+
+        Args:
+            chave: Serviço (histograma próprio por chave)
+            tentativa: Chamada completa e idempotente (recalcula seus timeouts)
+            deadline: Prazo da requisição (sem hedge se não houver tempo)
+            ao_tentativa_extra: Chamada (na thread de quem chama, antes do
+                retorno) para cada tentativa extra que chegou a ser enviada
+
+        Returns:
+            Resultado da primeira tentativa bem-sucedida
+
+        Raises:
+            A exceção da primeira tentativa, se nenhuma tiver sucesso
+        """
+        self._contar("chamadas")
+        self._orcamento.creditar()
+        atraso = self.atraso(chave)
+
+        # Sem hedge possível: roda na thread de quem chama, sem ocupar o pool
+        if (
+            atraso is None
+            or (deadline is not None and deadline.restante() <= atraso)
+            or not self._orcamento.disponivel()
+        ):
+            return self._cronometrada(chave, tentativa)()
+
+        primaria = self._submeter(chave, tentativa)
+
+        # wait() em vez de result(timeout): DeadlineExcedidoError também é TimeoutError
+        if wait([primaria], timeout=atraso).done:
+            return primaria.result()
+
+        if not self._orcamento.consumir():
+            self._contar("sem_orcamento")
+            return primaria.result()
+
+        self._contar("hedges")
+        hedge = self._submeter(chave, tentativa)
+        pendentes = {primaria, hedge}
+        erro: Optional[BaseException] = None
+        while pendentes:
+            concluidas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidas:
+                if futuro.exception() is None:
+                    # Perdedora que já começou foi enviada (e cobrada)
+                    enviadas = {primaria, hedge} - {perdedora for perdedora in pendentes if perdedora.cancel()}
+                    if hedge in enviadas and ao_tentativa_extra is not None:
+                        ao_tentativa_extra()
+                    if futuro is hedge:
+                        self._contar("hedges_vencedores")
+                    return futuro.result()
+                if futuro is primaria or erro is None:
+                    erro = futuro.exception()
+        if ao_tentativa_extra is not None:
+            ao_tentativa_extra()
+        raise erro
+
+    def estatisticas(self) -> Dict[str, object]:
+        """Contadores e atraso atual por serviço."""
+        with self._contadores_lock:
+            contadores = dict(self._contadores)
+        with self._histogramas_lock:
+            chaves = list(self._histogramas)
+        contadores["atrasos"] = {chave: self.atraso(chave) for chave in chaves}
+        return contadores
+
+
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def obter_hedger() -> Optional[Hedger]:
+    """Hedger do processo, ou None se SERPRO_HEDGE_ATIVO não estiver ligado."""
+    global _hedger
+    if os.environ.get("SERPRO_HEDGE_ATIVO", "0").lower() not in ("1", "true", "sim"):
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(
+                percentil=float(os.environ.get("SERPRO_HEDGE_PERCENTIL", 95)),
+                orcamento=float(os.environ.get("SERPRO_HEDGE_ORCAMENTO", 5)),
+                atraso_minimo=float(os.environ.get("SERPRO_HEDGE_ATRASO_MINIMO", 0.05)),
+                amostras_minimas=int(os.environ.get("SERPRO_HEDGE_AMOSTRAS_MINIMAS", 20)),
+                max_threads=2 * obter_controlador().capacidade_execucao
+            )
+            logger.info(
+                "Hedge ativo: p%s, orçamento %s%%", _hedger.percentil, _hedger.orcamento
+            )
+        return _hedger
@@ -0,0 +1,167 @@
+"""
+Chaves de idempotência para serviços de escrita da API SERPRO.
+
+Retentativas de /Declarar e /Emitir (transmissões PGDASD, DEFIS, DCTFWeb,
+emissão de guias) não devem gerar envios duplicados. O primeiro resultado
+fica guardado no cache compartilhado por uma janela e é devolvido às
+repetições; duplicatas simultâneas aguardam a chamada original (lock de
+renovação do cache) em vez de executá-la de novo.
+
+A chave vem do header Idempotency-Key. Sem ele, e só com
+SERPRO_IDEMPOTENCIA_IMPLICITA=1, os endpoints de escrita derivam a chave
+do identificador X-Request-Tag (autor + contribuinte + serviço, como no
+RequestTagGenerator do pacote Dart) somado ao hash do corpo, para que
+declarações diferentes do mesmo contribuinte não colidam; essa chave
+implícita vale por uma janela curta. Toda chave inclui a credencial de
+quem chama (certificado em produção), então o resultado guardado nunca é
+devolvido a outro cliente.
+
+Só resultados de sucesso são guardados: um envelope com erro de negócio
+(ou falha temporária do SERPRO) não é repetido para a retentativa. A
+resposta reaproveitada leva o header Idempotent-Replayed: true.
+
+Configuração por ambiente:
+    SERPRO_IDEMPOTENCIA_JANELA=86400           (segundos; Idempotency-Key)
+    SERPRO_IDEMPOTENCIA_IMPLICITA=0            (1 deduplica escritas sem o header)
+    SERPRO_IDEMPOTENCIA_JANELA_IMPLICITA=600   (segundos; chave implícita)
+"""
+
+import os
+import hashlib
+import contextvars
+from typing import Any, Dict, Mapping, Optional
+
+from src.dados_codec import serializar_json
+
+HEADER_IDEMPOTENCIA = "Idempotency-Key"
+HEADER_REQUEST_TAG = "X-Request-Tag"
+HEADER_REPETIDA = "Idempotent-Replayed"
+
+# Endpoints SERPRO que transmitem/emitem (efeito colateral no servidor)
+ENDPOINTS_ESCRITA = ("/Declarar", "/Emitir")
+
+# Janela padrão de reaproveitamento do resultado (segundos)
+JANELA_PADRAO = 24 * 3600
+# Janela da chave derivada sem Idempotency-Key (cobre retentativas imediatas)
+JANELA_IMPLICITA_PADRAO = 600
+
+TAMANHO_MAXIMO_CHAVE = 255
+
+# Se a resposta da requisição corrente veio do resultado guardado
+_repetida: contextvars.ContextVar[bool] = contextvars.ContextVar("idempotencia_repetida", default=False)
+
+
+def janela_idempotencia(implicita: bool = False) -> float:
+    """Janela configurada (segundos): SERPRO_IDEMPOTENCIA_JANELA ou, sem header, a implícita."""
+    if implicita:
+        return float(os.environ.get("SERPRO_IDEMPOTENCIA_JANELA_IMPLICITA", JANELA_IMPLICITA_PADRAO))
+    return float(os.environ.get("SERPRO_IDEMPOTENCIA_JANELA", JANELA_PADRAO))
+
+
+def idempotencia_implicita() -> bool:
+    """Se escritas sem Idempotency-Key são deduplicadas (SERPRO_IDEMPOTENCIA_IMPLICITA)."""
+    return os.environ.get("SERPRO_IDEMPOTENCIA_IMPLICITA", "0").lower() in ("1", "true", "sim")
+
+
+def resultado_reaproveitavel(resultado: Any) -> bool:
+    """Envelope SERPRO de sucesso (status 200 e nenhuma mensagem de erro)."""
+    if not isinstance(resultado, dict) or str(resultado.get("status")) != "200":
+        return False
+    mensagens = resultado.get("mensagens")
+    if not isinstance(mensagens, list):
+        return True
+    return not any(
+        "erro" in str(mensagem.get("codigo", "")).lower()
+        for mensagem in mensagens
+        if isinstance(mensagem, dict)
+    )
+
+
+def marcar_repetida(repetida: bool):
+    """Registra se a resposta da requisição corrente é um resultado guardado."""
+    _repetida.set(repetida)
+
+
+def headers_repeticao() -> Dict[str, str]:
+    """Header Idempotent-Replayed da requisição corrente (vazio se não repetida)."""
+    return {HEADER_REPETIDA: "true"} if _repetida.get() else {}
+
+
+def _documento(parte: Optional[Mapping[str, Any]]) -> str:
+    """Número do documento (só dígitos) de contratante/autor/contribuinte."""
+    numero = str((parte or {}).get("numero", ""))
+    return "".join(c for c in numero if c.isdigit())
+
+
+def gerar_request_tag(body: Mapping[str, Any]) -> str:
+    """
+    Identificador no formato do X-Request-Tag a partir do corpo SERPRO.
+
+    Formato: TAAAAAAAAAAAAAATCCCCCCCCCCCCCC + idServico (o Dart usa o
+    código de 2 posições do catálogo; aqui o próprio idServico identifica
+    a funcionalidade).
+    """
+    autor = _documento(body.get("autorPedidoDados"))
+    contribuinte = _documento(body.get("contribuinte"))
+    id_servico = str((body.get("pedidoDados") or {}).get("idServico", ""))
+
+    def tipo(numero: str) -> str:
+        return "2" if len(numero) == 14 else "1"
+
+    return f"{tipo(autor)}{autor.zfill(14)}{tipo(contribuinte)}{contribuinte.zfill(14)}{id_servico}"
+
+
+def hash_corpo(body: Any) -> str:
+    """SHA-256 do corpo serializado (detecta chave reutilizada com outro conteúdo)."""
+    return hashlib.sha256(serializar_json(body)).hexdigest()
+
+
+def chave_idempotencia(
+    ambiente: str,
+    endpoint: str,
+    body: Dict[str, Any],
+    credencial: str,
+    chave_cliente: Optional[str] = None,
+    request_tag: Optional[str] = None,
+    implicita: Optional[bool] = None
+) -> Optional[str]:
+    """
+    Chave do resultado no cache, ou None se a chamada não é deduplicada.
+
+    Args:
+        ambiente: 'trial' ou 'producao'
+        endpoint: Endpoint SERPRO
+        body: Corpo já preparado (dados codificado)
+        credencial: Escopo de quem chama (src.tenant_scope: certificado em
+            produção, access_token no trial); só quem apresenta a mesma
+            credencial recebe o resultado guardado
+        chave_cliente: Valor do header Idempotency-Key
+        request_tag: Valor do header X-Request-Tag, se enviado
+        implicita: Deriva a chave das escritas sem Idempotency-Key
+            (padrão: SERPRO_IDEMPOTENCIA_IMPLICITA)
+
+    Raises:
+        ValueError: Se a Idempotency-Key for vazia ou longa demais
+    """
+    if not credencial:
+        raise ValueError("Credencial obrigatória para deduplicar a chamada")
+
+    # Escopo pela credencial e pelo contratante: o mesmo corpo enviado por
+    # outro cliente não recebe o resultado guardado
+    contratante = f"{credencial}\x1f{_documento(body.get('contratante'))}"
+
+    if chave_cliente is not None:
+        chave_cliente = chave_cliente.strip()
+        if not chave_cliente or len(chave_cliente) > TAMANHO_MAXIMO_CHAVE:
+            raise ValueError(
+                f"{HEADER_IDEMPOTENCIA} deve ter de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres"
+            )
+        partes = (ambiente, endpoint, contratante, "cliente", chave_cliente)
+    elif endpoint in ENDPOINTS_ESCRITA and (idempotencia_implicita() if implicita is None else implicita):
+        tag = request_tag or gerar_request_tag(body)
+        partes = (ambiente, endpoint, contratante, "tag", tag, hash_corpo(body))
+    else:
+        return None
+
+    digest = hashlib.sha256("\x1f".join(partes).encode()).hexdigest()
+    return f"idempotencia:{digest}"
@@ -0,0 +1,705 @@
+"""
+Jobs de fan-out: um serviço SERPRO para uma carteira de contribuintes.
+
+Rotinas de fim de mês (PGMEI, PGDASD, ... para todos os clientes) viram um
+único job no servidor: um template de chamada do proxy_serpro mais a lista
+de contribuintes. O job executa com concorrência limitada e taxa máxima de
+chamadas, na classe de prioridade 'lote' do controle de admissão (não
+disputa vagas com chamadas interativas).
+
+Somente no servidor localhost: o checkpoint é um arquivo SQLite local e a
+execução roda em threads de fundo, o que o Firebase não garante (o /tmp é
+de cada instância e a CPU fica parada fora das requisições).
+
+O progresso é gravado item a item. Cada job em execução tem um dono
+(processo) com lease renovado enquanto executa; na partida do servidor,
+jobs sem dono ou com lease vencido são reivindicados atomicamente e
+retomados a partir dos itens pendentes, então processos que compartilham
+SERPRO_JOBS_DB não executam o mesmo job duas vezes (um item interrompido
+no meio da chamada é refeito; cada item leva a própria Idempotency-Key,
+então em /Declarar e /Emitir o envio não se repete).
+
+Os tokens do template vencem: informe `expires_in` (o mesmo devolvido por
+/autenticar_serpro). Em produção, perto do vencimento ou com 401 do
+SERPRO, o job para em 'aguardando_tokens' (itens restantes ficam
+pendentes) até receber tokens novos em renovar_tokens.
+
+Cada job pertence à credencial que o criou (src.tenant_scope) e só é
+consultado com ela. Template e resultados ficam cifrados em disco
+(contêm tokens e dados fiscais); para retomar após reinício,
+SERPRO_CHAVE_CIFRAGEM precisa estar definida (a chave efêmera não
+sobrevive ao processo). Job cujo template não decifra mais termina em
+'erro' em vez de ser retomado a cada partida, e resultados ilegíveis
+aparecem como erro do item.
+
+Configuração por ambiente:
+    SERPRO_JOBS_DB=/tmp/serpro_jobs.db
+    SERPRO_JOBS_MAX_ITENS=10000
+    SERPRO_JOBS_LEASE=60   (segundos; renovado a cada terço)
+"""
+
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.admission import PRIORIDADE_LOTE, SobrecargaError, obter_controlador
+from src.dados_codec import carregar_json, serializar_json
+from src.deadline import prazo_da_rota
+from src.encryption import Cifrador, obter_cifrador
+from src.service_catalog import prazo_do_servico, validar_requisicao
+
+logger = logging.getLogger(__name__)
+
+CAMINHO_PADRAO = "/tmp/serpro_jobs.db"
+
+ESTADO_EXECUTANDO = "executando"
+ESTADO_AGUARDANDO_TOKENS = "aguardando_tokens"
+ESTADO_CONCLUIDO = "concluido"
+ESTADO_CANCELADO = "cancelado"
+ESTADO_ERRO = "erro"
+
+ITEM_PENDENTE = "pendente"
+ITEM_OK = "ok"
+ITEM_ERRO = "erro"
+ESTADOS_ITEM = (ITEM_PENDENTE, ITEM_OK, ITEM_ERRO)
+
+CONCORRENCIA_PADRAO = 4
+CONCORRENCIA_MAXIMA = 16
+TAXA_PADRAO = 5.0
+TENTATIVAS_PADRAO = 2
+TAMANHO_PAGINA_MAXIMO = 500
+LEASE_PADRAO = 60.0
+
+# Validade assumida dos tokens quando o template não traz expires_in (segundos)
+VALIDADE_TOKENS_PADRAO = 3600
+# Antecedência para parar antes do vencimento dos tokens (segundos)
+MARGEM_TOKENS = 60
+
+# Colunas acrescentadas depois da primeira versão da tabela jobs
+COLUNAS_JOBS = (
+    ("escopo", "TEXT"), ("dono", "TEXT"), ("lease_expira", "REAL"), ("tokens_expiram_em", "REAL"), ("erro", "TEXT"),
+)
+
+ERRO_CHAVE = "Dados do job cifrados com outra chave (SERPRO_CHAVE_CIFRAGEM ausente ou trocada)"
+
+# Campos do template obrigatórios (mesmos do proxy_serpro)
+CAMPOS_TEMPLATE = ("endpoint", "body", "access_token", "jwt_token")
+
+
+class JobNaoEncontradoError(ValueError):
+    """job_id desconhecido."""
+
+
+class _LimitadorTaxa:
+    """Token bucket: no máximo `taxa` chamadas por segundo (rajada de 1 s)."""
+
+    def __init__(self, taxa: float):
+        self.taxa = taxa
+        self._fichas = taxa
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.taxa, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+def _limpar_documento(numero: Any) -> str:
+    return "".join(c for c in str(numero) if c.isdigit())
+
+
+def _validade_tokens(expires_in: Any) -> float:
+    """Segundos de validade dos tokens (expires_in de /autenticar_serpro)."""
+    if expires_in is None or expires_in == "":
+        return VALIDADE_TOKENS_PADRAO
+    try:
+        return float(expires_in)
+    except (TypeError, ValueError):
+        raise ValueError("expires_in deve ser numérico")
+
+
+def _token_expirado(erro: Exception) -> bool:
+    """Resposta 401 do SERPRO (tokens do template vencidos ou revogados)."""
+    return str(erro).startswith("401 ")
+
+
+def corpo_do_item(template_body: Dict[str, Any], contribuinte: str) -> Dict[str, Any]:
+    """Corpo SERPRO do template com o contribuinte do item."""
+    return {
+        **template_body,
+        "contribuinte": {"numero": contribuinte, "tipo": 2 if len(contribuinte) == 14 else 1},
+    }
+
+
+class JobManager:
+    """Cria, executa, retoma e consulta jobs de fan-out."""
+
+    def __init__(
+        self,
+        executar_fn: Callable[..., Any],
+        caminho: str = CAMINHO_PADRAO,
+        cifrador: Optional[Cifrador] = None,
+        max_itens: int = 10000,
+        lease: float = LEASE_PADRAO
+    ):
+        """
+        Args:
+            executar_fn: Função do proxy (process_proxy_serpro)
+            caminho: Arquivo SQLite de checkpoint
+            cifrador: Cifrador do template e dos resultados
+            max_itens: Máximo de contribuintes por job
+            lease: Segundos de posse de um job sem renovação
+        """
+        self._executar_fn = executar_fn
+        self._caminho = caminho
+        self._cifrador = cifrador or obter_cifrador()
+        if self._cifrador.efemero:
+            # Template e resultados gravados com chave efêmera ficam ilegíveis após um restart
+            logger.warning("Jobs sem SERPRO_CHAVE_CIFRAGEM: não são retomados após reinício")
+        self.max_itens = max_itens
+        self.lease = lease
+        # Identifica este processo como dono dos jobs que executa
+        self.dono = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._ativos: Dict[str, threading.Thread] = {}
+        # Jobs a parar: cancelados, aguardando tokens ou com lease perdido
+        self._interrompidos: set = set()
+        self._ativos_lock = threading.Lock()
+
+        with self._conexao() as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, estado TEXT NOT NULL, "
+                "template BLOB NOT NULL, concorrencia INTEGER NOT NULL, taxa REAL NOT NULL, "
+                "tentativas INTEGER NOT NULL, total INTEGER NOT NULL, "
+                "criado_em REAL NOT NULL, atualizado_em REAL NOT NULL)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS itens (job_id TEXT NOT NULL, indice INTEGER NOT NULL, "
+                "contribuinte TEXT NOT NULL, estado TEXT NOT NULL, tentativas INTEGER NOT NULL DEFAULT 0, "
+                "resultado BLOB, erro TEXT, atualizado_em REAL, PRIMARY KEY (job_id, indice))"
+            )
+            conexao.execute("CREATE INDEX IF NOT EXISTS itens_estado ON itens (job_id, estado)")
+            existentes = {linha[1] for linha in conexao.execute("PRAGMA table_info(jobs)")}
+            for coluna, tipo in COLUNAS_JOBS:
+                if coluna not in existentes:
+                    try:
+                        conexao.execute(f"ALTER TABLE jobs ADD COLUMN {coluna} {tipo}")
+                    except sqlite3.OperationalError:
+                        pass  # outro processo acrescentou primeiro
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Conexão por thread (sqlite3 não compartilha conexões entre threads)."""
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self._caminho, timeout=30, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def _template(self, job_id: str) -> Dict[str, Any]:
+        """
+        Template decifrado do job.
+
+        Raises:
+            ValueError: Se o template foi cifrado com outra chave (o job
+                passa a 'erro', estado final)
+        """
+        linha = self._conexao().execute("SELECT template FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        try:
+            return carregar_json(self._cifrador.decifrar(linha[0]))
+        except ValueError:
+            self._conexao().execute(
+                "UPDATE jobs SET estado = ?, erro = ?, dono = NULL, atualizado_em = ? WHERE id = ? AND estado IN (?, ?)",
+                (ESTADO_ERRO, ERRO_CHAVE, time.time(), job_id, ESTADO_EXECUTANDO, ESTADO_AGUARDANDO_TOKENS)
+            )
+            raise ValueError(ERRO_CHAVE)
+
+    def _resultado(self, conteudo: Optional[bytes]) -> Tuple[Optional[Any], Optional[str]]:
+        """Resultado decifrado de um item e erro de leitura, se houver."""
+        if not conteudo:
+            return None, None
+        try:
+            return carregar_json(self._cifrador.decifrar(conteudo)), None
+        except ValueError:
+            return None, ERRO_CHAVE
+
+    # ===== Criação e retomada =====
+
+    def criar(
+        self,
+        template: Dict[str, Any],
+        contribuintes: List[str],
+        escopo: str,
+        concorrencia: int = CONCORRENCIA_PADRAO,
+        taxa_por_segundo: float = TAXA_PADRAO,
+        tentativas: int = TENTATIVAS_PADRAO
+    ) -> Dict[str, Any]:
+        """
+        Cria o job e inicia a execução em segundo plano.
+
+        Args:
+            template: Campos do proxy_serpro (e `expires_in` dos tokens)
+            contribuintes: CPF/CNPJ dos itens
+            escopo: Escopo da credencial dona do job (src.tenant_scope)
+
+        Raises:
+            ValueError: Template, contribuintes ou limites inválidos
+        """
+        for campo in CAMPOS_TEMPLATE:
+            if not template.get(campo):
+                raise ValueError(f"Campo obrigatório ausente no template: {campo}")
+        if not isinstance(template["body"], dict):
+            raise ValueError("template.body deve ser um objeto")
+        if not contribuintes:
+            raise ValueError("Campo obrigatório ausente: contribuintes")
+        if len(contribuintes) > self.max_itens:
+            raise ValueError(f"Máximo de {self.max_itens} contribuintes por job")
+        if not 1 <= concorrencia <= CONCORRENCIA_MAXIMA:
+            raise ValueError(f"concorrencia deve estar entre 1 e {CONCORRENCIA_MAXIMA}")
+        if taxa_por_segundo <= 0:
+            raise ValueError("taxa_por_segundo deve ser positiva")
+        if tentativas < 1:
+            raise ValueError("tentativas deve ser ao menos 1")
+
+        limpos = []
+        for numero in contribuintes:
+            limpo = _limpar_documento(numero)
+            if len(limpo) not in (11, 14):
+                raise ValueError(f"Contribuinte inválido: '{numero}' (CPF ou CNPJ)")
+            limpos.append(limpo)
+
+        # Template inválido falha aqui, não em cada item
+        validar_requisicao(template["endpoint"], corpo_do_item(template["body"], limpos[0]))
+
+        agora = time.time()
+        template = dict(template)
+        tokens_expiram_em = agora + _validade_tokens(template.pop("expires_in", None))
+        # Entrega sempre em JSON: documentos binários ficam no resultado como Base64
+        template["formato_resposta"] = "json"
+
+        job_id = uuid.uuid4().hex
+        conexao = self._conexao()
+        conexao.execute("BEGIN")
+        conexao.execute(
+            "INSERT INTO jobs (id, estado, template, concorrencia, taxa, tentativas, total, criado_em, "
+            "atualizado_em, escopo, dono, lease_expira, tokens_expiram_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, ESTADO_EXECUTANDO, self._cifrador.cifrar(serializar_json(template)),
+             concorrencia, taxa_por_segundo, tentativas, len(limpos), agora, agora,
+             escopo, self.dono, agora + self.lease, tokens_expiram_em)
+        )
+        conexao.executemany(
+            "INSERT INTO itens (job_id, indice, contribuinte, estado) VALUES (?, ?, ?, ?)",
+            [(job_id, indice, numero, ITEM_PENDENTE) for indice, numero in enumerate(limpos)]
+        )
+        conexao.execute("COMMIT")
+
+        self._iniciar(job_id)
+        return self.progresso(job_id, escopo)
+
+    def _reivindicar(self, job_id: str, estado: str = ESTADO_EXECUTANDO) -> bool:
+        """Toma posse do job se ele está sem dono ou com lease vencido (atômico)."""
+        agora = time.time()
+        cursor = self._conexao().execute(
+            "UPDATE jobs SET estado = ?, dono = ?, lease_expira = ? WHERE id = ? AND estado = ? "
+            "AND (dono IS NULL OR dono = ? OR lease_expira IS NULL OR lease_expira < ?)",
+            (ESTADO_EXECUTANDO, self.dono, agora + self.lease, job_id, estado, self.dono, agora)
+        )
+        return cursor.rowcount == 1
+
+    def retomar_pendentes(self) -> List[str]:
+        """
+        Retoma jobs em execução sem dono vivo (após queda ou novo deploy).
+
+        Chamado na partida do servidor. Só retoma os jobs que este processo
+        conseguir reivindicar: jobs de outro processo com lease válido ficam
+        com ele.
+        """
+        linhas = self._conexao().execute(
+            "SELECT id FROM jobs WHERE estado = ? AND (dono IS NULL OR lease_expira IS NULL OR lease_expira < ?)",
+            (ESTADO_EXECUTANDO, time.time())
+        ).fetchall()
+        retomados = []
+        for (job_id,) in linhas:
+            if self._reivindicar(job_id) and self._iniciar(job_id):
+                retomados.append(job_id)
+        if retomados:
+            logger.info("Jobs retomados: %s", retomados)
+        return retomados
+
+    def renovar_tokens(
+        self,
+        job_id: str,
+        escopo: str,
+        access_token: str,
+        jwt_token: str,
+        expires_in: Optional[Any] = None,
+        procurador_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Troca os tokens do template e retoma um job em 'aguardando_tokens'.
+
+        Raises:
+            JobNaoEncontradoError: job_id desconhecido para o escopo
+            ValueError: Tokens ausentes ou job em outro estado
+        """
+        if not access_token or not jwt_token:
+            raise ValueError("Campos obrigatórios ausentes: access_token e jwt_token")
+        estado = self._job(job_id, escopo)[0]
+        if estado != ESTADO_AGUARDANDO_TOKENS:
+            raise ValueError(f"Job não está aguardando tokens (estado: {estado})")
+        with self._ativos_lock:
+            if job_id in self._ativos:
+                raise ValueError("Job ainda finalizando os itens em andamento; tente novamente")
+
+        conexao = self._conexao()
+        template = self._template(job_id)
+        template.update(access_token=access_token, jwt_token=jwt_token)
+        if procurador_token:
+            template["procurador_token"] = procurador_token
+        conexao.execute(
+            "UPDATE jobs SET template = ?, tokens_expiram_em = ?, atualizado_em = ? WHERE id = ? AND estado = ?",
+            (self._cifrador.cifrar(serializar_json(template)), time.time() + _validade_tokens(expires_in),
+             time.time(), job_id, ESTADO_AGUARDANDO_TOKENS)
+        )
+        if self._reivindicar(job_id, ESTADO_AGUARDANDO_TOKENS):
+            self._iniciar(job_id)
+        return self.progresso(job_id, escopo)
+
+    def _iniciar(self, job_id: str) -> bool:
+        with self._ativos_lock:
+            if job_id in self._ativos:
+                return False
+            thread = threading.Thread(target=self._executar_job, args=(job_id,), name=f"job-{job_id[:8]}", daemon=True)
+            self._ativos[job_id] = thread
+        thread.start()
+        return True
+
+    # ===== Execução =====
+
+    def _manter_lease(self, job_id: str, parar: threading.Event):
+        """Renova a posse do job; para a execução se ele foi cancelado ou tomado."""
+        while not parar.wait(self.lease / 3):
+            cursor = self._conexao().execute(
+                "UPDATE jobs SET lease_expira = ? WHERE id = ? AND dono = ? AND estado = ?",
+                (time.time() + self.lease, job_id, self.dono, ESTADO_EXECUTANDO)
+            )
+            if cursor.rowcount == 0:
+                logger.warning("Job %s deixou de pertencer a este processo", job_id)
+                self._interrompidos.add(job_id)
+                return
+
+    def _pausar(self, job_id: str):
+        """Para o job até a renovação dos tokens (itens restantes ficam pendentes)."""
+        if job_id in self._interrompidos:
+            return
+        self._interrompidos.add(job_id)
+        self._conexao().execute(
+            "UPDATE jobs SET estado = ?, dono = NULL, atualizado_em = ? WHERE id = ? AND estado = ? AND dono = ?",
+            (ESTADO_AGUARDANDO_TOKENS, time.time(), job_id, ESTADO_EXECUTANDO, self.dono)
+        )
+        logger.warning("Job %s aguardando tokens novos", job_id)
+
+    def _executar_job(self, job_id: str):
+        parar_lease = threading.Event()
+        threading.Thread(
+            target=self._manter_lease, args=(job_id, parar_lease), name=f"job-{job_id[:8]}-lease", daemon=True
+        ).start()
+        try:
+            try:
+                template = self._template(job_id)
+            except ValueError:
+                logger.error("Job %s: %s", job_id, ERRO_CHAVE)
+                return
+            concorrencia, taxa, tentativas, tokens_expiram_em = self._conexao().execute(
+                "SELECT concorrencia, taxa, tentativas, tokens_expiram_em FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            # Tokens do trial não vencem
+            if template.get("ambiente") != "producao":
+                tokens_expiram_em = None
+            limitador = _LimitadorTaxa(taxa)
+
+            pendentes = self._conexao().execute(
+                "SELECT indice, contribuinte FROM itens WHERE job_id = ? AND estado = ? ORDER BY indice",
+                (job_id, ITEM_PENDENTE)
+            ).fetchall()
+
+            with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix=f"job-{job_id[:8]}") as executor:
+                futuros = [
+                    executor.submit(
+                        self._executar_item, job_id, template, indice, contribuinte, limitador, tentativas,
+                        tokens_expiram_em
+                    )
+                    for indice, contribuinte in pendentes
+                ]
+            # Falha fora da chamada (ex.: checkpoint no SQLite) deixa o item pendente
+            for futuro in futuros:
+                futuro.result()
+
+            if job_id not in self._interrompidos:
+                cursor = self._conexao().execute(
+                    "UPDATE jobs SET estado = ?, atualizado_em = ? WHERE id = ? AND estado = ? AND dono = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM itens WHERE job_id = ? AND estado = ?)",
+                    (ESTADO_CONCLUIDO, time.time(), job_id, ESTADO_EXECUTANDO, self.dono, job_id, ITEM_PENDENTE)
+                )
+                if cursor.rowcount:
+                    logger.info("Job %s %s", job_id, ESTADO_CONCLUIDO)
+        except Exception:
+            # Mantém 'executando': com o lease vencido, é retomado na próxima partida
+            logger.error("Job %s interrompido", job_id, exc_info=True)
+        finally:
+            parar_lease.set()
+            with self._ativos_lock:
+                self._ativos.pop(job_id, None)
+                self._interrompidos.discard(job_id)
+
+    def _executar_item(
+        self,
+        job_id: str,
+        template: Dict[str, Any],
+        indice: int,
+        contribuinte: str,
+        limitador: _LimitadorTaxa,
+        tentativas: int,
+        tokens_expiram_em: Optional[float] = None
+    ):
+        controlador = obter_controlador()
+        data = {
+            **template,
+            "body": corpo_do_item(template["body"], contribuinte),
+            # Item refeito após queda ou retentativa não repete /Declarar ou /Emitir
+            "idempotency_key": f"job:{job_id}:{indice}",
+        }
+        erro = None
+        tentativa = 0
+        while tentativa < tentativas:
+            if job_id in self._interrompidos:
+                return
+            limitador.aguardar()
+            if tokens_expiram_em is not None and time.time() > tokens_expiram_em - MARGEM_TOKENS:
+                self._pausar(job_id)
+                return
+            try:
+                deadline = prazo_da_rota("proxy_serpro", padrao=prazo_do_servico(data))
+                with controlador.admitir(PRIORIDADE_LOTE, deadline):
+                    resultado = self._executar_fn(dict(data), deadline=deadline)
+                self._gravar_item(job_id, indice, ITEM_OK, tentativa + 1, resultado=resultado)
+                return
+            except SobrecargaError as e:
+                # Classe 'lote' cheia: espera e tenta de novo sem gastar tentativa
+                time.sleep(e.retry_after)
+                continue
+            except ValueError as e:
+                # Erro de validação não melhora com nova tentativa
+                erro = str(e)
+                tentativa = tentativas
+                break
+            except Exception as e:
+                if tokens_expiram_em is not None and _token_expirado(e):
+                    self._pausar(job_id)
+                    return
+                erro = str(e)
+                tentativa += 1
+        self._gravar_item(job_id, indice, ITEM_ERRO, tentativa, erro=erro)
+
+    def _gravar_item(
+        self,
+        job_id: str,
+        indice: int,
+        estado: str,
+        tentativas: int,
+        resultado: Optional[Any] = None,
+        erro: Optional[str] = None
+    ):
+        """Checkpoint do item (uma transação curta por item)."""
+        conteudo = self._cifrador.cifrar(serializar_json(resultado)) if resultado is not None else None
+        self._conexao().execute(
+            "UPDATE itens SET estado = ?, tentativas = ?, resultado = ?, erro = ?, atualizado_em = ? "
+            "WHERE job_id = ? AND indice = ?",
+            (estado, tentativas, conteudo, erro, time.time(), job_id, indice)
+        )
+
+    def cancelar(self, job_id: str, escopo: str) -> Dict[str, Any]:
+        """
+        Interrompe o job (itens em andamento terminam; pendentes não executam).
+
+        Em outro processo, o dono percebe o cancelamento na renovação do lease.
+        """
+        self._job(job_id, escopo)
+        with self._ativos_lock:
+            if job_id in self._ativos:
+                self._interrompidos.add(job_id)
+        self._conexao().execute(
+            "UPDATE jobs SET estado = ?, atualizado_em = ? WHERE id = ? AND estado IN (?, ?)",
+            (ESTADO_CANCELADO, time.time(), job_id, ESTADO_EXECUTANDO, ESTADO_AGUARDANDO_TOKENS)
+        )
+        return self.progresso(job_id, escopo)
+
+    # ===== Consulta =====
+
+    def _job(self, job_id: str, escopo: str) -> tuple:
+        """Linha do job; de outro escopo, o job não existe para quem consulta."""
+        linha = self._conexao().execute(
+            "SELECT estado, total, concorrencia, taxa, criado_em, atualizado_em, erro FROM jobs "
+            "WHERE id = ? AND escopo = ?",
+            (job_id, escopo)
+        ).fetchone()
+        if linha is None:
+            raise JobNaoEncontradoError(f"Job não encontrado: {job_id}")
+        return linha
+
+    def progresso(self, job_id: str, escopo: str) -> Dict[str, Any]:
+        """Estado do job e contagem de itens por estado."""
+        estado, total, concorrencia, taxa, criado_em, atualizado_em, erro = self._job(job_id, escopo)
+        contagem = dict(self._conexao().execute(
+            "SELECT estado, COUNT(*) FROM itens WHERE job_id = ? GROUP BY estado", (job_id,)
+        ).fetchall())
+        ultimo_item = self._conexao().execute(
+            "SELECT MAX(atualizado_em) FROM itens WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        processados = contagem.get(ITEM_OK, 0) + contagem.get(ITEM_ERRO, 0)
+        return {
+            "job_id": job_id,
+            "estado": estado,
+            "total": total,
+            "concluidos": contagem.get(ITEM_OK, 0),
+            "falhas": contagem.get(ITEM_ERRO, 0),
+            "pendentes": contagem.get(ITEM_PENDENTE, 0),
+            "percentual": round(100 * processados / total, 1) if total else 100.0,
+            "concorrencia": concorrencia,
+            "taxa_por_segundo": taxa,
+            "criado_em": criado_em,
+            "atualizado_em": max(atualizado_em, ultimo_item or 0),
+            **({"erro": erro} if erro else {}),
+        }
+
+    def pedido(self, job_id: str, escopo: str) -> Dict[str, Any]:
+        """idSistema, idServico e versaoSistema do template (sem tokens)."""
+        self._job(job_id, escopo)
+        pedido = self._template(job_id)["body"].get("pedidoDados") or {}
+        return {campo: pedido.get(campo) for campo in ("idSistema", "idServico", "versaoSistema")}
+
+    def iterar_itens(
+        self,
+        job_id: str,
+        escopo: str,
+        estado: Optional[str] = None,
+        a_partir_de: int = 0,
+        lote: int = 200
+    ):
+        """
+        Percorre os itens em ordem, em blocos (memória limitada).
+
+        Yields:
+            Dict com indice, contribuinte, estado, tentativas, erro e resultado
+        """
+        self._job(job_id, escopo)
+        if estado is not None and estado not in ESTADOS_ITEM:
+            raise ValueError(f"estado inválido: '{estado}'. Use {', '.join(ESTADOS_ITEM)}.")
+        filtro = "AND estado = ?" if estado else ""
+        indice = a_partir_de
+        while True:
+            parametros = (job_id, indice, estado, lote) if estado else (job_id, indice, lote)
+            linhas = self._conexao().execute(
+                f"SELECT indice, contribuinte, estado, tentativas, erro, resultado FROM itens "
+                f"WHERE job_id = ? AND indice >= ? {filtro} ORDER BY indice LIMIT ?",
+                parametros
+            ).fetchall()
+            if not linhas:
+                return
+            for linha in linhas:
+                yield self._item(linha)
+            indice = linhas[-1][0] + 1
+
+    def resultados(
+        self,
+        job_id: str,
+        escopo: str,
+        pagina: int = 1,
+        tamanho: int = 100,
+        estado: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Página de resultados do job.
+
+        Raises:
+            JobNaoEncontradoError: job_id desconhecido
+            ValueError: Paginação ou estado inválidos
+        """
+        if pagina < 1 or not 1 <= tamanho <= TAMANHO_PAGINA_MAXIMO:
+            raise ValueError(f"pagina deve ser >= 1 e tamanho entre 1 e {TAMANHO_PAGINA_MAXIMO}")
+        self._job(job_id, escopo)
+        if estado is not None and estado not in ESTADOS_ITEM:
+            raise ValueError(f"estado inválido: '{estado}'. Use {', '.join(ESTADOS_ITEM)}.")
+
+        filtro, parametros = ("AND estado = ?", (job_id, estado)) if estado else ("", (job_id,))
+        total = self._conexao().execute(
+            f"SELECT COUNT(*) FROM itens WHERE job_id = ? {filtro}", parametros
+        ).fetchone()[0]
+        linhas = self._conexao().execute(
+            f"SELECT indice, contribuinte, estado, tentativas, erro, resultado FROM itens "
+            f"WHERE job_id = ? {filtro} ORDER BY indice LIMIT ? OFFSET ?",
+            (*parametros, tamanho, (pagina - 1) * tamanho)
+        ).fetchall()
+        return {
+            "job_id": job_id,
+            "pagina": pagina,
+            "tamanho": tamanho,
+            "total": total,
+            "paginas": (total + tamanho - 1) // tamanho,
+            "itens": [self._item(linha) for linha in linhas],
+        }
+
+    def _item(self, linha: tuple) -> Dict[str, Any]:
+        """Item de resultado a partir da linha (indice, contribuinte, estado, tentativas, erro, resultado)."""
+        resultado, erro_leitura = self._resultado(linha[5])
+        return {
+            "indice": linha[0],
+            "contribuinte": linha[1],
+            "estado": linha[2],
+            "tentativas": linha[3],
+            "erro": linha[4] or erro_leitura,
+            "resultado": resultado,
+        }
+
+
+_gerenciador: Optional[JobManager] = None
+_gerenciador_lock = threading.Lock()
+
+
+def obter_gerenciador(executar_fn: Callable[..., Any]) -> JobManager:
+    """
+    Retorna o gerenciador compartilhado do processo (configurado por ambiente).
+
+    A retomada de jobs órfãos é feita na partida do servidor
+    (retomar_pendentes), não aqui.
+
+    Args:
+        executar_fn: Função do proxy (process_proxy_serpro)
+    """
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            _gerenciador = JobManager(
+                executar_fn,
+                caminho=os.environ.get("SERPRO_JOBS_DB", CAMINHO_PADRAO),
+                max_itens=int(os.environ.get("SERPRO_JOBS_MAX_ITENS", 10000)),
+                lease=float(os.environ.get("SERPRO_JOBS_LEASE", LEASE_PADRAO))
+            )
+        return _gerenciador
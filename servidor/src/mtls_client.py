@@ -5,20 +5,17 @@ Este módulo gerencia certificados digitais e faz requisições autenticadas.
 """
 
 import base64
-import tempfile
-import os
-import ssl
-import requests
-from typing import Optional, Dict, Any
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.backends import default_backend
+import time
+from typing import Optional, Dict, Any, Tuple
 
-# Import condicional do Secret Manager (apenas Firebase)
-try:
-    from google.cloud import secretmanager
-    HAS_SECRET_MANAGER = True
-except ImportError:
-    HAS_SECRET_MANAGER = False
+from src.cassette import obter_cassete
+from src.certificate_registry import CertificateIdentity
+from src.dados_codec import serializar_json
+from src.deadline import Deadline, DeadlineExcedidoError
+from src.hedging import obter_hedger
+from src.secret_manager import acessar_segredo
+from src.service_catalog import servico_do_pedido
+from src.transport import Transport, obter_transporte
 
 
 class MtlsClient:
@@ -34,7 +31,10 @@ class MtlsClient:
         cert_base64: Optional[str] = None,
         cert_password: Optional[str] = None,
         secret_name: Optional[str] = None,
-        ambiente: str = "trial"
+        ambiente: str = "trial",
+        identidade: Optional[CertificateIdentity] = None,
+        transporte: Optional[Transport] = None,
+        deadline: Optional[Deadline] = None
     ):
         """
         Inicializa o cliente mTLS.
@@ -44,81 +44,115 @@ class MtlsClient:
             cert_password: Senha do certificado
             secret_name: Nome do segredo no Secret Manager (formato: projects/xxx/secrets/xxx/versions/latest)
             ambiente: 'trial' ou 'producao'
+            identidade: Identidade já extraída (certificado registrado); dispensa o P12
+            transporte: Transporte HTTP (padrão: SERPRO_TRANSPORTE, com cassete se SERPRO_CASSETE_MODO)
+            deadline: Prazo da requisição (define os timeouts de cada chamada)
         """
         self.cert_base64 = cert_base64
         self.cert_password = cert_password
         self.secret_name = secret_name
         self.ambiente = ambiente
-        self._temp_cert_path: Optional[str] = None
-        self._temp_key_path: Optional[str] = None
+        self.identidade = identidade
+        if transporte is None:
+            transporte = obter_transporte()
+            # Gravação/reprodução do tráfego quando SERPRO_CASSETE_MODO está definido
+            transporte = obter_cassete(transporte) or transporte
+        self.transporte = transporte
+        self.deadline = deadline
+        self.ultima_chamada: Optional[Dict[str, Any]] = None
         
     @property
     def api_url(self) -> str:
         """Retorna URL base da API conforme ambiente."""
         return self.API_URL_PROD if self.ambiente == "producao" else self.API_URL_TRIAL
     
+    def _timeouts(self, etapa: str) -> Optional[Tuple[float, float]]:
+        """Timeouts (connect, read) da etapa conforme o prazo restante."""
+        if self.deadline is None:
+            return None
+        return self.deadline.timeouts(etapa)
+
+    def _enviar(self, etapa: str, url: str, hedge: Optional[str] = None, **kwargs):
+        """
+        POST pelo transporte, identificando a etapa se o prazo estourar.
+
+        Com `hedge` (chave do serviço idempotente) e SERPRO_HEDGE_ATIVO, uma
+        segunda tentativa é disparada se a primeira passar do percentil de
+        latência do serviço. Tamanhos, latência e tentativas enviadas (cada
+        uma é cobrada) ficam em `ultima_chamada`.
+        """
+        timeout = self._timeouts(etapa)
+        hedger = obter_hedger() if hedge else None
+        inicio = time.monotonic()
+        tamanho = len(kwargs.get("body") or b"")
+        self.ultima_chamada = ultima = {
+            "bytes_enviados": tamanho,
+            "bytes_recebidos": 0,
+            "latencia": 0.0,
+            "tentativas": 1,
+        }
+
+        def contar_hedge():
+            ultima["tentativas"] += 1
+            ultima["bytes_enviados"] += tamanho
+
+        try:
+            if hedger is None:
+                resposta = self.transporte.post(url, timeout=timeout, **kwargs)
+            else:
+                # Cada tentativa recalcula o timeout pelo prazo restante
+                resposta = hedger.executar(
+                    hedge,
+                    lambda: self.transporte.post(url, timeout=self._timeouts(etapa), **kwargs),
+                    self.deadline,
+                    ao_tentativa_extra=contar_hedge
+                )
+            self.ultima_chamada["bytes_recebidos"] = len(resposta.content)
+            return resposta
+        except DeadlineExcedidoError as e:
+            raise DeadlineExcedidoError(f"{etapa} ({e.etapa})") from e
+        finally:
+            self.ultima_chamada["latencia"] = time.monotonic() - inicio
+            if self.deadline is not None:
+                self.deadline.registrar(etapa, inicio)
+
     def _get_cert_from_secret_manager(self) -> str:
         """Busca certificado do Google Secret Manager (apenas Firebase)."""
-        if not HAS_SECRET_MANAGER:
-            raise ValueError("Secret Manager não disponível (apenas Firebase)")
-
-        client = secretmanager.SecretManagerServiceClient()
-        response = client.access_secret_version(request={"name": self.secret_name})
-        return response.payload.data.decode("UTF-8")
+        timeout = self._timeouts("secret_manager")
+        return acessar_segredo(self.secret_name, timeout=timeout[1] if timeout else None)
 
     def _get_password_from_secret_manager(self, secret_name: str) -> str:
         """Busca senha do Secret Manager (apenas Firebase)."""
-        if not HAS_SECRET_MANAGER:
-            raise ValueError("Secret Manager não disponível (apenas Firebase)")
-
-        client = secretmanager.SecretManagerServiceClient()
-        response = client.access_secret_version(request={"name": secret_name})
-        return response.payload.data.decode("UTF-8").strip()
+        timeout = self._timeouts("secret_manager")
+        return acessar_segredo(secret_name, timeout=timeout[1] if timeout else None)
 
-    def _extract_cert_and_key(self, p12_bytes: bytes, password: str) -> tuple:
-        """Extrai certificado e chave privada do arquivo P12."""
-        private_key, certificate, _ = pkcs12.load_key_and_certificates(
-            p12_bytes,
-            password.encode() if password else None,
-            default_backend()
-        )
-        return private_key, certificate
-    
-    def _create_temp_files(self, p12_bytes: bytes, password: str) -> tuple:
+    def resolve_identity(self) -> CertificateIdentity:
         """
-        Cria arquivos temporários para certificado e chave.
-        
-        Necessário porque a biblioteca requests precisa de arquivos no filesystem.
+        Retorna a identidade mTLS, extraindo do P12 apenas uma vez.
+
+        Certificados registrados chegam já extraídos em `identidade`.
         """
-        from cryptography.hazmat.primitives import serialization
-        
-        private_key, certificate = self._extract_cert_and_key(p12_bytes, password)
-        
-        # Salvar chave privada
-        key_fd, key_path = tempfile.mkstemp(suffix='.key')
-        with os.fdopen(key_fd, 'wb') as f:
-            f.write(private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.TraditionalOpenSSL,
-                encryption_algorithm=serialization.NoEncryption()
-            ))
-        
-        # Salvar certificado
-        cert_fd, cert_path = tempfile.mkstemp(suffix='.crt')
-        with os.fdopen(cert_fd, 'wb') as f:
-            f.write(certificate.public_bytes(serialization.Encoding.PEM))
-        
-        self._temp_cert_path = cert_path
-        self._temp_key_path = key_path
-        
-        return cert_path, key_path
+        if self.identidade:
+            return self.identidade
+
+        cert_b64 = self.cert_base64
+        if self.secret_name and not cert_b64:
+            cert_b64 = self._get_cert_from_secret_manager()
+
+        if not cert_b64:
+            raise ValueError("Certificado não fornecido para ambiente de produção")
+
+        if not self.cert_password:
+            raise ValueError("Senha do certificado não fornecida")
+
+        p12_bytes = base64.b64decode(cert_b64)
+        self.identidade = CertificateIdentity.from_p12(p12_bytes, self.cert_password)
+        return self.identidade
     
-    def cleanup(self):
-        """Remove arquivos temporários."""
-        if self._temp_cert_path and os.path.exists(self._temp_cert_path):
-            os.unlink(self._temp_cert_path)
-        if self._temp_key_path and os.path.exists(self._temp_key_path):
-            os.unlink(self._temp_key_path)
+    @property
+    def certificate_fingerprint(self) -> str:
+        """SHA-256 do certificado cliente (identifica o tenant em caches)."""
+        return self.resolve_identity().fingerprint
     
     def authenticate(
         self,
@@ -145,46 +179,28 @@ class MtlsClient:
                 "scope": "default"
             }
         
-        # Obter certificado
-        cert_b64 = self.cert_base64
-        password = self.cert_password
-        
-        if self.secret_name and not cert_b64:
-            cert_b64 = self._get_cert_from_secret_manager()
-            
-        if not cert_b64:
-            raise ValueError("Certificado não fornecido para ambiente de produção")
-        
-        if not password:
-            raise ValueError("Senha do certificado não fornecida")
-        
-        # Decodificar e extrair certificado
-        p12_bytes = base64.b64decode(cert_b64)
-        cert_path, key_path = self._create_temp_files(p12_bytes, password)
-        
-        try:
-            # Criar Basic Auth
-            auth_string = f"{consumer_key}:{consumer_secret}"
-            basic_auth = base64.b64encode(auth_string.encode()).decode()
-            
-            # Fazer requisição com mTLS
-            response = requests.post(
-                self.AUTH_URL,
-                headers={
-                    "Authorization": f"Basic {basic_auth}",
-                    "role-type": "TERCEIROS",
-                    "Content-Type": "application/x-www-form-urlencoded"
-                },
-                data="grant_type=client_credentials",
-                cert=(cert_path, key_path),
-                verify=True
-            )
-            
-            response.raise_for_status()
-            return response.json()
-            
-        finally:
-            self.cleanup()
+        # Obter certificado (P12 decodificado apenas uma vez por cliente)
+        identidade = self.resolve_identity()
+
+        # Criar Basic Auth
+        auth_string = f"{consumer_key}:{consumer_secret}"
+        basic_auth = base64.b64encode(auth_string.encode()).decode()
+
+        # Fazer requisição com mTLS
+        response = self._enviar(
+            "autenticacao",
+            self.AUTH_URL,
+            headers={
+                "Authorization": f"Basic {basic_auth}",
+                "role-type": "TERCEIROS",
+                "Content-Type": "application/x-www-form-urlencoded"
+            },
+            body=b"grant_type=client_credentials",
+            identidade=identidade
+        )
+
+        response.raise_for_status()
+        return response.json()
     
     def post(
         self,
@@ -218,31 +234,21 @@ class MtlsClient:
         if headers:
             request_headers.update(headers)
         
-        # Em trial, não precisa de certificado
-        if self.ambiente == "trial":
-            response = requests.post(url, json=data, headers=request_headers)
-        else:
-            # Modo produção com mTLS
-            cert_b64 = self.cert_base64
-            if self.secret_name and not cert_b64:
-                cert_b64 = self._get_cert_from_secret_manager()
-            
-            if not cert_b64 or not self.cert_password:
-                raise ValueError("Certificado necessário para produção")
-            
-            p12_bytes = base64.b64decode(cert_b64)
-            cert_path, key_path = self._create_temp_files(p12_bytes, self.cert_password)
-            
-            try:
-                response = requests.post(
-                    url,
-                    json=data,
-                    headers=request_headers,
-                    cert=(cert_path, key_path),
-                    verify=True
-                )
-            finally:
-                self.cleanup()
+        # Em trial, não precisa de certificado; em produção usa mTLS
+        identidade = None if self.ambiente == "trial" else self.resolve_identity()
+
+        # Hedge só para serviços idempotentes do catálogo
+        servico = servico_do_pedido(data.get("pedidoDados"))
+        hedge = f"{self.ambiente}:{servico.id_sistema}/{servico.id_servico}" if servico and servico.idempotente else None
+
+        response = self._enviar(
+            "serpro",
+            url,
+            hedge=hedge,
+            headers=request_headers,
+            body=serializar_json(data),
+            identidade=identidade
+        )
 
         # Verificar status code antes de processar
         if response.status_code == 200:
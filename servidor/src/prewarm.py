@@ -0,0 +1,123 @@
+"""
+Pré-aquecimento de conexões mTLS dos certificados registrados.
+
+Na partida do processo (e, depois, sempre que um certificado fica ocioso
+além do limite) abre algumas conexões com o servidor de autenticação e
+com o gateway de produção para cada certificado do registro. Assim a
+primeira requisição após um deploy ou um período parado não paga o
+handshake completo: as conexões estão abertas ou, se o servidor as fechou,
+a sessão TLS guardada é retomada.
+
+Configuração por ambiente:
+    SERPRO_PREAQUECER_CONEXOES=0       (conexões por certificado e servidor; 0 desliga)
+    SERPRO_PREAQUECER_OCIOSIDADE=240   (segundos sem uso antes de reabrir)
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Sequence
+
+from src.certificate_registry import CertificateRegistry, obter_registro
+from src.mtls_client import MtlsClient
+from src.transport import Transport, obter_transporte
+
+logger = logging.getLogger(__name__)
+
+OCIOSIDADE_PADRAO = 240.0
+
+# Servidores com mTLS (o trial não usa certificado)
+URLS_PADRAO = (MtlsClient.AUTH_URL, MtlsClient.API_URL_PROD)
+
+
+class PreAquecedor:
+    """Mantém conexões abertas para os certificados registrados."""
+
+    def __init__(
+        self,
+        transporte: Transport,
+        registro: CertificateRegistry,
+        conexoes: int,
+        ociosidade: float = OCIOSIDADE_PADRAO,
+        urls: Sequence[str] = URLS_PADRAO
+    ):
+        """
+        Args:
+            transporte: Transporte compartilhado usado pelo MtlsClient
+            registro: Registro de certificados (tenants conhecidos)
+            conexoes: Conexões por certificado e servidor
+            ociosidade: Segundos sem uso antes de reabrir as conexões
+            urls: Servidores a aquecer
+        """
+        self.transporte = transporte
+        self.registro = registro
+        self.conexoes = conexoes
+        self.ociosidade = ociosidade
+        self.urls = tuple(urls)
+        self._aquecidos: Dict[str, float] = {}
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def aquecer_ociosos(self) -> int:
+        """
+        Aquece os certificados sem uso nem aquecimento há `ociosidade` segundos.
+
+        Returns:
+            Quantidade de conexões abertas
+        """
+        abertas = 0
+        agora = time.monotonic()
+        for identidade in self.registro.identidades():
+            ocioso = self.transporte.ocioso_ha(identidade)
+            aquecido = self._aquecidos.get(identidade.fingerprint)
+            if ocioso is not None and ocioso < self.ociosidade:
+                continue
+            if aquecido is not None and agora - aquecido < self.ociosidade:
+                continue
+            for url in self.urls:
+                abertas += self.transporte.preaquecer(url, identidade, self.conexoes)
+            self._aquecidos[identidade.fingerprint] = agora
+        return abertas
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                abertas = self.aquecer_ociosos()
+                if abertas:
+                    logger.info("Pré-aquecimento: %s conexões abertas", abertas)
+            except Exception as e:
+                logger.warning("Pré-aquecimento falhou: %s", e)
+            # Acorda algumas vezes por janela para pegar quem ficou ocioso
+            self._parar.wait(max(1.0, self.ociosidade / 4))
+
+    def iniciar(self):
+        """Inicia o aquecimento periódico em segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="preaquecimento", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+
+_preaquecedor: Optional[PreAquecedor] = None
+_preaquecedor_lock = threading.Lock()
+
+
+def obter_preaquecedor() -> Optional[PreAquecedor]:
+    """Pré-aquecedor do processo (já iniciado), ou None se SERPRO_PREAQUECER_CONEXOES=0."""
+    global _preaquecedor
+    conexoes = int(os.environ.get("SERPRO_PREAQUECER_CONEXOES", 0))
+    if conexoes <= 0:
+        return None
+    with _preaquecedor_lock:
+        if _preaquecedor is None:
+            _preaquecedor = PreAquecedor(
+                obter_transporte(),
+                obter_registro(),
+                conexoes,
+                ociosidade=float(os.environ.get("SERPRO_PREAQUECER_OCIOSIDADE", OCIOSIDADE_PADRAO))
+            )
+            _preaquecedor.iniciar()
+        return _preaquecedor
@@ -0,0 +1,68 @@
+"""
+Acesso compartilhado ao Google Secret Manager (apenas Firebase).
+
+Um único SecretManagerServiceClient por processo (o cliente gRPC é
+thread-safe e mantém o canal aberto) e um cache curto dos valores lidos,
+para que requisições concorrentes na mesma instância não abram um canal
+nem repitam a mesma leitura a cada chamada.
+
+Configuração por ambiente:
+    SERPRO_SEGREDOS_TTL=300   (segundos; 0 desliga o cache)
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+# Import condicional do Secret Manager (apenas Firebase)
+try:
+    from google.cloud import secretmanager
+    HAS_SECRET_MANAGER = True
+except ImportError:
+    HAS_SECRET_MANAGER = False
+
+TTL_PADRAO = 300.0
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+_valores: Dict[str, Tuple[str, float]] = {}
+_valores_lock = threading.Lock()
+
+
+def obter_cliente():
+    """Cliente Secret Manager compartilhado do processo."""
+    global _cliente
+    if not HAS_SECRET_MANAGER:
+        raise ValueError("Secret Manager não disponível (apenas Firebase)")
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = secretmanager.SecretManagerServiceClient()
+        return _cliente
+
+
+def acessar_segredo(nome: str, timeout: Optional[float] = None) -> str:
+    """
+    Lê a versão de um segredo, usando o cache do processo.
+
+    Args:
+        nome: projects/xxx/secrets/xxx/versions/latest
+        timeout: Timeout da chamada em segundos
+
+    Returns:
+        Valor do segredo (sem espaços nas pontas)
+    """
+    ttl = float(os.environ.get("SERPRO_SEGREDOS_TTL", TTL_PADRAO))
+    agora = time.monotonic()
+    with _valores_lock:
+        guardado = _valores.get(nome)
+    if guardado and guardado[1] > agora:
+        return guardado[0]
+
+    response = obter_cliente().access_secret_version(request={"name": nome}, timeout=timeout)
+    valor = response.payload.data.decode("UTF-8").strip()
+    if ttl > 0:
+        with _valores_lock:
+            _valores[nome] = (valor, agora + ttl)
+    return valor
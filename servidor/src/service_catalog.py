@@ -0,0 +1,328 @@
+"""
+Catálogo de serviços do Integra Contador no servidor.
+
+Espelha as chamadas feitas pelos serviços da biblioteca Dart
+(lib/src/services): para cada par (idSistema, idServico), o endpoint e a
+versaoSistema aceitos. O par é a chave: alguns idServico são usados por
+mais de um sistema (o RELPSN consulta o parcelamento com OBTERPARC174,
+o mesmo id do PARCSN-ESP). O proxy valida a requisição contra o catálogo antes
+de qualquer chamada de rede, de modo que combinações inválidas e
+identificações malformadas voltam como 400 sem custo de bilhetagem.
+
+Cada serviço também carrega metadados usados por outras partes do servidor:
+    idempotente  leitura sem efeito colateral (pode ser repetida)
+    cacheavel    resposta pode ser reaproveitada (cache_ttl)
+    prioridade   classe de admissão (critica/normal/lote)
+    prazo        orçamento padrão da requisição em segundos
+    tipos_contribuinte  1 (CPF) e/ou 2 (CNPJ) aceitos como contribuinte
+
+O dicionário é montado uma vez na importação; a busca é O(1).
+
+Configuração por ambiente:
+    SERPRO_CATALOGO_ESTRITO=1   (0: serviços fora do catálogo seguem sem validação)
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+ENDPOINT_CONSULTAR = "/Consultar"
+ENDPOINT_EMITIR = "/Emitir"
+ENDPOINT_DECLARAR = "/Declarar"
+ENDPOINT_APOIAR = "/Apoiar"
+ENDPOINT_MONITORAR = "/Monitorar"
+
+TIPO_CPF = 1
+TIPO_CNPJ = 2
+_TAMANHO_DOCUMENTO = {TIPO_CPF: 11, TIPO_CNPJ: 14}
+
+# Padrões por endpoint: (idempotente, prioridade, prazo)
+_PADROES_ENDPOINT = {
+    ENDPOINT_CONSULTAR: (True, "normal", 30.0),
+    ENDPOINT_MONITORAR: (True, "lote", 15.0),
+    ENDPOINT_APOIAR: (False, "critica", 30.0),
+    ENDPOINT_EMITIR: (False, "critica", 60.0),
+    ENDPOINT_DECLARAR: (False, "critica", 60.0),
+}
+
+_PF_PJ = (TIPO_CPF, TIPO_CNPJ)
+_PJ = (TIPO_CNPJ,)
+
+# (idSistema, idServico, endpoint, versaoSistema, tipos_contribuinte)
+_SERVICOS = (
+    # Integra-SN
+    ("PGDASD", "TRANSDECLARACAO11", ENDPOINT_DECLARAR, "1.0", _PJ),
+    ("PGDASD", "GERARDAS12", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGDASD", "CONSDECLARACAO13", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PGDASD", "CONSULTIMADECREC14", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PGDASD", "CONSDECREC15", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PGDASD", "CONSEXTRATO16", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PGDASD", "GERARDASCOBRANCA17", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGDASD", "GERARDASPROCESSO18", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGDASD", "GERARDASAVULSO19", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("REGIMEAPURACAO", "EFETUAROPCAOREGIME101", ENDPOINT_DECLARAR, "1.0", _PJ),
+    ("REGIMEAPURACAO", "CONSULTARANOSCALENDARIOS102", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("REGIMEAPURACAO", "CONSULTAROPCAOREGIME103", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("REGIMEAPURACAO", "CONSULTARRESOLUCAO104", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("DEFIS", "TRANSDECLARACAO141", ENDPOINT_DECLARAR, "1.0", _PJ),
+    ("DEFIS", "CONSDECLARACAO142", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("DEFIS", "CONSULTIMADECREC143", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("DEFIS", "CONSDECREC144", ENDPOINT_CONSULTAR, "1.0", _PJ),
+
+    # Integra-MEI
+    ("PGMEI", "GERARDASPDF21", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGMEI", "GERARDASCODBARRA22", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGMEI", "ATUBENEFICIO23", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PGMEI", "DIVIDAATIVA24", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("CCMEI", "EMITIRCCMEI121", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("CCMEI", "DADOSCCMEI122", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("CCMEI", "CCMEISITCADASTRAL123", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+
+    # Integra-DCTFWeb e MIT
+    ("DCTFWEB", "GERARGUIA31", ENDPOINT_EMITIR, "1.0", _PF_PJ),
+    ("DCTFWEB", "CONSRECIBO32", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("DCTFWEB", "CONSDECCOMPLETA33", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("DCTFWEB", "CONSXMLDECLARACAO38", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("DCTFWEB", "TRANSDECLARACAO310", ENDPOINT_DECLARAR, "1.0", _PF_PJ),
+    ("DCTFWEB", "GERARGUIAANDAMENTO313", ENDPOINT_EMITIR, "1.0", _PF_PJ),
+    ("MIT", "ENCAPURACAO314", ENDPOINT_DECLARAR, "1.0", _PF_PJ),
+    ("MIT", "SITUACAOENC315", ENDPOINT_APOIAR, "1.0", _PF_PJ),
+    ("MIT", "CONSAPURACAO316", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("MIT", "LISTAAPURACOES317", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+
+    # Integra-Procurações
+    ("PROCURACOES", "OBTERPROCURACAO41", ENDPOINT_CONSULTAR, "1", _PF_PJ),
+
+    # Integra-Sicalc
+    ("SICALC", "CONSOLIDARGERARDARF51", ENDPOINT_EMITIR, "2.9", _PF_PJ),
+    ("SICALC", "CONSULTAAPOIORECEITAS52", ENDPOINT_APOIAR, "2.9", _PF_PJ),
+    ("SICALC", "GERARDARFCODBARRA53", ENDPOINT_EMITIR, "2.9", _PF_PJ),
+
+    # Integra-CaixaPostal e DTE
+    ("CAIXAPOSTAL", "MSGCONTRIBUINTE61", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("CAIXAPOSTAL", "MSGDETALHAMENTO62", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("CAIXAPOSTAL", "INNOVAMSG63", ENDPOINT_MONITORAR, "1.0", _PF_PJ),
+    ("DTE", "CONSULTASITUACAODTE111", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+
+    # Integra-Pagamento
+    ("PAGTOWEB", "PAGAMENTOS71", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+    ("PAGTOWEB", "COMPARRECADACAO72", ENDPOINT_EMITIR, "1.0", _PF_PJ),
+    ("PAGTOWEB", "CONTACONSDOCARRPG73", ENDPOINT_CONSULTAR, "1.0", _PF_PJ),
+
+    # Autenticação de procurador
+    ("AUTENTICAPROCURADOR", "ENVIOXMLASSINADO81", ENDPOINT_APOIAR, "1.0", _PF_PJ),
+
+    # Integra-SITFIS
+    ("SITFIS", "SOLICITARPROTOCOLO91", ENDPOINT_APOIAR, "1.0", _PF_PJ),
+    ("SITFIS", "RELATORIOSITFIS92", ENDPOINT_EMITIR, "1.0", _PF_PJ),
+
+    # Eventos de atualização
+    ("EVENTOSATUALIZACAO", "SOLICEVENTOSPF131", ENDPOINT_MONITORAR, "1.0", _PF_PJ),
+    ("EVENTOSATUALIZACAO", "SOLICEVENTOSPJ132", ENDPOINT_MONITORAR, "1.0", _PF_PJ),
+    ("EVENTOSATUALIZACAO", "OBTEREVENTOSPF133", ENDPOINT_MONITORAR, "1.0", _PF_PJ),
+    ("EVENTOSATUALIZACAO", "OBTEREVENTOSPJ134", ENDPOINT_MONITORAR, "1.0", _PF_PJ),
+
+    # Parcelamentos do Simples Nacional
+    ("PARCSN", "GERARDAS161", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PARCSN", "PARCELASPARAGERAR162", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN", "PEDIDOSPARC163", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN", "OBTERPARC164", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN", "DETPAGTOPARC165", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN-ESP", "GERARDAS171", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PARCSN-ESP", "PARCELASPARAGERAR172", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN-ESP", "PEDIDOSPARC173", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN-ESP", "OBTERPARC174", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCSN-ESP", "DETPAGTOPARC175", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTSN", "GERARDAS181", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PERTSN", "PARCELASPARAGERAR182", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTSN", "PEDIDOSPARC183", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTSN", "OBTERPARC184", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTSN", "DETPAGTOPARC185", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPSN", "GERARDAS191", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("RELPSN", "PARCELASPARAGERAR192", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPSN", "PEDIDOSPARC193", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    # O RELPSN usa o id de consulta do PARCSN-ESP (relpsn_service.dart)
+    ("RELPSN", "OBTERPARC174", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPSN", "DETPAGTOPARC195", ENDPOINT_CONSULTAR, "1.0", _PJ),
+
+    # Parcelamentos do MEI
+    ("PARCMEI", "GERARDAS201", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PARCMEI", "PARCELASPARAGERAR202", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI", "PEDIDOSPARC203", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI", "OBTERPARC204", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI", "DETPAGTOPARC205", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI-ESP", "GERARDAS211", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PARCMEI-ESP", "PARCELASPARAGERAR212", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI-ESP", "PEDIDOSPARC213", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI-ESP", "OBTERPARC214", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PARCMEI-ESP", "DETPAGTOPARC215", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTMEI", "GERARDAS221", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("PERTMEI", "PARCELASPARAGERAR222", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTMEI", "PEDIDOSPARC223", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTMEI", "OBTERPARC224", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("PERTMEI", "DETPAGTOPARC225", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPMEI", "GERARDAS231", ENDPOINT_EMITIR, "1.0", _PJ),
+    ("RELPMEI", "PARCELASPARAGERAR232", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPMEI", "PEDIDOSPARC233", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPMEI", "OBTERPARC234", ENDPOINT_CONSULTAR, "1.0", _PJ),
+    ("RELPMEI", "DETPAGTOPARC235", ENDPOINT_CONSULTAR, "1.0", _PJ),
+)
+
+# Exceções aos padrões do endpoint (consultas servidas por /Apoiar)
+_IDEMPOTENTES_EXTRAS = ("CONSULTAAPOIORECEITAS52", "SITUACAOENC315", "SOLICITARPROTOCOLO91")
+_PRAZOS_EXTRAS = {"RELATORIOSITFIS92": 90.0, "TRANSDECLARACAO11": 90.0}
+
+# Campos de identificação obrigatórios no body
+CAMPOS_IDENTIFICACAO = ("contratante", "autorPedidoDados", "contribuinte")
+
+
+@dataclass(frozen=True)
+class ServicoCatalogo:
+    """Serviço conhecido e seus metadados."""
+
+    id_sistema: str
+    id_servico: str
+    endpoint: str
+    versao_sistema: str
+    tipos_contribuinte: Tuple[int, ...]
+    idempotente: bool
+    cacheavel: bool
+    prioridade: str
+    prazo: float
+
+
+def _compilar() -> Dict[Tuple[str, str], ServicoCatalogo]:
+    catalogo = {}
+    for id_sistema, id_servico, endpoint, versao, tipos in _SERVICOS:
+        idempotente, prioridade, prazo = _PADROES_ENDPOINT[endpoint]
+        idempotente = idempotente or id_servico in _IDEMPOTENTES_EXTRAS
+        catalogo[(id_sistema, id_servico)] = ServicoCatalogo(
+            id_sistema=id_sistema,
+            id_servico=id_servico,
+            endpoint=endpoint,
+            versao_sistema=versao,
+            tipos_contribuinte=tipos,
+            idempotente=idempotente,
+            cacheavel=endpoint == ENDPOINT_CONSULTAR,
+            prioridade=prioridade,
+            prazo=_PRAZOS_EXTRAS.get(id_servico, prazo),
+        )
+    return catalogo
+
+
+CATALOGO: Dict[Tuple[str, str], ServicoCatalogo] = _compilar()
+
+# Sistemas que usam cada idServico (mensagem de erro do par inválido)
+_SISTEMAS_DO_SERVICO: Dict[str, Tuple[str, ...]] = {}
+for _id_sistema, _id_servico in CATALOGO:
+    _SISTEMAS_DO_SERVICO[_id_servico] = _SISTEMAS_DO_SERVICO.get(_id_servico, ()) + (_id_sistema,)
+
+
+def catalogo_estrito() -> bool:
+    """Se serviços fora do catálogo devem ser rejeitados."""
+    return os.environ.get("SERPRO_CATALOGO_ESTRITO", "1").lower() not in ("0", "false", "nao")
+
+
+def _normalizar(identificador: Any) -> str:
+    return str(identificador).strip().upper()
+
+
+def buscar_servico(id_sistema: Any, id_servico: Any) -> Optional[ServicoCatalogo]:
+    """Serviço do catálogo pelo par (idSistema, idServico) (None se desconhecido)."""
+    if not id_sistema or not id_servico:
+        return None
+    return CATALOGO.get((_normalizar(id_sistema), _normalizar(id_servico)))
+
+
+def servico_do_pedido(pedido: Any) -> Optional[ServicoCatalogo]:
+    """Serviço do catálogo para um pedidoDados (None se desconhecido)."""
+    if not isinstance(pedido, dict):
+        return None
+    return buscar_servico(pedido.get("idSistema"), pedido.get("idServico"))
+
+
+def servico_da_requisicao(data: Dict[str, Any]) -> Optional[ServicoCatalogo]:
+    """Serviço do catálogo para um payload do proxy_serpro (sem validar)."""
+    body = data.get("body") if isinstance(data, dict) else None
+    return servico_do_pedido(body.get("pedidoDados") if isinstance(body, dict) else None)
+
+
+def prazo_do_servico(data: Dict[str, Any]) -> Optional[float]:
+    """Prazo padrão do serviço de um payload do proxy_serpro (None se desconhecido)."""
+    servico = servico_da_requisicao(data)
+    return servico.prazo if servico else None
+
+
+def _validar_identificacao(campo: str, valor: Any, tipos: Tuple[int, ...] = _PF_PJ):
+    if not isinstance(valor, dict):
+        raise ValueError(f"body.{campo} deve ser um objeto com numero e tipo")
+    numero = "".join(c for c in str(valor.get("numero") or "") if c.isdigit())
+    try:
+        tipo = int(valor.get("tipo"))
+    except (TypeError, ValueError):
+        raise ValueError(f"body.{campo}.tipo deve ser 1 (CPF) ou 2 (CNPJ)")
+    if tipo not in _TAMANHO_DOCUMENTO:
+        raise ValueError(f"body.{campo}.tipo deve ser 1 (CPF) ou 2 (CNPJ)")
+    if len(numero) != _TAMANHO_DOCUMENTO[tipo]:
+        raise ValueError(
+            f"body.{campo}.numero inválido para tipo {tipo}: "
+            f"esperados {_TAMANHO_DOCUMENTO[tipo]} dígitos"
+        )
+    if tipo not in tipos:
+        raise ValueError(f"body.{campo}: serviço aceita apenas {'CNPJ' if tipos == _PJ else 'CPF'}")
+
+
+def validar_requisicao(endpoint: str, body: Dict[str, Any]) -> Optional[ServicoCatalogo]:
+    """
+    Valida endpoint, pedidoDados e identificações contra o catálogo.
+
+    Args:
+        endpoint: Endpoint SERPRO (ex: '/Consultar')
+        body: Corpo SERPRO (contratante, autorPedidoDados, contribuinte, pedidoDados)
+
+    Returns:
+        O serviço do catálogo, ou None se desconhecido e o catálogo não for estrito
+
+    Raises:
+        ValueError: Requisição que a API SERPRO rejeitaria
+    """
+    if endpoint not in _PADROES_ENDPOINT:
+        raise ValueError(f"endpoint inválido: '{endpoint}'. Use {', '.join(_PADROES_ENDPOINT)}.")
+    if not isinstance(body, dict):
+        raise ValueError("body deve ser um objeto")
+
+    pedido = body.get("pedidoDados")
+    if not isinstance(pedido, dict):
+        raise ValueError("Campo obrigatório ausente: body.pedidoDados")
+    for campo in ("idSistema", "idServico", "versaoSistema"):
+        if not pedido.get(campo):
+            raise ValueError(f"Campo obrigatório ausente: body.pedidoDados.{campo}")
+    if "dados" not in pedido:
+        raise ValueError("Campo obrigatório ausente: body.pedidoDados.dados")
+
+    servico = servico_do_pedido(pedido)
+    if servico is None:
+        sistemas = _SISTEMAS_DO_SERVICO.get(_normalizar(pedido["idServico"]))
+        if sistemas:
+            raise ValueError(
+                f"idServico {_normalizar(pedido['idServico'])} pertence ao idSistema "
+                f"{' ou '.join(sistemas)}, não a '{pedido['idSistema']}'"
+            )
+        if catalogo_estrito():
+            raise ValueError(f"idServico desconhecido: '{pedido['idServico']}'")
+    else:
+        if endpoint != servico.endpoint:
+            raise ValueError(f"idServico {servico.id_servico} usa o endpoint {servico.endpoint}, não {endpoint}")
+        if str(pedido["versaoSistema"]) != servico.versao_sistema:
+            raise ValueError(
+                f"versaoSistema '{pedido['versaoSistema']}' não suportada por "
+                f"{servico.id_servico} (use '{servico.versao_sistema}')"
+            )
+
+    for campo in CAMPOS_IDENTIFICACAO:
+        if campo not in body:
+            raise ValueError(f"Campo obrigatório ausente: body.{campo}")
+        tipos = servico.tipos_contribuinte if servico and campo == "contribuinte" else _PF_PJ
+        _validar_identificacao(campo, body[campo], tipos)
+
+    return servico
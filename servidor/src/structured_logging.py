@@ -0,0 +1,273 @@
+"""
+Logging estruturado e não bloqueante.
+
+O caminho da requisição só monta o LogRecord e o coloca numa fila
+(QueueHandler); formatação JSON e escrita ficam numa thread própria
+(QueueListener). Antes de enfileirar, filtros baratos:
+
+- correlation_id: copiado do contexto da requisição para o registro;
+- amostragem: logs abaixo de WARNING são mantidos para uma fração das
+  requisições (decisão por correlation_id: a requisição inteira fica ou sai);
+- limite de erros: no máximo N registros ERROR+ por segundo para a mesma
+  mensagem; os suprimidos são informados no próximo registro emitido.
+
+A saída é uma linha JSON por registro (campos severity/message aceitos
+pelo Cloud Logging). Certificados, senhas e tokens são mascarados tanto
+nos campos extras quanto no texto da mensagem.
+
+Configuração por ambiente:
+    SERPRO_LOG_NIVEL=INFO
+    SERPRO_LOG_AMOSTRAGEM=1.0   (fração de requisições com logs INFO)
+    SERPRO_LOG_ERROS_POR_SEGUNDO=5
+    SERPRO_LOG_FILA=10000       (registros acima disso são descartados)
+"""
+
+import os
+import re
+import json
+import sys
+import uuid
+import zlib
+import time
+import queue
+import atexit
+import logging
+import threading
+import traceback
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, TextIO
+
+from src.dados_codec import serializar_json
+
+# Header de correlação aceito/devolvido pelos wrappers
+HEADER_CORRELACAO = "X-Correlation-ID"
+
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "correlation_id", default=None
+)
+
+# Chaves de campos extras cujo valor nunca é registrado
+_CHAVES_SENSIVEIS = re.compile(
+    r"(senha|password|secret|token|authorization|certificado_base64|_base64$|key_pem|p12)",
+    re.IGNORECASE
+)
+
+# Padrões sensíveis dentro de textos livres
+_PADROES_SENSIVEIS = (
+    (re.compile(r"-----BEGIN [A-Z ]+-----.*?-----END [A-Z ]+-----", re.DOTALL), "[PEM]"),
+    (re.compile(r"(Bearer|Basic)\s+[A-Za-z0-9._~+/=-]+"), r"\1 ***"),
+    (re.compile(r"(['\"]?(?:senha|password|secret|token|jwt_token|access_token)['\"]?\s*[:=]\s*['\"]?)[^'\",\s}]+", re.IGNORECASE), r"\1***"),
+    (re.compile(r"[A-Za-z0-9+/]{200,}={0,2}"), "[base64]"),
+)
+
+MARCADOR = "***"
+
+
+def definir_correlation_id(valor: Optional[str] = None) -> str:
+    """
+    Define o correlation_id da requisição corrente (gera um se ausente).
+
+    Returns:
+        O correlation_id em uso
+    """
+    valor = (valor or "").strip()[:128] or uuid.uuid4().hex
+    _correlation_id.set(valor)
+    return valor
+
+
+def obter_correlation_id() -> Optional[str]:
+    """correlation_id da requisição corrente, se definido."""
+    return _correlation_id.get()
+
+
+def redigir_texto(texto: str) -> str:
+    """Mascara PEMs, tokens, senhas e blobs Base64 num texto."""
+    for padrao, substituto in _PADROES_SENSIVEIS:
+        texto = padrao.sub(substituto, texto)
+    return texto
+
+
+def redigir(valor: Any, chave: str = "") -> Any:
+    """Mascara valores sensíveis de uma estrutura (recursivo)."""
+    if chave and _CHAVES_SENSIVEIS.search(chave):
+        return MARCADOR if valor else valor
+    if isinstance(valor, dict):
+        return {k: redigir(v, str(k)) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [redigir(item) for item in valor]
+    if isinstance(valor, str):
+        return redigir_texto(valor)
+    return valor
+
+
+class _CorrelacaoFilter(logging.Filter):
+    """Copia o correlation_id do contexto (thread da requisição) para o registro."""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class _AmostragemFilter(logging.Filter):
+    """Mantém logs abaixo de WARNING para uma fração das requisições."""
+
+    def __init__(self, taxa: float):
+        super().__init__()
+        self.taxa = taxa
+        self._limite = int(taxa * 0xFFFFFFFF)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.taxa >= 1.0:
+            return True
+        correlacao = getattr(record, "correlation_id", None)
+        if correlacao is None:
+            return True
+        # Mesmo hash para todos os registros da requisição
+        return zlib.crc32(correlacao.encode()) <= self._limite
+
+
+class _LimiteErrosFilter(logging.Filter):
+    """Token bucket por mensagem para registros ERROR+."""
+
+    def __init__(self, por_segundo: float):
+        super().__init__()
+        self.por_segundo = por_segundo
+        self._baldes: Dict[Any, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR:
+            return True
+        chave = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        agora = time.monotonic()
+        with self._lock:
+            # [fichas, último reabastecimento, suprimidos]
+            balde = self._baldes.setdefault(chave, [self.por_segundo, agora, 0])
+            balde[0] = min(self.por_segundo, balde[0] + (agora - balde[1]) * self.por_segundo)
+            balde[1] = agora
+            if balde[0] < 1:
+                balde[2] += 1
+                return False
+            balde[0] -= 1
+            if balde[2]:
+                record.suprimidos = balde[2]
+                balde[2] = 0
+            if len(self._baldes) > 10000:
+                self._baldes.clear()
+        return True
+
+
+class _FilaHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloqueia: com a fila cheia, descarta e conta."""
+
+    def __init__(self, fila: "queue.Queue"):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # Só a interpolação %-style acontece aqui; JSON e traceback ficam no listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+# Atributos padrão do LogRecord (o resto veio de `extra=`)
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "correlation_id", "suprimidos", "taskName"
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com redação de dados sensíveis."""
+
+    def format(self, record):
+        entrada = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": redigir_texto(record.getMessage()),
+        }
+        correlacao = getattr(record, "correlation_id", None)
+        if correlacao:
+            entrada["correlation_id"] = correlacao
+        suprimidos = getattr(record, "suprimidos", None)
+        if suprimidos:
+            entrada["suprimidos"] = suprimidos
+
+        extras = {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_PADRAO}
+        if extras:
+            entrada.update(redigir(extras))
+
+        if record.exc_info:
+            entrada["exception"] = redigir_texto(
+                "".join(traceback.format_exception(*record.exc_info))
+            )
+        try:
+            return serializar_json(entrada).decode("utf-8")
+        except TypeError:
+            # Extras não serializáveis (objetos arbitrários) viram texto
+            return json.dumps(entrada, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[_FilaHandler] = None
+_configuracao_lock = threading.Lock()
+
+
+def configurar_logging(stream: Optional[TextIO] = None, nivel: Optional[str] = None) -> _FilaHandler:
+    """
+    Instala o pipeline assíncrono no logger raiz (idempotente).
+
+    Args:
+        stream: Destino das linhas JSON (padrão: stdout)
+        nivel: Nível mínimo (padrão: SERPRO_LOG_NIVEL ou INFO)
+
+    Returns:
+        O handler da fila (expõe `descartados`)
+    """
+    global _listener, _handler
+    with _configuracao_lock:
+        if _handler is not None:
+            return _handler
+
+        fila: "queue.Queue" = queue.Queue(maxsize=int(os.environ.get("SERPRO_LOG_FILA", 10000)))
+        handler = _FilaHandler(fila)
+        handler.addFilter(_CorrelacaoFilter())
+        handler.addFilter(_AmostragemFilter(float(os.environ.get("SERPRO_LOG_AMOSTRAGEM", 1.0))))
+        handler.addFilter(_LimiteErrosFilter(float(os.environ.get("SERPRO_LOG_ERROS_POR_SEGUNDO", 5))))
+
+        saida = logging.StreamHandler(stream or sys.stdout)
+        saida.setFormatter(JsonFormatter())
+
+        raiz = logging.getLogger()
+        for antigo in list(raiz.handlers):
+            raiz.removeHandler(antigo)
+        raiz.addHandler(handler)
+        raiz.setLevel((nivel or os.environ.get("SERPRO_LOG_NIVEL", "INFO")).upper())
+
+        _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=True)
+        _listener.start()
+        # Esvazia a fila ao encerrar o processo
+        atexit.register(encerrar_logging)
+        _handler = handler
+        return handler
+
+
+def encerrar_logging():
+    """Para o listener, gravando os registros pendentes."""
+    global _listener, _handler
+    with _configuracao_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            logging.getLogger().removeHandler(_handler)
+            _handler = None
@@ -0,0 +1,67 @@
+"""
+Escopo de tenant das consultas de uso e de jobs.
+
+Uso contabilizado e jobs de fan-out ficam associados à credencial de quem
+os gerou: o certificado em produção ou, no trial (sem mTLS), o
+access_token. As consultas exigem a mesma credencial, enviada nos headers
+X-Certificado-Handle (handle do registro de certificados) ou
+X-Access-Token, e só enxergam o que foi gerado com ela. O escopo guardado
+é um hash: nenhuma credencial vai para disco.
+"""
+
+import hashlib
+from typing import Any, Dict, Mapping, Optional
+
+from src.certificate_registry import obter_registro
+
+HEADER_CERTIFICADO = "X-Certificado-Handle"
+HEADER_ACCESS_TOKEN = "X-Access-Token"
+
+
+class CredencialAusenteError(ValueError):
+    """Consulta de dados de tenant sem credencial de quem chama."""
+
+
+def escopo_da_credencial(fingerprint: Optional[str] = None, access_token: Optional[str] = None) -> str:
+    """
+    Escopo derivado da credencial (o certificado tem precedência).
+
+    Args:
+        fingerprint: Fingerprint do certificado mTLS
+        access_token: Token do SERPRO (trial)
+
+    Raises:
+        CredencialAusenteError: Sem certificado nem token
+    """
+    if fingerprint:
+        credencial = f"certificado\x1f{fingerprint}"
+    elif access_token:
+        credencial = f"token\x1f{access_token}"
+    else:
+        raise CredencialAusenteError(
+            f"Credencial obrigatória: {HEADER_CERTIFICADO} (produção) ou {HEADER_ACCESS_TOKEN} (trial)"
+        )
+    return hashlib.sha256(credencial.encode()).hexdigest()[:32]
+
+
+def escopo_do_chamador(data: Mapping[str, Any]) -> str:
+    """
+    Escopo de quem consulta: certificado_handle ou access_token.
+
+    Raises:
+        CredencialAusenteError: Sem credencial
+        CertificadoNaoRegistradoError: Handle desconhecido ou expirado
+    """
+    handle = data.get("certificado_handle")
+    if handle:
+        return escopo_da_credencial(fingerprint=obter_registro().obter(handle).fingerprint)
+    return escopo_da_credencial(access_token=data.get("access_token"))
+
+
+def credencial_dos_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    """Campos de credencial (certificado_handle/access_token) enviados nos headers."""
+    campos = {
+        "certificado_handle": headers.get(HEADER_CERTIFICADO),
+        "access_token": headers.get(HEADER_ACCESS_TOKEN),
+    }
+    return {campo: valor for campo, valor in campos.items() if valor}
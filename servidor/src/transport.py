@@ -0,0 +1,612 @@
+"""
+Transportes HTTP usados pelo MtlsClient para falar com a API SERPRO.
+
+- Http1Transport: HTTP/1.1 via requests, com pool de conexões por certificado.
+- Http2Transport: HTTP/2 via httpx, multiplexando chamadas concorrentes
+  sobre poucas conexões mTLS por certificado. Se httpx/h2 não estiverem
+  instalados, ou se o servidor não negociar h2 via ALPN, usa HTTP/1.1.
+
+Nos dois, a resposta é lida em blocos e o timeout de leitura vale para a
+resposta inteira (não só para cada leitura do socket): uma resposta que
+chega aos poucos não passa do prazo da requisição.
+
+Nos dois, o SSLContext de cada certificado guarda a sessão TLS (ticket)
+por servidor e a reapresenta nas conexões novas: depois da primeira, o
+handshake mTLS é retomado sem nova troca de certificados. Quantidade e
+duração dos handshakes (completos e retomados) aparecem em estatisticas().
+
+O transporte é escolhido pela variável de ambiente SERPRO_TRANSPORTE
+('http1' ou 'http2'). Os clientes por certificado ficam em LRU limitado
+por SERPRO_TRANSPORTE_MAX_CERTIFICADOS (padrão 256).
+"""
+
+import os
+import ssl
+import time
+import weakref
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from typing import Callable, Dict, Any, Iterable, Optional, Tuple, Iterator
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from src.certificate_registry import CertificateIdentity
+from src.dados_codec import carregar_json
+from src.deadline import DeadlineExcedidoError
+
+# Import condicional do httpx com suporte a HTTP/2 (opcional)
+try:
+    import httpx
+    import h2  # noqa: F401 - necessário para httpx negociar HTTP/2
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+logger = logging.getLogger(__name__)
+
+# Variáveis de ambiente
+ENV_TRANSPORTE = "SERPRO_TRANSPORTE"
+ENV_HTTP2_MAX_CONEXOES = "SERPRO_HTTP2_MAX_CONEXOES"
+ENV_HTTP1_MAX_CONEXOES = "SERPRO_HTTP1_MAX_CONEXOES"
+ENV_MAX_CERTIFICADOS = "SERPRO_TRANSPORTE_MAX_CERTIFICADOS"
+
+# Certificados com pool de conexões aberto ao mesmo tempo (os menos usados são fechados)
+MAX_CERTIFICADOS_PADRAO = 256
+
+TRANSPORTE_HTTP1 = "http1"
+TRANSPORTE_HTTP2 = "http2"
+
+# Bloco máximo por leitura da resposta (o prazo é conferido entre blocos)
+TAMANHO_BLOCO = 64 * 1024
+
+
+class HttpStatusError(Exception):
+    """Resposta HTTP com status de erro (equivalente a raise_for_status)."""
+
+    def __init__(self, resposta: "RespostaHttp"):
+        self.resposta = resposta
+        super().__init__(f"{resposta.status_code} {resposta.reason} - {resposta.text}")
+
+
+class RespostaHttp:
+    """Resposta HTTP normalizada, independente da biblioteca de transporte."""
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        reason: str = "",
+        http_version: str = "HTTP/1.1"
+    ):
+        self.status_code = status_code
+        # Chaves em minúsculas: acesso case-insensitive como no requests
+        self.headers = {chave.lower(): valor for chave, valor in headers.items()}
+        self.content = content
+        self.reason = reason
+        self.http_version = http_version
+
+    @property
+    def text(self) -> str:
+        """Corpo decodificado como texto."""
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        """Corpo decodificado como JSON."""
+        return carregar_json(self.content)
+
+    def raise_for_status(self):
+        """Lança HttpStatusError para status 4xx/5xx."""
+        if self.status_code >= 400:
+            raise HttpStatusError(self)
+
+
+def _limite_da_resposta(timeout: Optional[Any]) -> Optional[float]:
+    """Instante (monotonic) até o qual a resposta inteira precisa chegar."""
+    if timeout is None:
+        return None
+    return time.monotonic() + (timeout[1] if isinstance(timeout, tuple) else timeout)
+
+
+def _ler_no_prazo(blocos: Iterable[bytes], limite: Optional[float]) -> bytes:
+    """
+    Junta os blocos da resposta conferindo o prazo entre eles.
+
+    Raises:
+        DeadlineExcedidoError: Se a resposta passar de `limite`
+    """
+    partes = []
+    for bloco in blocos:
+        partes.append(bloco)
+        if limite is not None and time.monotonic() > limite:
+            raise DeadlineExcedidoError("leitura")
+    return b"".join(partes)
+
+
+@contextmanager
+def arquivos_certificado(identidade: CertificateIdentity) -> Iterator[Tuple[str, str]]:
+    """
+    Grava certificado e chave em arquivos temporários e os remove ao final.
+
+    Necessário porque requests/ssl carregam certificados do filesystem.
+    """
+    key_fd, key_path = tempfile.mkstemp(suffix='.key')
+    cert_fd, cert_path = tempfile.mkstemp(suffix='.crt')
+    try:
+        with os.fdopen(key_fd, 'wb') as f:
+            f.write(identidade.key_pem)
+        with os.fdopen(cert_fd, 'wb') as f:
+            f.write(identidade.cert_pem)
+        yield cert_path, key_path
+    finally:
+        for caminho in (cert_path, key_path):
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+
+
+class ContextoTlsRetomavel(ssl.SSLContext):
+    """
+    SSLContext que retoma sessões TLS por servidor.
+
+    A cada conexão nova, apresenta a sessão mais recente do mesmo servidor
+    (da última conexão ainda aberta ou da última fechada, que já receberam
+    os tickets TLS 1.3) e informa duração e retomada do handshake a
+    `ao_handshake`. Os tickets TLS 1.3 chegam depois do handshake, então
+    os transportes entregam a sessão de cada conexão em guardar_sessao()
+    depois de uma resposta ou antes de fechá-la.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.ao_handshake: Optional[Callable[[float, bool], None]] = None
+        self._sessoes: Dict[Optional[str], ssl.SSLSession] = {}
+        self._ultimas: Dict[Optional[str], "weakref.ref[ssl.SSLSocket]"] = {}
+        self._sessoes_lock = threading.Lock()
+
+    def _sessao(self, servidor: Optional[str]) -> Optional[ssl.SSLSession]:
+        with self._sessoes_lock:
+            ultima = self._ultimas.get(servidor)
+            conexao = ultima() if ultima else None
+            # Conexão ainda aberta tem os tickets mais novos (chegam após o handshake)
+            sessao = conexao.session if conexao is not None else None
+            if sessao is not None:
+                self._sessoes[servidor] = sessao
+            return self._sessoes.get(servidor)
+
+    def guardar_sessao(self, conexao: Any):
+        """Guarda a sessão atual de uma conexão TLS deste contexto (ignora as demais)."""
+        if not isinstance(conexao, ssl.SSLSocket) or conexao.context is not self:
+            return
+        sessao = conexao.session
+        if sessao is not None:
+            with self._sessoes_lock:
+                self._sessoes[conexao.server_hostname] = sessao
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None:
+            session = self._sessao(server_hostname)
+        inicio = time.perf_counter()
+        conexao = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        duracao = time.perf_counter() - inicio
+        with self._sessoes_lock:
+            self._ultimas[server_hostname] = weakref.ref(conexao)
+        if self.ao_handshake is not None:
+            self.ao_handshake(duracao, conexao.session_reused)
+        return conexao
+
+
+def criar_ssl_context(identidade: Optional[CertificateIdentity]) -> ContextoTlsRetomavel:
+    """Cria SSLContext com verificação do servidor e certificado cliente (mTLS)."""
+    contexto = ContextoTlsRetomavel(ssl.PROTOCOL_TLS_CLIENT)
+    contexto.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    if identidade:
+        with arquivos_certificado(identidade) as (cert_path, key_path):
+            contexto.load_cert_chain(cert_path, key_path)
+    return contexto
+
+
+class _PoolPorCertificado:
+    """
+    Clientes HTTP por certificado, em LRU.
+
+    Além de `maximo` certificados, o cliente menos usado é fechado (suas
+    conexões ociosas são liberadas) e recriado se o certificado voltar.
+    """
+
+    def __init__(self, criar: Callable[[Optional[CertificateIdentity]], Any], maximo: int):
+        self._criar = criar
+        self._maximo = maximo
+        self._clientes: "OrderedDict[Optional[str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, identidade: Optional[CertificateIdentity]) -> Any:
+        chave = identidade.fingerprint if identidade else None
+        with self._lock:
+            cliente = self._clientes.get(chave)
+            if cliente is None:
+                cliente = self._clientes[chave] = self._criar(identidade)
+            self._clientes.move_to_end(chave)
+            excedentes = []
+            while len(self._clientes) > self._maximo:
+                excedentes.append(self._clientes.popitem(last=False)[1])
+        for excedente in excedentes:
+            excedente.close()
+        return cliente
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clientes)
+
+    def fechar(self):
+        with self._lock:
+            clientes = list(self._clientes.values())
+            self._clientes.clear()
+        for cliente in clientes:
+            cliente.close()
+
+
+class Transport(ABC):
+    """Interface comum dos transportes HTTP."""
+
+    nome = ""
+
+    def __init__(self, max_certificados: int = MAX_CERTIFICADOS_PADRAO):
+        """
+        Args:
+            max_certificados: Certificados com clientes/conexões mantidos ao mesmo tempo
+        """
+        self._lock = threading.Lock()
+        self._estatisticas: Dict[str, Any] = {"requisicoes": 0, "conexoes": 0}
+        self._max_certificados = max_certificados
+        self._ultimo_uso: "OrderedDict[Optional[str], float]" = OrderedDict()
+
+    def _contar(self, chave: str, quantidade: float = 1):
+        """Incrementa um contador de estatística."""
+        with self._lock:
+            self._estatisticas[chave] = self._estatisticas.get(chave, 0) + quantidade
+
+    def _registrar_handshake(self, duracao: float, retomado: bool):
+        """Callback dos contextos TLS: conta handshakes e soma sua duração."""
+        tipo = "retomados" if retomado else "completos"
+        with self._lock:
+            for chave, quantidade in (
+                ("conexoes", 1),
+                (f"handshakes_{tipo}", 1),
+                (f"handshake_ms_{tipo}", duracao * 1000),
+            ):
+                self._estatisticas[chave] = self._estatisticas.get(chave, 0) + quantidade
+
+    def _contexto_tls(self, identidade: Optional[CertificateIdentity]) -> ContextoTlsRetomavel:
+        """SSLContext do certificado, com os handshakes contabilizados neste transporte."""
+        contexto = criar_ssl_context(identidade)
+        contexto.ao_handshake = self._registrar_handshake
+        return contexto
+
+    def _marcar_uso(self, identidade: Optional[CertificateIdentity]):
+        chave = identidade.fingerprint if identidade else None
+        with self._lock:
+            self._ultimo_uso[chave] = time.monotonic()
+            self._ultimo_uso.move_to_end(chave)
+            while len(self._ultimo_uso) > self._max_certificados:
+                self._ultimo_uso.popitem(last=False)
+
+    def ocioso_ha(self, identidade: Optional[CertificateIdentity]) -> Optional[float]:
+        """Segundos desde a última chamada com o certificado (None se nunca usado)."""
+        with self._lock:
+            ultimo = self._ultimo_uso.get(identidade.fingerprint if identidade else None)
+        return None if ultimo is None else time.monotonic() - ultimo
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores de requisições, conexões, handshakes TLS e versões HTTP usadas."""
+        with self._lock:
+            resultado = {"transporte": self.nome, **self._estatisticas}
+        for tipo in ("completos", "retomados"):
+            quantidade = resultado.get(f"handshakes_{tipo}")
+            if quantidade:
+                total = resultado.pop(f"handshake_ms_{tipo}")
+                resultado[f"handshake_ms_medio_{tipo}"] = round(total / quantidade, 1)
+        return resultado
+
+    def _head(self, url: str, identidade: Optional[CertificateIdentity], timeout: float) -> bool:
+        """HEAD leve no servidor, só para abrir a conexão (False se não suportado)."""
+        return False
+
+    def preaquecer(
+        self,
+        url: str,
+        identidade: Optional[CertificateIdentity] = None,
+        conexoes: int = 1,
+        timeout: float = 5.0
+    ) -> int:
+        """
+        Abre conexões com o servidor de `url` antes da primeira chamada real.
+
+        O primeiro HEAD faz o handshake completo e obtém o ticket TLS; os
+        demais, simultâneos (cada um ocupa uma conexão do pool), já retomam
+        a sessão. As conexões voltam abertas ao pool.
+
+        Returns:
+            Quantas conexões responderam
+        """
+        def abrir(_: int) -> bool:
+            try:
+                return self._head(url, identidade, timeout)
+            except Exception as e:
+                logger.info("Pré-aquecimento de %s falhou: %s", url, e)
+                return False
+
+        abertas = int(abrir(0)) if conexoes > 0 else 0
+        if conexoes > 1:
+            with ThreadPoolExecutor(max_workers=conexoes - 1) as executor:
+                abertas += sum(executor.map(abrir, range(1, conexoes)))
+        self._contar("conexoes_preaquecidas", abertas)
+        return abertas
+
+    @abstractmethod
+    def post(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        body: bytes,
+        identidade: Optional[CertificateIdentity] = None,
+        timeout: Optional[Any] = None
+    ) -> RespostaHttp:
+        """
+        Envia POST.
+
+        Args:
+            url: URL completa
+            headers: Headers da requisição
+            body: Corpo já serializado
+            identidade: Certificado cliente para mTLS (None = sem mTLS)
+            timeout: Timeout em segundos ou tupla (connect, read); o read
+                limita a resposta inteira
+
+        Raises:
+            DeadlineExcedidoError: Se a conexão ou a leitura estourar o timeout
+        """
+
+    def close(self):
+        """Libera conexões mantidas pelo transporte."""
+
+
+class _ConexaoTlsRetomavel(HTTPSConnection):
+    """Conexão urllib3 que entrega a sessão TLS ao contexto antes de fechar."""
+
+    def close(self):
+        contexto = getattr(self.sock, "context", None)
+        if isinstance(contexto, ContextoTlsRetomavel):
+            contexto.guardar_sessao(self.sock)
+        super().close()
+
+
+class _PoolTlsRetomavel(HTTPSConnectionPool):
+    ConnectionCls = _ConexaoTlsRetomavel
+
+
+class _AdaptadorTls(HTTPAdapter):
+    """HTTPAdapter que usa o SSLContext do certificado em todas as conexões."""
+
+    def __init__(self, contexto: ssl.SSLContext, **kwargs):
+        self._contexto = contexto
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self._contexto
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            **self.poolmanager.pool_classes_by_scheme, "https": _PoolTlsRetomavel,
+        }
+
+
+class Http1Transport(Transport):
+    """
+    HTTP/1.1 via requests com uma sessão (pool de conexões) por certificado.
+
+    O certificado é carregado uma vez no SSLContext da sessão; conexões
+    ociosas são reaproveitadas e as novas retomam a sessão TLS.
+    """
+
+    nome = TRANSPORTE_HTTP1
+
+    def __init__(self, max_conexoes: int = 10, max_certificados: int = MAX_CERTIFICADOS_PADRAO):
+        """
+        Args:
+            max_conexoes: Conexões mantidas abertas por certificado e servidor
+            max_certificados: Certificados com sessão aberta ao mesmo tempo
+        """
+        super().__init__(max_certificados)
+        self._max_conexoes = max_conexoes
+        self._sessoes = _PoolPorCertificado(self._criar_sessao, max_certificados)
+
+    def _criar_sessao(self, identidade: Optional[CertificateIdentity]) -> requests.Session:
+        sessao = requests.Session()
+        # Sem cookies: cada chamada é independente, como no requests.post
+        sessao.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        sessao.mount("https://", _AdaptadorTls(
+            self._contexto_tls(identidade),
+            pool_connections=4,
+            pool_maxsize=self._max_conexoes
+        ))
+        return sessao
+
+    def _sessao(self, identidade: Optional[CertificateIdentity]) -> requests.Session:
+        """Obtém (ou cria) a sessão requests do certificado."""
+        return self._sessoes.obter(identidade)
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        self._contar("HTTP/1.1")
+        self._marcar_uso(identidade)
+
+        limite = _limite_da_resposta(timeout)
+        try:
+            response = self._sessao(identidade).post(
+                url, data=body, headers=headers, timeout=timeout, stream=True
+            )
+            try:
+                conteudo = _ler_no_prazo(self._blocos(response), limite)
+            finally:
+                response.close()
+        except requests.exceptions.ConnectTimeout as e:
+            raise DeadlineExcedidoError("conexao") from e
+        except (requests.exceptions.Timeout, urllib3.exceptions.ReadTimeoutError) as e:
+            raise DeadlineExcedidoError("leitura") from e
+
+        return RespostaHttp(
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=conteudo,
+            reason=response.reason or ""
+        )
+
+    @staticmethod
+    def _blocos(response: requests.Response) -> Iterator[bytes]:
+        """Blocos da resposta à medida que chegam (read1 não espera o bloco encher)."""
+        ler = getattr(response.raw, "read1", None)
+        if ler is None:
+            # urllib3 1.x: sem read1
+            yield from response.iter_content(TAMANHO_BLOCO)
+            return
+        while True:
+            bloco = ler(TAMANHO_BLOCO, decode_content=True)
+            if not bloco:
+                return
+            yield bloco
+
+    def _head(self, url, identidade, timeout) -> bool:
+        self._sessao(identidade).head(url, timeout=timeout)
+        return True
+
+    def close(self):
+        self._sessoes.fechar()
+
+
+class Http2Transport(Transport):
+    """
+    HTTP/2 via httpx com um cliente (pool) por certificado.
+
+    Chamadas concorrentes do mesmo certificado compartilham a mesma conexão
+    como streams HTTP/2. O ALPN oferece 'h2' e 'http/1.1'; se o gateway
+    escolher HTTP/1.1, o httpx segue em HTTP/1.1 sem intervenção.
+    """
+
+    nome = TRANSPORTE_HTTP2
+
+    def __init__(self, max_conexoes: int = 2, max_certificados: int = MAX_CERTIFICADOS_PADRAO):
+        """
+        Args:
+            max_conexoes: Máximo de conexões por certificado (cada uma multiplexa streams)
+            max_certificados: Certificados com cliente aberto ao mesmo tempo
+        """
+        super().__init__(max_certificados)
+        self._max_conexoes = max_conexoes
+        self._clientes = _PoolPorCertificado(self._criar_cliente, max_certificados)
+
+    def _criar_cliente(self, identidade: Optional[CertificateIdentity]) -> "httpx.Client":
+        contexto = self._contexto_tls(identidade)
+
+        def guardar_sessao(response: "httpx.Response"):
+            # Com a resposta lida, os tickets TLS 1.3 da conexão já chegaram
+            stream = response.extensions.get("network_stream")
+            if stream is not None:
+                contexto.guardar_sessao(stream.get_extra_info("ssl_object"))
+
+        return httpx.Client(
+            http2=True,
+            verify=contexto,
+            limits=httpx.Limits(
+                max_connections=self._max_conexoes,
+                max_keepalive_connections=self._max_conexoes
+            ),
+            event_hooks={"response": [guardar_sessao]}
+        )
+
+    def _cliente(self, identidade: Optional[CertificateIdentity]) -> "httpx.Client":
+        """Obtém (ou cria) o cliente httpx do certificado."""
+        return self._clientes.obter(identidade)
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        self._marcar_uso(identidade)
+
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+        limite = _limite_da_resposta(timeout.read if isinstance(timeout, httpx.Timeout) else timeout)
+        try:
+            with self._cliente(identidade).stream(
+                "POST",
+                url,
+                content=body,
+                headers=headers,
+                timeout=timeout
+            ) as response:
+                conteudo = _ler_no_prazo(response.iter_bytes(), limite)
+        except (httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise DeadlineExcedidoError("conexao") from e
+        except httpx.TimeoutException as e:
+            raise DeadlineExcedidoError("leitura") from e
+        self._contar(response.http_version)
+
+        return RespostaHttp(
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=conteudo,
+            reason=response.reason_phrase,
+            http_version=response.http_version
+        )
+
+    def _head(self, url, identidade, timeout) -> bool:
+        self._cliente(identidade).head(url, timeout=timeout)
+        return True
+
+    def close(self):
+        self._clientes.fechar()
+
+
+_transportes: Dict[str, Transport] = {}
+_transportes_lock = threading.Lock()
+
+
+def obter_transporte(nome: Optional[str] = None) -> Transport:
+    """
+    Retorna o transporte compartilhado do processo.
+
+    Args:
+        nome: 'http1' ou 'http2' (padrão: SERPRO_TRANSPORTE ou 'http1')
+    """
+    nome = (nome or os.environ.get(ENV_TRANSPORTE) or TRANSPORTE_HTTP1).lower()
+    if nome not in (TRANSPORTE_HTTP1, TRANSPORTE_HTTP2):
+        raise ValueError(f"Transporte inválido: '{nome}'. Use 'http1' ou 'http2'.")
+
+    if nome == TRANSPORTE_HTTP2 and not HAS_HTTP2:
+        logger.warning("httpx[http2] não instalado: usando transporte HTTP/1.1")
+        nome = TRANSPORTE_HTTP1
+
+    with _transportes_lock:
+        transporte = _transportes.get(nome)
+        if transporte is None:
+            max_certificados = int(os.environ.get(ENV_MAX_CERTIFICADOS, MAX_CERTIFICADOS_PADRAO))
+            if nome == TRANSPORTE_HTTP2:
+                transporte = Http2Transport(
+                    max_conexoes=int(os.environ.get(ENV_HTTP2_MAX_CONEXOES, 2)),
+                    max_certificados=max_certificados
+                )
+            else:
+                transporte = Http1Transport(
+                    max_conexoes=int(os.environ.get(ENV_HTTP1_MAX_CONEXOES, 10)),
+                    max_certificados=max_certificados
+                )
+            _transportes[nome] = transporte
+        return transporte
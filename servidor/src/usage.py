@@ -0,0 +1,455 @@
+"""
+Contabilização de uso por contratante e serviço SERPRO.
+
+O SERPRO cobra por serviço consumido. Cada chamada feita (ou evitada por
+cache/idempotência) pelo process_proxy_serpro é contada por
+(contratante, idSistema/idServico): chamadas, erros, bytes enviados e
+recebidos, cache hits que pouparam uma chamada cobrada e latência do
+SERPRO. Os contadores levam o escopo da credencial que fez a chamada
+(src.tenant_scope): cada cliente só consulta o próprio uso.
+
+Os contadores ficam em memória, em fragmentos por thread: cada thread só
+escreve no próprio fragmento, sem lock no caminho da requisição. Uma
+thread de fundo soma os fragmentos e grava o incremento desde a última
+gravação, por hora, em SQLite ou em arquivo JSON Lines. A latência máxima
+é a de cada gravação (cada fragmento zera a sua quando começa uma nova),
+então o máximo de uma hora só considera chamadas daquela hora. Fragmentos
+de threads encerradas são somados a uma base e descartados.
+
+Configuração por ambiente:
+    SERPRO_USO_BACKEND=sqlite|arquivo|memoria  (padrão: memoria)
+    SERPRO_USO_CAMINHO=/tmp/serpro_uso.db      (ou .jsonl para arquivo)
+    SERPRO_USO_INTERVALO=60                    (segundos entre gravações)
+"""
+
+import os
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.dados_codec import carregar_json, serializar_json
+
+logger = logging.getLogger(__name__)
+
+BACKEND_MEMORIA = "memoria"
+BACKEND_SQLITE = "sqlite"
+BACKEND_ARQUIVO = "arquivo"
+
+CAMINHOS_PADRAO = {
+    BACKEND_SQLITE: "/tmp/serpro_uso.db",
+    BACKEND_ARQUIVO: "/tmp/serpro_uso.jsonl",
+}
+
+# Ordem das métricas nos contadores
+METRICAS = (
+    "chamadas", "erros", "bytes_enviados", "bytes_recebidos",
+    "cache_hits", "latencia_total_ms", "latencia_max_ms",
+)
+_CHAMADAS, _ERROS, _ENVIADOS, _RECEBIDOS, _HITS, _LATENCIA, _LATENCIA_MAX = range(len(METRICAS))
+# Posição, nas linhas dos fragmentos, da gravação a que a latência máxima pertence
+_GRAVACAO = len(METRICAS)
+
+ORDENACOES = ("chamadas", "erros", "bytes_enviados", "bytes_recebidos", "cache_hits", "latencia_total_ms")
+
+# (escopo da credencial, tenant, serviço)
+Chave = Tuple[str, str, str]
+
+
+def tenant_do_body(body: Dict[str, Any]) -> str:
+    """Contratante (só dígitos) do corpo SERPRO."""
+    numero = str((body.get("contratante") or {}).get("numero", ""))
+    return "".join(c for c in numero if c.isdigit()) or "desconhecido"
+
+
+def servico_do_body(body: Dict[str, Any]) -> str:
+    """idSistema/idServico do corpo SERPRO."""
+    pedido = body.get("pedidoDados") or {}
+    return f"{pedido.get('idSistema', '')}/{pedido.get('idServico', '')}"
+
+
+def _periodo(instante: float) -> str:
+    """Hora UTC do incremento (granularidade da consulta)."""
+    return datetime.fromtimestamp(instante, timezone.utc).strftime("%Y-%m-%dT%H")
+
+
+def _somar(destino: List[float], origem: List[float]):
+    for indice, valor in enumerate(origem):
+        if indice == _LATENCIA_MAX:
+            destino[indice] = max(destino[indice], valor)
+        else:
+            destino[indice] += valor
+
+
+def _diferenca(atual: List[float], anterior: Optional[List[float]]) -> List[float]:
+    """Incremento desde a última gravação (o máximo já é só o desta gravação)."""
+    if anterior is None:
+        return list(atual)
+    delta = [a - b for a, b in zip(atual, anterior)]
+    delta[_LATENCIA_MAX] = atual[_LATENCIA_MAX]
+    return delta
+
+
+def _metricas_da_gravacao(linha: List[float], gravacao: int) -> List[float]:
+    """Métricas de uma linha de fragmento; a latência máxima só se for da gravação."""
+    metricas = linha[:_GRAVACAO]
+    if linha[_GRAVACAO] != gravacao:
+        metricas[_LATENCIA_MAX] = 0
+    return metricas
+
+
+class UsageStore(ABC):
+    """Persistência dos incrementos de uso."""
+
+    @abstractmethod
+    def gravar(self, periodo: str, incrementos: Dict[Chave, List[float]]):
+        """Soma os incrementos ao período."""
+
+    @abstractmethod
+    def consultar(self, escopo: str, desde: Optional[str], ate: Optional[str]) -> Dict[Chave, List[float]]:
+        """Totais por (escopo, tenant, serviço) do escopo no intervalo de períodos [desde, ate]."""
+
+
+class MemoryUsageStore(UsageStore):
+    """Guarda os incrementos no próprio processo (sem persistência)."""
+
+    def __init__(self):
+        self._linhas: Dict[Tuple[str, str, str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def gravar(self, periodo, incrementos):
+        with self._lock:
+            for chave, valores in incrementos.items():
+                linha = self._linhas.setdefault((periodo, *chave), [0] * len(METRICAS))
+                _somar(linha, valores)
+
+    def consultar(self, escopo, desde, ate):
+        totais: Dict[Chave, List[float]] = defaultdict(lambda: [0] * len(METRICAS))
+        with self._lock:
+            for (periodo, *chave), valores in self._linhas.items():
+                if chave[0] != escopo or (desde and periodo < desde) or (ate and periodo > ate):
+                    continue
+                _somar(totais[tuple(chave)], valores)
+        return dict(totais)
+
+
+class SQLiteUsageStore(UsageStore):
+    """Tabela `uso` com uma linha por (hora, escopo, tenant, serviço)."""
+
+    def __init__(self, caminho: str = CAMINHOS_PADRAO[BACKEND_SQLITE]):
+        self._caminho = caminho
+        self._lock = threading.Lock()
+        # Só a thread de gravação e as consultas usam a conexão (serializadas pelo lock)
+        self._conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        colunas = ", ".join(f"{metrica} REAL NOT NULL DEFAULT 0" for metrica in METRICAS)
+        self._conexao.execute(
+            f"CREATE TABLE IF NOT EXISTS uso (periodo TEXT NOT NULL, escopo TEXT NOT NULL, "
+            f"tenant TEXT NOT NULL, servico TEXT NOT NULL, {colunas}, "
+            f"PRIMARY KEY (periodo, escopo, tenant, servico))"
+        )
+
+    def gravar(self, periodo, incrementos):
+        atualizacoes = ", ".join(
+            f"{m} = MAX({m}, excluded.{m})" if m == "latencia_max_ms" else f"{m} = {m} + excluded.{m}"
+            for m in METRICAS
+        )
+        sql = (
+            f"INSERT INTO uso (periodo, escopo, tenant, servico, {', '.join(METRICAS)}) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' * len(METRICAS))}) "
+            f"ON CONFLICT (periodo, escopo, tenant, servico) DO UPDATE SET {atualizacoes}"
+        )
+        linhas = [(periodo, *chave, *valores) for chave, valores in incrementos.items()]
+        with self._lock:
+            self._conexao.execute("BEGIN")
+            self._conexao.executemany(sql, linhas)
+            self._conexao.execute("COMMIT")
+
+    def consultar(self, escopo, desde, ate):
+        agregacoes = ", ".join(
+            f"MAX({m})" if m == "latencia_max_ms" else f"SUM({m})" for m in METRICAS
+        )
+        sql = (
+            f"SELECT tenant, servico, {agregacoes} FROM uso "
+            f"WHERE escopo = ? AND periodo >= ? AND periodo <= ? GROUP BY tenant, servico"
+        )
+        with self._lock:
+            linhas = self._conexao.execute(sql, (escopo, desde or "", ate or "9999")).fetchall()
+        return {(escopo, linha[0], linha[1]): list(linha[2:]) for linha in linhas}
+
+
+class FileUsageStore(UsageStore):
+    """Arquivo JSON Lines somente acréscimo (uma linha por incremento)."""
+
+    def __init__(self, caminho: str = CAMINHOS_PADRAO[BACKEND_ARQUIVO]):
+        self._caminho = caminho
+        self._lock = threading.Lock()
+
+    def gravar(self, periodo, incrementos):
+        linhas = b"".join(
+            serializar_json({"periodo": periodo, "escopo": escopo, "tenant": tenant, "servico": servico,
+                             **dict(zip(METRICAS, valores))}) + b"\n"
+            for (escopo, tenant, servico), valores in incrementos.items()
+        )
+        with self._lock:
+            with open(self._caminho, "ab") as arquivo:
+                arquivo.write(linhas)
+
+    def consultar(self, escopo, desde, ate):
+        totais: Dict[Chave, List[float]] = defaultdict(lambda: [0] * len(METRICAS))
+        if not os.path.exists(self._caminho):
+            return {}
+        with self._lock, open(self._caminho, "rb") as arquivo:
+            for linha in arquivo:
+                if not linha.strip():
+                    continue
+                registro = carregar_json(linha)
+                periodo = registro["periodo"]
+                if registro.get("escopo") != escopo or (desde and periodo < desde) or (ate and periodo > ate):
+                    continue
+                _somar(totais[(escopo, registro["tenant"], registro["servico"])], [registro[m] for m in METRICAS])
+        return dict(totais)
+
+
+class UsageAccounting:
+    """Contadores por (escopo, tenant, serviço) sem lock no caminho da requisição."""
+
+    def __init__(self, store: Optional[UsageStore] = None, intervalo: float = 60.0):
+        """
+        Args:
+            store: Persistência dos incrementos (padrão: memória)
+            intervalo: Segundos entre gravações (<= 0 desliga a thread de fundo)
+        """
+        self.store = store or MemoryUsageStore()
+        self.intervalo = intervalo
+        self._local = threading.local()
+        self._fragmentos: List[Tuple[threading.Thread, Dict[Chave, List[float]]]] = []
+        self._fragmentos_lock = threading.Lock()
+        # Soma dos fragmentos de threads encerradas (só a gravação escreve)
+        self._base: Dict[Chave, List[float]] = {}
+        # Gravação corrente: a latência máxima de cada linha é só desta gravação
+        self._gravacao = 0
+        # Totais já gravados (o incremento é a diferença para o acumulado)
+        self._gravado: Dict[Chave, List[float]] = {}
+        self._gravacao_lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if intervalo > 0:
+            self._thread = threading.Thread(target=self._laco, name="uso-flush", daemon=True)
+            self._thread.start()
+
+    def _fragmento(self) -> Dict[Chave, List[float]]:
+        """Contadores da thread atual (registrados uma única vez por thread)."""
+        fragmento = getattr(self._local, "fragmento", None)
+        if fragmento is None:
+            fragmento = self._local.fragmento = {}
+            with self._fragmentos_lock:
+                self._fragmentos.append((threading.current_thread(), fragmento))
+        return fragmento
+
+    def _linha(self, escopo: str, tenant: str, servico: str) -> List[float]:
+        fragmento = self._fragmento()
+        chave = (escopo, tenant, servico)
+        linha = fragmento.get(chave)
+        if linha is None:
+            linha = fragmento[chave] = [0] * len(METRICAS) + [self._gravacao]
+        return linha
+
+    def registrar_chamada(
+        self,
+        escopo: str,
+        tenant: str,
+        servico: str,
+        bytes_enviados: int,
+        bytes_recebidos: int,
+        latencia: float,
+        erro: bool = False,
+        tentativas: int = 1
+    ):
+        """
+        Contabiliza uma chamada ao SERPRO (latência em segundos).
+
+        Com hedge, `tentativas` conta também as cópias enviadas: cada uma
+        é cobrada e entra em `chamadas`.
+        """
+        linha = self._linha(escopo, tenant, servico)
+        latencia_ms = latencia * 1000
+        linha[_CHAMADAS] += tentativas
+        linha[_ENVIADOS] += bytes_enviados
+        linha[_RECEBIDOS] += bytes_recebidos
+        linha[_LATENCIA] += latencia_ms
+        if linha[_GRAVACAO] != self._gravacao:
+            # Primeira chamada desde a última gravação: o máximo recomeça
+            linha[_GRAVACAO] = self._gravacao
+            linha[_LATENCIA_MAX] = 0
+        if latencia_ms > linha[_LATENCIA_MAX]:
+            linha[_LATENCIA_MAX] = latencia_ms
+        if erro:
+            linha[_ERROS] += 1
+
+    def registrar_cache_hit(self, escopo: str, tenant: str, servico: str):
+        """Contabiliza uma resposta servida sem chamada cobrada."""
+        self._linha(escopo, tenant, servico)[_HITS] += 1
+
+    def _recolher_encerradas(self):
+        """Soma à base os fragmentos de threads encerradas e os descarta."""
+        with self._fragmentos_lock:
+            encerrados = [fragmento for thread, fragmento in self._fragmentos if not thread.is_alive()]
+            self._fragmentos = [(thread, fragmento) for thread, fragmento in self._fragmentos if thread.is_alive()]
+        for fragmento in encerrados:
+            for chave, linha in fragmento.items():
+                base = self._base.setdefault(chave, [0] * len(METRICAS) + [self._gravacao])
+                metricas = _metricas_da_gravacao(linha, self._gravacao)
+                if base[_GRAVACAO] != self._gravacao:
+                    base[_GRAVACAO] = self._gravacao
+                    base[_LATENCIA_MAX] = 0
+                _somar(base, metricas)
+
+    def _acumulado(self) -> Dict[Chave, List[float]]:
+        """Soma da base e dos fragmentos (cópias atômicas sob o GIL; chamar com _gravacao_lock)."""
+        self._recolher_encerradas()
+        with self._fragmentos_lock:
+            fragmentos = [fragmento for _, fragmento in self._fragmentos]
+        totais: Dict[Chave, List[float]] = defaultdict(lambda: [0] * len(METRICAS))
+        for fragmento in (self._base, *fragmentos):
+            for chave, linha in list(fragmento.items()):
+                _somar(totais[chave], _metricas_da_gravacao(list(linha), self._gravacao))
+        return dict(totais)
+
+    def _pendente(self, acumulado: Dict[Chave, List[float]]) -> Dict[Chave, List[float]]:
+        pendente = {}
+        for chave, atual in acumulado.items():
+            delta = _diferenca(atual, self._gravado.get(chave))
+            if any(delta):
+                pendente[chave] = delta
+        return pendente
+
+    def gravar(self):
+        """Grava o incremento desde a última gravação."""
+        with self._gravacao_lock:
+            acumulado = self._acumulado()
+            pendente = self._pendente(acumulado)
+            if not pendente:
+                return
+            self.store.gravar(_periodo(time.time()), pendente)
+            self._gravado = acumulado
+            # Chamadas daqui em diante formam o máximo da próxima gravação
+            self._gravacao += 1
+
+    def _laco(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.gravar()
+            except Exception:
+                logger.error("Falha ao gravar contadores de uso", exc_info=True)
+
+    def encerrar(self):
+        """Para a thread de fundo e grava o pendente."""
+        self._parar.set()
+        self.gravar()
+
+    def consultar(
+        self,
+        escopo: str,
+        tenant: Optional[str] = None,
+        servico: Optional[str] = None,
+        desde: Optional[str] = None,
+        ate: Optional[str] = None,
+        ordenar: str = "chamadas",
+        limite: int = 50
+    ) -> Dict[str, Any]:
+        """
+        Totais por tenant e serviço do escopo (gravado + pendente em memória).
+
+        Args:
+            escopo: Escopo da credencial de quem consulta
+            tenant: Filtra um contratante (só dígitos)
+            servico: Filtra idSistema/idServico (ou só o idSistema)
+            desde: Período inicial 'AAAA-MM-DDTHH' (UTC, inclusive)
+            ate: Período final 'AAAA-MM-DDTHH' (UTC, inclusive)
+            ordenar: Métrica de ordenação (decrescente)
+            limite: Máximo de linhas
+
+        Raises:
+            ValueError: Se `ordenar` não for uma métrica
+        """
+        if ordenar not in ORDENACOES:
+            raise ValueError(f"ordenar inválido: '{ordenar}'. Use {', '.join(ORDENACOES)}.")
+
+        with self._gravacao_lock:
+            totais = self.store.consultar(escopo, desde, ate)
+            agora = _periodo(time.time())
+            if (not desde or agora >= desde) and (not ate or agora <= ate):
+                for chave, delta in self._pendente(self._acumulado()).items():
+                    if chave[0] != escopo:
+                        continue
+                    _somar(totais.setdefault(chave, [0] * len(METRICAS)), delta)
+
+        linhas = []
+        por_tenant: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for (_, linha_tenant, linha_servico), valores in totais.items():
+            if tenant and linha_tenant != tenant:
+                continue
+            if servico and linha_servico != servico and linha_servico.split("/")[0] != servico:
+                continue
+            metricas = {
+                metrica: round(valor, 1) if metrica.startswith("latencia") else int(valor)
+                for metrica, valor in zip(METRICAS, valores)
+            }
+            metricas["latencia_media_ms"] = (
+                round(metricas["latencia_total_ms"] / metricas["chamadas"], 1) if metricas["chamadas"] else 0
+            )
+            linhas.append({"tenant": linha_tenant, "servico": linha_servico, **metricas})
+            for metrica in ("chamadas", "erros", "cache_hits", "bytes_enviados", "bytes_recebidos"):
+                por_tenant[linha_tenant][metrica] += metricas[metrica]
+
+        linhas.sort(key=lambda linha: linha[ordenar], reverse=True)
+        tenants = sorted(
+            ({"tenant": nome, **valores} for nome, valores in por_tenant.items()),
+            key=lambda linha: linha.get(ordenar, linha["chamadas"]),
+            reverse=True
+        )
+        return {"servicos": linhas[:limite], "tenants": tenants[:limite]}
+
+
+def criar_store(backend: str, caminho: Optional[str] = None) -> UsageStore:
+    """
+    Cria a persistência dos contadores.
+
+    Args:
+        backend: 'memoria', 'sqlite' ou 'arquivo'
+        caminho: Arquivo de destino (sqlite/arquivo)
+    """
+    if backend == BACKEND_MEMORIA:
+        return MemoryUsageStore()
+    if backend == BACKEND_SQLITE:
+        return SQLiteUsageStore(caminho or CAMINHOS_PADRAO[BACKEND_SQLITE])
+    if backend == BACKEND_ARQUIVO:
+        return FileUsageStore(caminho or CAMINHOS_PADRAO[BACKEND_ARQUIVO])
+    raise ValueError(f"Backend de uso inválido: '{backend}'. Use memoria, sqlite ou arquivo.")
+
+
+_contabilidade: Optional[UsageAccounting] = None
+_contabilidade_lock = threading.Lock()
+
+
+def obter_contabilidade() -> UsageAccounting:
+    """Retorna a contabilização compartilhada do processo (configurada por ambiente)."""
+    global _contabilidade
+    with _contabilidade_lock:
+        if _contabilidade is None:
+            _contabilidade = UsageAccounting(
+                store=criar_store(
+                    os.environ.get("SERPRO_USO_BACKEND", BACKEND_MEMORIA).lower(),
+                    os.environ.get("SERPRO_USO_CAMINHO")
+                ),
+                intervalo=float(os.environ.get("SERPRO_USO_INTERVALO", 60))
+            )
+            # Grava o pendente ao encerrar o processo
+            atexit.register(_contabilidade.encerrar)
+        return _contabilidade
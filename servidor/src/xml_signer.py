@@ -4,9 +4,7 @@ Utilitário para assinatura XML digital.
 Usado para assinar o Termo de Autorização do Procurador.
 """
 
-import base64
 from datetime import datetime, timezone
-from typing import Optional
 
 # Import para fuso horário de Brasília
 try:
@@ -18,9 +16,8 @@ except ImportError:
 
 from lxml import etree
 from signxml import XMLSigner, methods
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
+
+from src.certificate_registry import CertificateIdentity
 
 
 def get_brasilia_datetime() -> datetime:
@@ -114,21 +111,24 @@ def assinar_xml(
         XML assinado como string
     """
     # Carregar certificado
-    private_key, certificate, chain = pkcs12.load_key_and_certificates(
-        cert_bytes,
-        cert_password.encode() if cert_password else None,
-        default_backend()
-    )
-    
-    # Converter para PEM
-    key_pem = private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=serialization.NoEncryption()
-    )
-    
-    cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
-    
+    identidade = CertificateIdentity.from_p12(cert_bytes, cert_password)
+    return assinar_xml_com_identidade(xml_content, identidade)
+
+
+def assinar_xml_com_identidade(
+    xml_content: str,
+    identidade: CertificateIdentity
+) -> str:
+    """
+    Assina XML digitalmente usando identidade já extraída (certificado registrado).
+
+    Args:
+        xml_content: XML a ser assinado
+        identidade: Chave e certificado em PEM
+
+    Returns:
+        XML assinado como string
+    """
     # Parse XML
     root = etree.fromstring(xml_content.encode())
     
@@ -144,8 +144,8 @@ def assinar_xml(
     # Assinar
     signed_root = signer.sign(
         root,
-        key=key_pem,
-        cert=cert_pem
+        key=identidade.key_pem,
+        cert=identidade.cert_pem
     )
 
     # Retornar como string (usar UTF-8 com xml_declaration, depois decodificar)
@@ -0,0 +1,83 @@
+"""Fixtures compartilhadas dos testes do servidor."""
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from src.certificate_registry import CertificateIdentity
+from src.transport import RespostaHttp, Transport
+
+
+def criar_identidade(nome: str = "Contribuinte Teste") -> CertificateIdentity:
+    """Identidade mTLS autoassinada (sem P12)."""
+    chave = ec.generate_private_key(ec.SECP256R1())
+    titular = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, nome)])
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(titular)
+        .issuer_name(titular)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.datetime(2020, 1, 1))
+        .not_valid_after(datetime.datetime(2040, 1, 1))
+        .sign(chave, hashes.SHA256())
+    )
+    return CertificateIdentity(
+        fingerprint=hashlib.sha256(certificado.public_bytes(serialization.Encoding.DER)).hexdigest(),
+        cert_pem=certificado.public_bytes(serialization.Encoding.PEM),
+        key_pem=chave.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ),
+        titular=titular.rfc4514_string()
+    )
+
+
+@pytest.fixture
+def identidade() -> CertificateIdentity:
+    return criar_identidade()
+
+
+class TransporteFalso(Transport):
+    """Gateway simulado: registra as chamadas e responde sempre 200."""
+
+    nome = "falso"
+
+    def __init__(self, atraso: float = 0.0):
+        super().__init__()
+        self.atraso = atraso
+        self.chamadas: List[Dict[str, Any]] = []
+        self._chamadas_lock = threading.Lock()
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self._contar("requisicoes")
+        with self._chamadas_lock:
+            self.chamadas.append({"url": url, "headers": headers, "body": body})
+            numero = len(self.chamadas)
+        time.sleep(self.atraso)
+        corpo = json.dumps({"status": 200, "mensagens": [], "dados": json.dumps({"chamada": numero})})
+        return RespostaHttp(200, {"content-type": "application/json"}, corpo.encode())
+
+
+@pytest.fixture
+def transporte(monkeypatch) -> TransporteFalso:
+    """Substitui o transporte do MtlsClient e isola cache e contabilização de uso."""
+    from src import cache, usage
+    import src.mtls_client as mtls_client
+
+    falso = TransporteFalso()
+    monkeypatch.setattr(mtls_client, "obter_transporte", lambda *args: falso)
+    monkeypatch.setattr(cache, "_cache_padrao", cache.MemoryCache())
+    monkeypatch.setattr(usage, "_contabilidade", usage.UsageAccounting(intervalo=0))
+    monkeypatch.delenv("SERPRO_CASSETE_MODO", raising=False)
+    return falso
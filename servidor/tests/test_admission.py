@@ -0,0 +1,129 @@
+"""Testes do controle de admissão: fila cheia, espera limitada pelo prazo e classificação."""
+
+import threading
+import time
+
+import pytest
+
+from src.admission import (
+    AdmissionController, CONFIGURACAO_PADRAO, PRIORIDADE_CRITICA, PRIORIDADE_LOTE, PRIORIDADE_NORMAL,
+    SobrecargaError, _configuracao_do_ambiente,
+)
+from src.deadline import Deadline, DeadlineExcedidoError
+
+
+def _ocupar(controlador: AdmissionController, prioridade: str, quantidade: int) -> threading.Event:
+    """Mantém `quantidade` vagas da classe ocupadas até o evento ser liberado."""
+    liberar = threading.Event()
+    ocupadas = threading.Barrier(quantidade + 1)
+
+    def executar():
+        with controlador.admitir(prioridade):
+            ocupadas.wait()
+            liberar.wait(5)
+
+    for _ in range(quantidade):
+        threading.Thread(target=executar, daemon=True).start()
+    ocupadas.wait(5)
+    return liberar
+
+
+def test_fila_cheia_recusa_com_retry_after():
+    controlador = AdmissionController({PRIORIDADE_LOTE: (1, 0, 5.0)})
+    liberar = _ocupar(controlador, PRIORIDADE_LOTE, 1)
+
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(SobrecargaError) as erro:
+            with controlador.admitir(PRIORIDADE_LOTE):
+                pass
+        # Recusa imediata, sem esperar na fila
+        assert time.monotonic() - inicio < 0.5
+        # Outras classes não são afetadas
+        with controlador.admitir(PRIORIDADE_CRITICA):
+            pass
+    finally:
+        liberar.set()
+
+    assert erro.value.classe == PRIORIDADE_LOTE
+    assert 1 <= erro.value.retry_after <= 30
+    assert controlador.estatisticas()[PRIORIDADE_LOTE]["recusadas"] == 1
+
+
+def test_espera_estourada_na_fila():
+    controlador = AdmissionController({PRIORIDADE_NORMAL: (1, 1, 0.1)})
+    liberar = _ocupar(controlador, PRIORIDADE_NORMAL, 1)
+
+    try:
+        with pytest.raises(SobrecargaError):
+            with controlador.admitir(PRIORIDADE_NORMAL):
+                pass
+    finally:
+        liberar.set()
+
+
+def test_prazo_da_requisicao_limita_a_espera():
+    controlador = AdmissionController({PRIORIDADE_NORMAL: (1, 1, 10.0)})
+    liberar = _ocupar(controlador, PRIORIDADE_NORMAL, 1)
+
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(DeadlineExcedidoError) as erro:
+            with controlador.admitir(PRIORIDADE_NORMAL, Deadline(0.2)):
+                pass
+        assert time.monotonic() - inicio < 1
+    finally:
+        liberar.set()
+
+    assert erro.value.etapa == "fila"
+
+
+def test_vaga_liberada_admite_quem_espera():
+    controlador = AdmissionController({PRIORIDADE_NORMAL: (1, 1, 5.0)})
+    liberar = _ocupar(controlador, PRIORIDADE_NORMAL, 1)
+    threading.Timer(0.1, liberar.set).start()
+
+    with controlador.admitir(PRIORIDADE_NORMAL):
+        pass
+
+    assert controlador.estatisticas()[PRIORIDADE_NORMAL]["admitidas"] == 2
+
+
+def test_desativado_admite_sem_limite():
+    controlador = AdmissionController({PRIORIDADE_LOTE: (0, 0, 0.0)}, ativo=False)
+
+    with controlador.admitir(PRIORIDADE_LOTE):
+        pass
+
+
+@pytest.mark.parametrize("rota, data, header, esperada", [
+    ("proxy_serpro", {}, "lote", PRIORIDADE_LOTE),
+    ("autenticar_procurador", {}, None, PRIORIDADE_CRITICA),
+    ("proxy_serpro", {"endpoint": "/Emitir"}, None, PRIORIDADE_CRITICA),
+    ("proxy_serpro", {"endpoint": "/Consultar", "body": {"pedidoDados": {"idServico": "CONSLOTE1"}}}, None, PRIORIDADE_LOTE),
+    ("proxy_serpro", {"endpoint": "/Consultar"}, "invalida", PRIORIDADE_NORMAL),
+])
+def test_classificacao(rota, data, header, esperada):
+    assert AdmissionController().classificar(rota, data, header) == esperada
+
+
+def test_classes_acompanham_a_concorrencia_da_instancia(monkeypatch):
+    for prioridade in ("CRITICA", "NORMAL", "LOTE"):
+        monkeypatch.delenv(f"SERPRO_ADMISSAO_{prioridade}", raising=False)
+    monkeypatch.setenv("SERPRO_CONCORRENCIA", "80")
+    monkeypatch.setenv("SERPRO_ADMISSAO_NORMAL", "2,3,1")
+
+    configuracao = _configuracao_do_ambiente()
+
+    assert configuracao[PRIORIDADE_CRITICA] == (80, 80, 10.0)
+    assert configuracao[PRIORIDADE_LOTE] == (20, 80, 2.0)
+    # Configuração explícita prevalece
+    assert configuracao[PRIORIDADE_NORMAL] == (2, 3, 1.0)
+
+
+def test_concorrencia_baixa_mantem_os_padroes(monkeypatch):
+    for prioridade in ("CRITICA", "NORMAL", "LOTE"):
+        monkeypatch.delenv(f"SERPRO_ADMISSAO_{prioridade}", raising=False)
+    monkeypatch.setenv("SERPRO_CONCORRENCIA", "8")
+
+    assert _configuracao_do_ambiente() == CONFIGURACAO_PADRAO
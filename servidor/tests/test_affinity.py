@@ -0,0 +1,103 @@
+"""Testes do encaminhamento por afinidade: fallback local só sem conexão, prazo repassado."""
+
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from src.affinity import CHAVE_CERTIFICADO, HEADER_ORIGEM, RoteadorAfinidade, chave_afinidade
+from src.deadline import Deadline, DeadlineExcedidoError, HEADER_TIMEOUT
+
+PROPRIA = "http://127.0.0.1:1"
+
+
+def _porta_fechada() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _roteador(destino: str) -> RoteadorAfinidade:
+    return RoteadorAfinidade(PROPRIA, [PROPRIA, destino])
+
+
+def test_dona_sem_conexao_processa_localmente():
+    destino = f"http://127.0.0.1:{_porta_fechada()}"
+    roteador = _roteador(destino)
+
+    resposta = roteador.encaminhar(destino, "/proxy_serpro", b"{}", {}, Deadline(5))
+
+    assert resposta is None
+    assert roteador.estatisticas()["dona_indisponivel"] == 1
+
+
+def test_dona_lenta_vira_timeout_sem_fallback():
+    # Aceita a conexão e nunca responde: a requisição pode estar executando lá
+    servidor = socket.socket()
+    servidor.bind(("127.0.0.1", 0))
+    servidor.listen()
+    destino = f"http://127.0.0.1:{servidor.getsockname()[1]}"
+    roteador = _roteador(destino)
+
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(DeadlineExcedidoError):
+            roteador.encaminhar(destino, "/proxy_serpro", b"{}", {}, Deadline(0.3))
+        assert time.monotonic() - inicio < 2
+    finally:
+        servidor.close()
+    assert roteador.estatisticas()["falhas_encaminhamento"] == 1
+
+
+def test_prazo_esgotado_nao_encaminha():
+    roteador = _roteador("http://127.0.0.1:2")
+
+    with pytest.raises(DeadlineExcedidoError):
+        roteador.encaminhar("http://127.0.0.1:2", "/proxy_serpro", b"{}", {}, Deadline(0))
+
+
+def test_dona_recebe_o_prazo_restante():
+    recebidos = {}
+
+    class Dona(BaseHTTPRequestHandler):
+        def do_POST(self):
+            recebidos.update(self.headers.items())
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    servidor = HTTPServer(("127.0.0.1", 0), Dona)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    destino = f"http://127.0.0.1:{servidor.server_port}"
+    roteador = _roteador(destino)
+    deadline = Deadline(10)
+    time.sleep(0.2)
+
+    try:
+        status, _, corpo = roteador.encaminhar(
+            destino, "/proxy_serpro", b"{}", {HEADER_TIMEOUT: "10"}, deadline
+        )
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    assert (status, corpo) == (200, b"{}")
+    assert recebidos[HEADER_ORIGEM] == PROPRIA
+    assert 9 < float(recebidos[HEADER_TIMEOUT]) <= 9.8
+
+
+@pytest.mark.parametrize("modo", ["contratante", CHAVE_CERTIFICADO])
+def test_requisicao_com_handle_fica_na_instancia(modo):
+    data = {"certificado_handle": "h-123", "body": {"contratante": {"numero": "11111111000191"}}}
+    roteador = RoteadorAfinidade(PROPRIA, [PROPRIA, "http://127.0.0.1:2"], modo=modo)
+
+    assert chave_afinidade(data, modo) is None
+    assert roteador.destino(data, {}) is None
+    assert chave_afinidade({"body": data["body"]}, modo) == "contratante:11111111000191"
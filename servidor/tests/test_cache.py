@@ -0,0 +1,101 @@
+"""Testes dos locks e do obter_ou_calcular do cache."""
+
+import threading
+import time
+
+import pytest
+
+from src.cache import CacheBackend, LockIndisponivelError, MemoryCache, SQLiteCache, obter_ou_calcular
+from src.encryption import Cifrador
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache()
+    return SQLiteCache(str(tmp_path / "cache.db"), cifrador=Cifrador())
+
+
+def _segurar(cache, nome, segundos, ttl=30.0):
+    adquirido = threading.Event()
+
+    def executar():
+        with cache.lock(nome, timeout=1, ttl=ttl):
+            adquirido.set()
+            time.sleep(segundos)
+
+    thread = threading.Thread(target=executar)
+    thread.start()
+    adquirido.wait(1)
+    return thread
+
+
+def test_backend_exige_implementacao():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_lock_de_outras_chaves_nao_espera(cache):
+    thread = _segurar(cache, "renovar:tenant-a", 0.5)
+    try:
+        for indice in range(300):
+            with cache.lock(f"renovar:tenant-{indice}-b", timeout=0.01):
+                pass
+    finally:
+        thread.join()
+
+
+def test_mesma_chave_espera(cache):
+    thread = _segurar(cache, "renovar:x", 0.5)
+    try:
+        with pytest.raises(LockIndisponivelError):
+            with cache.lock("renovar:x", timeout=0.1):
+                pass
+    finally:
+        thread.join()
+    with cache.lock("renovar:x", timeout=0.1):
+        pass
+
+
+def test_locks_em_memoria_sao_descartados():
+    cache = MemoryCache()
+    for indice in range(100):
+        with cache.lock(f"renovar:{indice}"):
+            pass
+    assert cache._locks == {}
+
+
+def test_lock_persistente_renovado_durante_chamada_lenta(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), cifrador=Cifrador())
+    # Validade de 0,3 s, mas o dono segura por 1,2 s: a renovação mantém o lock
+    thread = _segurar(cache, "renovar:lento", 1.2, ttl=0.3)
+    try:
+        with pytest.raises(LockIndisponivelError):
+            with cache.lock("renovar:lento", timeout=0.8, ttl=0.3):
+                pass
+    finally:
+        thread.join()
+
+
+def test_obter_ou_calcular_executa_uma_vez(cache):
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        time.sleep(0.2)
+        return {"token": "abc"}
+
+    resultados = []
+    threads = [
+        threading.Thread(target=lambda: resultados.append(
+            obter_ou_calcular(cache, "token:x", calcular, lambda valor: 60, lock_timeout=2)
+        ))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(chamadas) == 1
+    assert sorted(hit for _, hit in resultados) == [False, True, True, True, True]
@@ -0,0 +1,115 @@
+"""Testes do cassete: sanitização, níveis de correspondência e reprodução de timeout."""
+
+import json
+import time
+
+import pytest
+
+from src.cassette import (
+    CasseteSemGravacaoError, GravadorTransport, MARCADOR, ReprodutorTransport, TOKEN_FICTICIO,
+)
+from src.deadline import DeadlineExcedidoError
+from src.transport import RespostaHttp, Transport
+
+URL = "https://gateway.apiserpro.serpro.gov.br/integra-contador/v1/Consultar"
+CPF = "123.456.789-09"
+
+
+class _Servidor(Transport):
+    """Responde com o corpo pedido, ecoando o serviço da requisição."""
+
+    def __init__(self):
+        super().__init__()
+        self.chamadas = 0
+
+    def post(self, url, headers, body, identidade=None, timeout=None) -> RespostaHttp:
+        self.chamadas += 1
+        time.sleep(0.01)
+        pedido = json.loads(body)["pedidoDados"]
+        corpo = {
+            "status": 200,
+            "access_token": "segredo-da-resposta",
+            "dados": json.dumps({"cpf": CPF, "servico": pedido["idServico"], "chamada": self.chamadas}),
+        }
+        return RespostaHttp(200, {"ETag": '"autenticar_procurador_token:etag-segredo"'}, json.dumps(corpo).encode())
+
+
+def _pedido(servico: str = "SERVICO1", numero: str = CPF, ano: str = "2024") -> bytes:
+    return json.dumps({
+        "contratante": {"numero": numero, "tipo": 1},
+        "pedidoDados": {"idSistema": "SISTEMA", "idServico": servico, "dados": json.dumps({"ano": ano})},
+    }).encode()
+
+
+@pytest.fixture
+def cassete(tmp_path):
+    """Cassete com duas gravações (SERVICO1 e SERVICO2)."""
+    caminho = str(tmp_path / "cassete.jsonl")
+    gravador = GravadorTransport(_Servidor(), caminho)
+    headers = {"Authorization": "Bearer segredo", "jwt_token": "jwt-segredo"}
+    gravador.post(URL, headers, _pedido("SERVICO1"))
+    gravador.post(URL, headers, _pedido("SERVICO2"))
+    return caminho
+
+
+def test_gravacao_sanitizada(cassete):
+    with open(cassete, encoding="utf-8") as arquivo:
+        conteudo = arquivo.read()
+        arquivo.seek(0)
+        registro = json.loads(arquivo.readline())
+
+    for segredo in ("segredo", "12345678909", "123.456.789-09"):
+        assert segredo not in conteudo
+    assert registro["requisicao"]["headers"]["authorization"] == MARCADOR
+    assert registro["requisicao"]["headers"]["jwt_token"] == MARCADOR
+    assert json.loads(registro["requisicao"]["corpo"])["contratante"]["numero"] == "000.000.000-00"
+    resposta = json.loads(registro["resposta"]["corpo"])
+    assert resposta["access_token"] == TOKEN_FICTICIO
+    assert json.loads(resposta["dados"])["cpf"] == "000.000.000-00"
+    assert registro["resposta"]["headers"]["etag"] == f'"autenticar_procurador_token:{TOKEN_FICTICIO}"'
+
+
+def test_niveis_de_correspondencia(cassete):
+    reprodutor = ReprodutorTransport(cassete, fator_latencia=0)
+
+    # Mesmo corpo sanitizado (o CPF real casa com o zerado da gravação)
+    exata = reprodutor.post(URL, {}, _pedido("SERVICO2"))
+    # Mesmo serviço, dados diferentes
+    servico = reprodutor.post(URL, {}, _pedido("SERVICO2", ano="2023"))
+    # Só o caminho: serviço nunca gravado
+    caminho = reprodutor.post(URL, {}, _pedido("SERVICO9"))
+
+    assert json.loads(exata.json()["dados"])["servico"] == "SERVICO2"
+    assert json.loads(servico.json()["dados"])["servico"] == "SERVICO2"
+    assert json.loads(caminho.json()["dados"])["servico"] == "SERVICO1"
+    estatisticas = reprodutor.estatisticas()
+    assert [estatisticas.get(f"correspondencia_{nivel}") for nivel in range(3)] == [1, 1, 1]
+
+
+def test_gravacoes_da_mesma_chave_em_rodizio(cassete):
+    reprodutor = ReprodutorTransport(cassete, fator_latencia=0)
+
+    servicos = [
+        json.loads(reprodutor.post(URL, {}, _pedido("SERVICO9")).json()["dados"])["servico"]
+        for _ in range(3)
+    ]
+
+    assert servicos == ["SERVICO1", "SERVICO2", "SERVICO1"]
+
+
+def test_caminho_sem_gravacao(cassete):
+    reprodutor = ReprodutorTransport(cassete, fator_latencia=0)
+
+    with pytest.raises(CasseteSemGravacaoError):
+        reprodutor.post(URL.replace("Consultar", "Emitir"), {}, _pedido())
+
+
+def test_latencia_acima_do_prazo_reproduz_timeout(cassete):
+    reprodutor = ReprodutorTransport(cassete, fator_latencia=1000)
+    inicio = time.monotonic()
+
+    with pytest.raises(DeadlineExcedidoError) as erro:
+        reprodutor.post(URL, {}, _pedido(), timeout=(1.0, 0.1))
+
+    assert erro.value.etapa == "leitura"
+    assert 0.1 <= time.monotonic() - inicio < 1
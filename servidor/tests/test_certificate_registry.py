@@ -0,0 +1,52 @@
+"""Testes do registro de certificados."""
+
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from src.certificate_registry import CertificadoNaoRegistradoError, CertificateRegistry
+from src.encryption import ENV_CHAVE, Cifrador
+from tests.conftest import criar_identidade
+
+
+@pytest.fixture
+def chave_configurada(monkeypatch):
+    monkeypatch.setenv(ENV_CHAVE, Fernet.generate_key().decode())
+
+
+def test_handle_persistido_sobrevive_a_novo_processo(tmp_path, identidade, chave_configurada):
+    handle = CertificateRegistry(Cifrador(), str(tmp_path)).registrar(identidade)["certificado_handle"]
+
+    recuperada = CertificateRegistry(Cifrador(), str(tmp_path)).obter(handle)
+
+    assert recuperada.fingerprint == identidade.fingerprint
+
+
+def test_handle_de_outra_chave_vira_nao_registrado(tmp_path, identidade, chave_configurada, monkeypatch):
+    handle = CertificateRegistry(Cifrador(), str(tmp_path)).registrar(identidade)["certificado_handle"]
+    monkeypatch.setenv(ENV_CHAVE, Fernet.generate_key().decode())
+
+    with pytest.raises(CertificadoNaoRegistradoError):
+        CertificateRegistry(Cifrador(), str(tmp_path)).obter(handle)
+    assert not os.listdir(tmp_path)
+
+
+def test_chave_efemera_nao_persiste(tmp_path, identidade, monkeypatch):
+    monkeypatch.delenv(ENV_CHAVE, raising=False)
+    registro = CertificateRegistry(Cifrador(), str(tmp_path))
+
+    handle = registro.registrar(identidade)["certificado_handle"]
+
+    assert registro.obter(handle).fingerprint == identidade.fingerprint
+    assert not os.listdir(tmp_path)
+
+
+def test_identidades_ignora_handle_ilegivel(tmp_path, identidade, chave_configurada, monkeypatch):
+    CertificateRegistry(Cifrador(), str(tmp_path)).registrar(identidade)
+    monkeypatch.setenv(ENV_CHAVE, Fernet.generate_key().decode())
+    registro = CertificateRegistry(Cifrador(), str(tmp_path))
+    nova = criar_identidade("Outro Contribuinte")
+    registro.registrar(nova)
+
+    assert [item.fingerprint for item in registro.identidades()] == [nova.fingerprint]
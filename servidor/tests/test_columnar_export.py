@@ -0,0 +1,104 @@
+"""Testes da exportação colunar: colunas de `dados`, overflow em dados_extra e CSV sem pyarrow."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from src import columnar_export
+from src.columnar_export import (
+    FORMATO_CSV, FORMATO_PARQUET, HAS_PYARROW, descobrir_colunas_dados, exportar, linha_do_item,
+    resolver_formato,
+)
+
+PEDIDO = {"idSistema": "PGDASD", "idServico": "CONSEXTRATO16", "versaoSistema": "2.0"}
+
+
+def _item(indice: int, dados: dict) -> dict:
+    return {
+        "indice": indice,
+        "contribuinte": f"{indice:014d}",
+        "estado": "sucesso",
+        "tentativas": 1,
+        "resultado": {
+            "status": 200,
+            "mensagens": [{"codigo": "Sucesso-PGDASD", "texto": "Requisição efetuada."}],
+            "dados": json.dumps(dados),
+        },
+    }
+
+
+ITENS = [
+    _item(0, {"valor": 10, "situacao": {"codigo": 1}, "ativo": True, "parcelas": [1, 2]}),
+    _item(1, {"valor": 10.5, "situacao": {"codigo": "A"}, "ativo": False, "obs": None}),
+]
+
+
+def _csv(exportacao) -> list:
+    texto = b"".join(exportacao.iter_conteudo()).decode("utf-8")
+    return list(csv.DictReader(io.StringIO(texto)))
+
+
+def test_linha_achata_envelope_e_dados():
+    linha = linha_do_item(ITENS[0], PEDIDO, incluir_dados=True)
+
+    assert linha["id_servico"] == "CONSEXTRATO16"
+    assert linha["mensagens_codigos"] == "Sucesso-PGDASD"
+    assert linha["dados.situacao.codigo"] == 1
+    assert linha["dados.parcelas"] == "[1,2]"
+
+
+def test_descoberta_de_colunas_e_tipos():
+    linhas = [linha_do_item(item, PEDIDO, incluir_dados=True) for item in ITENS]
+
+    colunas = dict(descobrir_colunas_dados(linhas))
+
+    assert colunas == {
+        "dados.valor": "float",
+        "dados.situacao.codigo": "str",
+        "dados.ativo": "bool",
+        "dados.parcelas": "str",
+        "dados.obs": "str",
+    }
+
+
+def test_colunas_alem_do_limite_vao_para_dados_extra(monkeypatch):
+    monkeypatch.setattr(columnar_export, "MAX_COLUNAS_DADOS", 2)
+
+    exportacao = exportar(lambda: iter(ITENS), PEDIDO, FORMATO_CSV, incluir_dados=True)
+    linhas = _csv(exportacao)
+
+    assert "dados.valor" in linhas[0] and "dados.ativo" not in linhas[0]
+    assert json.loads(linhas[0]["dados_extra"]) == {"dados.ativo": True, "dados.parcelas": "[1,2]"}
+    assert json.loads(linhas[1]["dados_extra"]) == {"dados.ativo": False, "dados.obs": None}
+
+
+def test_csv_sem_pyarrow(monkeypatch):
+    monkeypatch.setattr(columnar_export, "HAS_PYARROW", False)
+
+    assert resolver_formato(None) == FORMATO_CSV
+    exportacao = exportar(lambda: iter(ITENS), PEDIDO, FORMATO_PARQUET, tamanho_bloco=1)
+
+    assert exportacao.formato == FORMATO_CSV
+    assert exportacao.nome_arquivo == "resultados.csv"
+    assert exportacao.linhas == 2
+    assert [linha["contribuinte"] for linha in _csv(exportacao)] == ["00000000000000", "00000000000001"]
+
+
+def test_formato_invalido():
+    with pytest.raises(ValueError):
+        resolver_formato("xlsx")
+
+
+@pytest.mark.skipif(not HAS_PYARROW, reason="pyarrow ausente")
+def test_parquet_com_tipos_das_colunas():
+    import pyarrow.parquet as pq
+
+    exportacao = exportar(lambda: iter(ITENS), PEDIDO, FORMATO_PARQUET, incluir_dados=True, tamanho_bloco=1)
+    tabela = pq.read_table(io.BytesIO(b"".join(exportacao.iter_conteudo())))
+
+    assert tabela.num_rows == 2
+    assert str(tabela.schema.field("dados.valor").type) == "double"
+    assert str(tabela.schema.field("dados.ativo").type) == "bool"
+    assert tabela.column("dados.situacao.codigo").to_pylist() == ["1", "A"]
@@ -0,0 +1,83 @@
+"""Testes da codificação de `dados`: objeto aceito na entrada e decodificação opcional na saída."""
+
+import pytest
+
+from src.business_logic import process_proxy_serpro
+from src.dados_codec import (
+    carregar_json, codificar_dados, decodificar_dados, preparar_body, serializar_json,
+)
+from src.mtls_client import MtlsClient
+
+PEDIDO = {"idSistema": "PGDASD", "idServico": "CONSEXTRATO16", "versaoSistema": "1.0"}
+EMPRESA = {"numero": "11111111000191", "tipo": 2}
+
+
+@pytest.fixture
+def enviados(monkeypatch):
+    """Substitui a chamada ao SERPRO: guarda o body e responde `dados` como string JSON."""
+    bodies = []
+
+    def post(self, endpoint, data, *args, **kwargs):
+        bodies.append(data)
+        return {"status": 200, "mensagens": [], "dados": '{"chamada": 1}'}
+
+    monkeypatch.setattr(MtlsClient, "post", post)
+    return bodies
+
+
+def _consultar(dados, **extras):
+    return process_proxy_serpro({
+        "endpoint": "/Consultar",
+        "body": {
+            "contratante": EMPRESA,
+            "autorPedidoDados": EMPRESA,
+            "contribuinte": EMPRESA,
+            "pedidoDados": {**PEDIDO, "dados": dados},
+        },
+        "access_token": "token",
+        "jwt_token": "jwt",
+        "ambiente": "trial",
+        **extras,
+    })
+
+
+def test_ida_e_volta():
+    valor = {"ano": 2024, "descrição": "ação", "itens": [1, 2]}
+
+    assert carregar_json(serializar_json(valor)) == valor
+    assert "ação" in serializar_json(valor).decode("utf-8")
+    assert decodificar_dados(codificar_dados(valor)) == valor
+
+
+def test_string_ja_codificada_e_mantida():
+    assert codificar_dados('{"ano": 2024}') == '{"ano": 2024}'
+    body = {"pedidoDados": {**PEDIDO, "dados": '{"ano": 2024}'}}
+    assert preparar_body(body) is body
+
+
+def test_dados_invalido_volta_como_veio():
+    assert decodificar_dados("") == ""
+    assert decodificar_dados("texto livre") == "texto livre"
+    assert decodificar_dados(None) is None
+
+
+def test_preparar_body_nao_altera_o_original():
+    body = {"pedidoDados": {**PEDIDO, "dados": {"ano": 2024}}}
+
+    preparado = preparar_body(body)
+
+    assert preparado["pedidoDados"]["dados"] == '{"ano":2024}'
+    assert body["pedidoDados"]["dados"] == {"ano": 2024}
+
+
+def test_proxy_codifica_objeto_e_decodifica_resposta(enviados):
+    resultado = _consultar({"periodo": "202401"}, decodificar_dados=True)
+
+    assert enviados[0]["pedidoDados"]["dados"] == '{"periodo":"202401"}'
+    assert resultado["dados"] == {"chamada": 1}
+
+
+def test_proxy_sem_decodificar_mantem_string(enviados):
+    resultado = _consultar('{"periodo": "202401"}')
+
+    assert resultado["dados"] == '{"chamada": 1}'
@@ -0,0 +1,108 @@
+"""Testes dos prazos: reserva da etapa final, precedência e limite da resposta inteira."""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from src.deadline import (
+    Deadline, DeadlineExcedidoError, PRAZO_MAXIMO, PRAZOS_PADRAO, prazo_da_rota,
+)
+from src.transport import HAS_HTTP2, Http1Transport, Http2Transport
+
+
+def test_etapas_anteriores_deixam_a_reserva():
+    deadline = Deadline(10, etapas_finais=("serpro",), reserva=0.5)
+
+    assert 4.5 < deadline.disponivel("autenticacao") <= 5
+    assert 9.5 < deadline.disponivel("serpro") <= 10
+    assert deadline.timeouts("autenticacao")[1] <= 5
+
+
+def test_reserva_esgotada_barra_so_as_etapas_anteriores():
+    deadline = Deadline(0.2, etapas_finais=("serpro",), reserva=0.9)
+    time.sleep(0.05)
+
+    with pytest.raises(DeadlineExcedidoError) as erro:
+        deadline.verificar("secret_manager")
+    assert erro.value.etapa == "secret_manager"
+    deadline.verificar("serpro")
+
+
+def test_sem_etapas_finais_nao_ha_reserva():
+    deadline = Deadline(10, reserva=0.5)
+
+    assert deadline.reserva == 0
+    assert deadline.disponivel("qualquer") > 9.5
+
+
+def test_precedencia_do_prazo_da_rota(monkeypatch):
+    monkeypatch.delenv("SERPRO_PRAZO_PROXY_SERPRO", raising=False)
+    assert prazo_da_rota("proxy_serpro").orcamento == PRAZOS_PADRAO["proxy_serpro"]
+    assert prazo_da_rota("proxy_serpro", padrao=12).orcamento == 12
+
+    monkeypatch.setenv("SERPRO_PRAZO_PROXY_SERPRO", "7")
+    assert prazo_da_rota("proxy_serpro", padrao=12).orcamento == 7
+    assert prazo_da_rota("proxy_serpro", "3", padrao=12).orcamento == 3
+    assert prazo_da_rota("proxy_serpro", "9999").orcamento == PRAZO_MAXIMO
+
+
+def test_header_invalido():
+    with pytest.raises(ValueError):
+        prazo_da_rota("proxy_serpro", "abc")
+
+
+def test_reserva_configuravel(monkeypatch):
+    monkeypatch.setenv("SERPRO_PRAZO_RESERVA", "0.25")
+
+    deadline = prazo_da_rota("proxy_serpro", "8")
+
+    assert deadline.etapas_finais == ("serpro",)
+    assert deadline.reserva == 2
+
+
+@pytest.fixture
+def servidor_gotejando():
+    """Responde 1 byte a cada 0.1s: nenhuma leitura isolada estoura o timeout."""
+
+    class Lento(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "20")
+            self.end_headers()
+            try:
+                for _ in range(20):
+                    self.wfile.write(b"x")
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    servidor = HTTPServer(("127.0.0.1", 0), Lento)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}/"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.mark.parametrize("classe", [
+    Http1Transport,
+    pytest.param(Http2Transport, marks=pytest.mark.skipif(not HAS_HTTP2, reason="httpx ausente")),
+])
+def test_resposta_lenta_respeita_o_prazo_total(servidor_gotejando, classe):
+    transporte = classe()
+    inicio = time.monotonic()
+
+    with pytest.raises(DeadlineExcedidoError) as erro:
+        transporte.post(servidor_gotejando, {}, b"{}", timeout=(1.0, 0.5))
+
+    assert erro.value.etapa == "leitura"
+    assert time.monotonic() - inicio < 1.2
+    transporte.close()
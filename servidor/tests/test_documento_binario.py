@@ -0,0 +1,42 @@
+"""Testes da entrega binária de documentos."""
+
+import base64
+
+import pytest
+
+from src.documento_binario import DocumentoBinario, content_disposition, extrair_documento
+
+
+def _resposta(pdf_base64: str) -> dict:
+    return {"status": 200, "mensagens": [], "dados": {"pdf": pdf_base64}}
+
+
+def test_documento_valido_preserva_tamanho_e_conteudo():
+    conteudo = b"%PDF-1.4 teste" * 1000
+    documento = extrair_documento(_resposta(base64.b64encode(conteudo).decode()), "pdf")
+
+    assert documento.tamanho == len(conteudo)
+    assert b"".join(documento.iter_conteudo()) == conteudo
+
+
+@pytest.mark.parametrize("invalido", ["abc", "ab!d", "ab=d", "QUJD\tRA=="])
+def test_base64_invalido_falha_antes_do_streaming(invalido):
+    with pytest.raises(ValueError):
+        extrair_documento(_resposta(invalido), "pdf")
+
+
+def test_nome_arquivo_nao_injeta_headers():
+    valor = content_disposition("inline", 'a"b\r\nX-Injetado: 1.pdf')
+
+    assert "\r" not in valor and "\n" not in valor
+    assert valor.startswith('inline; filename="a_b__X-Injetado__1.pdf"')
+    assert "filename*=UTF-8''a%22b%0D%0AX-Injetado%3A%201.pdf" in valor
+
+
+def test_multipart_usa_nome_escapado():
+    documento = DocumentoBinario(
+        base64.b64encode(b"pdf").decode(), {"status": 200}, nome_arquivo='x"y.pdf', formato="multipart"
+    )
+    corpo = b"".join(documento.iter_conteudo())
+
+    assert b'filename="x_y.pdf"' in corpo
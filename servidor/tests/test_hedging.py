@@ -0,0 +1,73 @@
+"""Testes do hedge: tentativas extras contabilizadas e execução na thread de quem chama."""
+
+import threading
+import time
+
+from src import hedging, usage
+from src.business_logic import process_proxy_serpro
+from src.hedging import Hedger
+from src.tenant_scope import escopo_da_credencial
+from tests.test_idempotency import BODY_EMITIR
+
+CHAVE = "trial:PGMEI/DIVIDAATIVA24"
+BODY_CONSULTA = {
+    **BODY_EMITIR,
+    "pedidoDados": {"idSistema": "PGMEI", "idServico": "DIVIDAATIVA24", "versaoSistema": "1.0", "dados": "{}"},
+}
+
+
+def _hedger_pronto() -> Hedger:
+    """Hedger com histograma rápido e orçamento para um hedge por chamada."""
+    hedger = Hedger(orcamento=100, atraso_minimo=0.05, amostras_minimas=1, max_threads=4)
+    hedger.histograma(CHAVE).registrar(0.01)
+    return hedger
+
+
+def test_sem_hedge_possivel_roda_na_thread_de_quem_chama():
+    hedger = Hedger(amostras_minimas=1000)
+    threads = []
+
+    resultado = hedger.executar(CHAVE, lambda: threads.append(threading.current_thread()) or "ok")
+
+    assert resultado == "ok"
+    assert threads == [threading.current_thread()]
+
+
+def test_tentativa_extra_e_avisada():
+    hedger = _hedger_pronto()
+    extras = []
+    atrasos = iter([0.5, 0.0])
+
+    def tentativa():
+        time.sleep(next(atrasos))
+        return "ok"
+
+    assert hedger.executar(CHAVE, tentativa, ao_tentativa_extra=lambda: extras.append(1)) == "ok"
+    assert extras == [1]
+    assert hedger.estatisticas()["hedges_vencedores"] == 1
+
+
+def test_hedge_contabiliza_cada_tentativa(transporte, monkeypatch):
+    monkeypatch.setenv("SERPRO_HEDGE_ATIVO", "1")
+    monkeypatch.setattr(hedging, "_hedger", _hedger_pronto())
+    post_original = transporte.post
+    atrasos = iter([0.5, 0.0])
+
+    def post_lento_uma_vez(*args, **kwargs):
+        time.sleep(next(atrasos))
+        return post_original(*args, **kwargs)
+
+    monkeypatch.setattr(transporte, "post", post_lento_uma_vez)
+
+    process_proxy_serpro({
+        "endpoint": "/Consultar",
+        "body": BODY_CONSULTA,
+        "access_token": "token-a",
+        "jwt_token": "jwt",
+    })
+    time.sleep(0.6)  # a tentativa perdedora termina em segundo plano
+
+    linha = usage.obter_contabilidade().consultar(escopo_da_credencial(access_token="token-a"))["servicos"][0]
+    assert len(transporte.chamadas) == 2
+    assert linha["chamadas"] == 2
+    assert linha["bytes_enviados"] == sum(len(chamada["body"]) for chamada in transporte.chamadas)
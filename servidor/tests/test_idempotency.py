@@ -0,0 +1,115 @@
+"""Testes do escopo das chaves de idempotência."""
+
+import json
+
+import pytest
+
+from src.business_logic import process_proxy_serpro
+from src.idempotency import HEADER_REPETIDA, chave_idempotencia, headers_repeticao
+
+BODY_EMITIR = {
+    "contratante": {"numero": "11111111000191", "tipo": 2},
+    "autorPedidoDados": {"numero": "11111111000191", "tipo": 2},
+    "contribuinte": {"numero": "22222222000191", "tipo": 2},
+    "pedidoDados": {
+        "idSistema": "PGMEI",
+        "idServico": "GERARDASPDF21",
+        "versaoSistema": "1.0",
+        "dados": "{\"periodoApuracao\": \"202401\"}"
+    }
+}
+
+
+def _emitir(access_token: str, **extras):
+    return process_proxy_serpro({
+        "endpoint": "/Emitir",
+        "body": BODY_EMITIR,
+        "access_token": access_token,
+        "jwt_token": "jwt",
+        "ambiente": "trial",
+        **extras,
+    })
+
+
+def test_chave_depende_da_credencial():
+    chave_a = chave_idempotencia("producao", "/Emitir", BODY_EMITIR, "cert-a", implicita=True)
+    chave_b = chave_idempotencia("producao", "/Emitir", BODY_EMITIR, "cert-b", implicita=True)
+
+    assert chave_a and chave_b and chave_a != chave_b
+    assert chave_a == chave_idempotencia("producao", "/Emitir", BODY_EMITIR, "cert-a", implicita=True)
+
+
+def test_chave_do_cliente_tambem_tem_escopo_de_credencial():
+    chave_a = chave_idempotencia("producao", "/Consultar", BODY_EMITIR, "cert-a", chave_cliente="k1")
+    chave_b = chave_idempotencia("producao", "/Consultar", BODY_EMITIR, "cert-b", chave_cliente="k1")
+
+    assert chave_a != chave_b
+
+
+def test_credencial_obrigatoria():
+    with pytest.raises(ValueError):
+        chave_idempotencia("producao", "/Emitir", BODY_EMITIR, "")
+
+
+def test_mesma_credencial_reaproveita_resultado(transporte):
+    primeiro = _emitir("token-a", idempotency_key="k1")
+    assert headers_repeticao() == {}
+    repetido = _emitir("token-a", idempotency_key="k1")
+
+    assert len(transporte.chamadas) == 1
+    assert repetido["dados"] == primeiro["dados"]
+    assert headers_repeticao() == {HEADER_REPETIDA: "true"}
+
+
+def test_outra_credencial_nao_recebe_resultado_guardado(transporte):
+    primeiro = _emitir("token-a", idempotency_key="k1")
+    outro = _emitir("token-b", idempotency_key="k1")
+
+    assert len(transporte.chamadas) == 2
+    assert outro["dados"] != primeiro["dados"]
+    assert transporte.chamadas[1]["headers"]["Authorization"] == "Bearer token-b"
+
+
+def test_producao_usa_fingerprint_do_certificado(transporte, identidade, monkeypatch):
+    import src.business_logic as business_logic
+
+    monkeypatch.setattr(business_logic, "_resolve_registered_identity", lambda data: identidade)
+    _emitir("token-a", ambiente="producao", idempotency_key="k1")
+    _emitir("token-b", ambiente="producao", idempotency_key="k1")
+
+    # Token renovado, mesmo certificado: a retentativa não gera nova emissão
+    assert len(transporte.chamadas) == 1
+
+
+def test_sem_header_so_deduplica_se_habilitado(transporte, monkeypatch):
+    _emitir("token-a")
+    _emitir("token-a")
+    assert len(transporte.chamadas) == 2
+
+    monkeypatch.setenv("SERPRO_IDEMPOTENCIA_IMPLICITA", "1")
+    _emitir("token-a")
+    _emitir("token-a")
+    assert len(transporte.chamadas) == 3
+
+
+def test_erro_de_negocio_nao_e_guardado(transporte, monkeypatch):
+    from src.transport import RespostaHttp
+
+    post = transporte.post
+    falhas = iter([True])
+
+    def post_com_erro(*args, **kwargs):
+        resposta = post(*args, **kwargs)
+        if next(falhas, False):
+            corpo = json.dumps({"status": 200, "mensagens": [{"codigo": "[Erro-PGMEI-MSG_01]", "texto": "Indisponível"}]})
+            return RespostaHttp(200, {"content-type": "application/json"}, corpo.encode())
+        return resposta
+
+    monkeypatch.setattr(transporte, "post", post_com_erro)
+    com_erro = _emitir("token-a", idempotency_key="k1")
+    retentativa = _emitir("token-a", idempotency_key="k1")
+
+    assert com_erro["mensagens"][0]["codigo"].startswith("[Erro")
+    assert retentativa["mensagens"] == []
+    assert len(transporte.chamadas) == 2
+    assert headers_repeticao() == {}
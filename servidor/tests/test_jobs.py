@@ -0,0 +1,158 @@
+"""Testes da retomada, do escopo e da renovação de tokens dos jobs."""
+
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from src.encryption import Cifrador
+from src.jobs import (
+    ESTADO_AGUARDANDO_TOKENS,
+    ESTADO_CONCLUIDO,
+    ESTADO_ERRO,
+    ESTADO_EXECUTANDO,
+    ITEM_PENDENTE,
+    JobManager,
+    JobNaoEncontradoError
+)
+from tests.test_idempotency import BODY_EMITIR
+
+ESCOPO = "escopo-a"
+CONTRIBUINTES = ["22222222000191", "33333333000191", "44444444000191"]
+
+
+class ExecutorFalso:
+    """Proxy simulado: conta as chamadas por contribuinte."""
+
+    def __init__(self):
+        self.chamadas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, data, deadline=None):
+        with self._lock:
+            self.chamadas.append((data["body"]["contribuinte"]["numero"], data["access_token"]))
+        return {"status": 200, "dados": "{}"}
+
+
+def _template(**extras):
+    return {"endpoint": "/Emitir", "body": BODY_EMITIR, "access_token": "token", "jwt_token": "jwt", **extras}
+
+
+def _aguardar(gerenciador, job_id, estados=(ESTADO_CONCLUIDO,), limite=5.0):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        progresso = gerenciador.progresso(job_id, ESCOPO)
+        if progresso["estado"] in estados and job_id not in gerenciador._ativos:
+            return progresso
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} não chegou a {estados}")
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def test_retomada_reivindica_uma_unica_vez(caminho):
+    executor = ExecutorFalso()
+    # Processo que cria o job e cai antes de executá-lo
+    original = JobManager(executor, caminho=caminho, lease=30)
+    original._iniciar = lambda job_id: True
+    job_id = original.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+
+    outros = [JobManager(executor, caminho=caminho, lease=30) for _ in range(3)]
+
+    # Lease do dono ainda válido: ninguém retoma
+    assert [gerenciador.retomar_pendentes() for gerenciador in outros] == [[], [], []]
+
+    original._conexao().execute("UPDATE jobs SET lease_expira = 0 WHERE id = ?", (job_id,))
+    retomados = [gerenciador.retomar_pendentes() for gerenciador in outros]
+
+    assert sorted(retomados) == [[], [], [job_id]]
+    dono = outros[[bool(lista) for lista in retomados].index(True)]
+    assert _aguardar(dono, job_id)["concluidos"] == len(CONTRIBUINTES)
+    assert sorted(numero for numero, _ in executor.chamadas) == sorted(CONTRIBUINTES)
+
+
+def test_job_de_outra_credencial_nao_existe(caminho):
+    gerenciador = JobManager(ExecutorFalso(), caminho=caminho)
+    job_id = gerenciador.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+
+    with pytest.raises(JobNaoEncontradoError):
+        gerenciador.progresso(job_id, "escopo-b")
+    with pytest.raises(JobNaoEncontradoError):
+        gerenciador.resultados(job_id, "escopo-b")
+    with pytest.raises(JobNaoEncontradoError):
+        gerenciador.cancelar(job_id, "escopo-b")
+    _aguardar(gerenciador, job_id)
+
+
+def test_tokens_vencidos_param_o_job_ate_renovacao(caminho):
+    executor = ExecutorFalso()
+    gerenciador = JobManager(executor, caminho=caminho)
+    job_id = gerenciador.criar(_template(ambiente="producao", expires_in=0), CONTRIBUINTES, ESCOPO)["job_id"]
+
+    progresso = _aguardar(gerenciador, job_id, estados=(ESTADO_AGUARDANDO_TOKENS,))
+    assert progresso["pendentes"] == len(CONTRIBUINTES)
+    assert executor.chamadas == []
+
+    progresso = gerenciador.renovar_tokens(job_id, ESCOPO, "token-novo", "jwt-novo", expires_in=3600)
+    assert progresso["estado"] == ESTADO_EXECUTANDO
+
+    assert _aguardar(gerenciador, job_id)["concluidos"] == len(CONTRIBUINTES)
+    assert {token for _, token in executor.chamadas} == {"token-novo"}
+
+
+def test_renovar_tokens_exige_job_parado(caminho):
+    gerenciador = JobManager(ExecutorFalso(), caminho=caminho)
+    job_id = gerenciador.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+    _aguardar(gerenciador, job_id)
+
+    with pytest.raises(ValueError):
+        gerenciador.renovar_tokens(job_id, ESCOPO, "token-novo", "jwt-novo")
+
+
+def test_job_com_outra_chave_termina_em_erro(caminho):
+    executor = ExecutorFalso()
+    original = JobManager(executor, caminho=caminho, cifrador=Cifrador(Fernet.generate_key()))
+    original._iniciar = lambda job_id: True
+    job_id = original.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+    original._conexao().execute("UPDATE jobs SET lease_expira = 0 WHERE id = ?", (job_id,))
+
+    # Reinício com chave efêmera nova: o template não decifra mais
+    reiniciado = JobManager(executor, caminho=caminho, cifrador=Cifrador(Fernet.generate_key()))
+    assert reiniciado.retomar_pendentes() == [job_id]
+
+    progresso = _aguardar(reiniciado, job_id, estados=(ESTADO_ERRO,))
+    assert "outra chave" in progresso["erro"]
+    assert executor.chamadas == []
+    assert reiniciado.retomar_pendentes() == []
+
+
+def test_resultado_ilegivel_vira_erro_do_item(caminho):
+    original = JobManager(ExecutorFalso(), caminho=caminho, cifrador=Cifrador(Fernet.generate_key()))
+    job_id = original.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+    _aguardar(original, job_id)
+
+    reiniciado = JobManager(ExecutorFalso(), caminho=caminho, cifrador=Cifrador(Fernet.generate_key()))
+    itens = reiniciado.resultados(job_id, ESCOPO)["itens"]
+
+    assert all(item["resultado"] is None and "outra chave" in item["erro"] for item in itens)
+
+
+def test_falha_no_checkpoint_nao_conclui_o_job(caminho):
+    gerenciador = JobManager(ExecutorFalso(), caminho=caminho)
+    gravar = gerenciador._gravar_item
+
+    def gravar_falhando(job_id, indice, *args, **kwargs):
+        if indice == 1:
+            raise RuntimeError("database is locked")
+        gravar(job_id, indice, *args, **kwargs)
+
+    gerenciador._gravar_item = gravar_falhando
+    job_id = gerenciador.criar(_template(), CONTRIBUINTES, ESCOPO)["job_id"]
+
+    progresso = _aguardar(gerenciador, job_id, estados=(ESTADO_EXECUTANDO,))
+    assert progresso["pendentes"] == 1
+    assert [item["estado"] for item in gerenciador.iterar_itens(job_id, ESCOPO)].count(ITEM_PENDENTE) == 1
@@ -0,0 +1,84 @@
+"""Testes do pré-aquecimento de conexões por certificado."""
+
+import pytest
+
+from src import prewarm
+from src.certificate_registry import CertificateRegistry
+from src.encryption import ENV_CHAVE, Cifrador
+from src.prewarm import PreAquecedor, obter_preaquecedor
+from tests.conftest import TransporteFalso, criar_identidade
+
+URLS = ("https://autenticacao.exemplo", "https://gateway.exemplo")
+
+
+class _TransporteAquecivel(TransporteFalso):
+    """Registra os HEADs de aquecimento; o servidor de `falhar` não responde."""
+
+    def __init__(self, falhar: str = ""):
+        super().__init__()
+        self.falhar = falhar
+        self.heads = []
+
+    def _head(self, url, identidade, timeout) -> bool:
+        self.heads.append((url, identidade.fingerprint))
+        if url == self.falhar:
+            raise ConnectionError("sem rota")
+        return True
+
+
+@pytest.fixture
+def registro(tmp_path, monkeypatch):
+    monkeypatch.delenv(ENV_CHAVE, raising=False)
+    registro = CertificateRegistry(Cifrador(), str(tmp_path))
+    identidade = criar_identidade("A")
+    # Dois handles do mesmo certificado são aquecidos uma vez só
+    registro.registrar(identidade)
+    registro.registrar(identidade)
+    registro.registrar(criar_identidade("B"))
+    return registro
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(prewarm.time, "monotonic", lambda: agora[0])
+    return agora
+
+
+def test_aquece_cada_certificado_uma_vez_por_janela(registro, relogio):
+    transporte = _TransporteAquecivel()
+    aquecedor = PreAquecedor(transporte, registro, conexoes=3, ociosidade=60, urls=URLS)
+
+    assert aquecedor.aquecer_ociosos() == 2 * 2 * 3
+    assert len(transporte.heads) == 12
+    assert aquecedor.aquecer_ociosos() == 0
+
+    relogio[0] += 61
+    assert aquecedor.aquecer_ociosos() == 12
+    assert transporte.estatisticas()["conexoes_preaquecidas"] == 24
+
+
+def test_certificado_em_uso_nao_e_aquecido(registro, relogio):
+    transporte = _TransporteAquecivel()
+    em_uso = registro.identidades()[0]
+    transporte._marcar_uso(em_uso)
+    aquecedor = PreAquecedor(transporte, registro, conexoes=1, ociosidade=60, urls=URLS)
+
+    aquecedor.aquecer_ociosos()
+
+    assert em_uso.fingerprint not in {fingerprint for _, fingerprint in transporte.heads}
+    assert len(transporte.heads) == 2
+
+
+def test_falha_de_um_servidor_nao_interrompe(registro, relogio):
+    transporte = _TransporteAquecivel(falhar=URLS[0])
+    aquecedor = PreAquecedor(transporte, registro, conexoes=2, ociosidade=60, urls=URLS)
+
+    # Só o gateway responde: 2 certificados x 2 conexões
+    assert aquecedor.aquecer_ociosos() == 4
+
+
+def test_desligado_por_padrao(monkeypatch):
+    monkeypatch.delenv("SERPRO_PREAQUECER_CONEXOES", raising=False)
+
+    assert obter_preaquecedor() is None
@@ -0,0 +1,58 @@
+"""Testes do acesso compartilhado ao Secret Manager."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src import secret_manager
+from src.secret_manager import acessar_segredo
+
+NOME = "projects/p/secrets/s/versions/latest"
+
+
+class _ClienteFalso:
+    def __init__(self):
+        self.leituras = 0
+        self._lock = threading.Lock()
+
+    def access_secret_version(self, request, timeout=None):
+        with self._lock:
+            self.leituras += 1
+        return SimpleNamespace(payload=SimpleNamespace(data=f" valor-{self.leituras}\n".encode()))
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    falso = _ClienteFalso()
+    monkeypatch.setattr(secret_manager, "obter_cliente", lambda: falso)
+    monkeypatch.setattr(secret_manager, "_valores", {})
+    return falso
+
+
+def test_valor_fica_em_cache_entre_requisicoes(cliente, monkeypatch):
+    monkeypatch.delenv("SERPRO_SEGREDOS_TTL", raising=False)
+    leituras = []
+    threads = [threading.Thread(target=lambda: leituras.append(acessar_segredo(NOME))) for _ in range(8)]
+    acessar_segredo(NOME)
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cliente.leituras == 1
+    assert set(leituras) == {"valor-1"}
+
+
+def test_ttl_zero_desliga_o_cache(cliente, monkeypatch):
+    monkeypatch.setenv("SERPRO_SEGREDOS_TTL", "0")
+
+    assert [acessar_segredo(NOME) for _ in range(2)] == ["valor-1", "valor-2"]
+
+
+def test_sem_secret_manager(monkeypatch):
+    monkeypatch.setattr(secret_manager, "HAS_SECRET_MANAGER", False)
+
+    with pytest.raises(ValueError):
+        secret_manager.obter_cliente()
@@ -0,0 +1,95 @@
+"""Paridade do catálogo de serviços com a biblioteca Dart."""
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from src.service_catalog import CATALOGO, validar_requisicao
+
+RAIZ_DART = Path(__file__).resolve().parents[2] / "lib" / "src"
+
+_CLASSE = re.compile(r"\b(?:class|enum)\s+(\w+)")
+_CONSTANTE = re.compile(r"static const String (\w+) = '([^']*)';")
+_VALOR_ENUM = re.compile(r"^\s*(\w+)\('([A-Z0-9]+)'\)[,;]", re.M)
+_CAMPO = r"\b{}:\s*([^,\n)]+)"
+
+
+def _constantes(fontes: Dict[Path, str]) -> Dict[str, str]:
+    """Classe.constante e Enum.valor.idServico -> texto, para resolver referências."""
+    valores = {}
+    for fonte in fontes.values():
+        classes = [(m.start(), m.group(1)) for m in _CLASSE.finditer(fonte)]
+
+        def dona(posicao: int) -> Optional[str]:
+            anteriores = [nome for inicio, nome in classes if inicio < posicao]
+            return anteriores[-1] if anteriores else None
+
+        for m in _CONSTANTE.finditer(fonte):
+            valores[f"{dona(m.start())}.{m.group(1)}"] = m.group(2)
+        for m in _VALOR_ENUM.finditer(fonte):
+            valores[f"{dona(m.start())}.{m.group(1)}.idServico"] = m.group(2)
+    return valores
+
+
+def _resolver(expressao: Optional[str], constantes: Dict[str, str]) -> Optional[str]:
+    if expressao is None:
+        return None
+    expressao = expressao.strip()
+    if expressao.startswith("'") and expressao.endswith("'"):
+        return expressao[1:-1]
+    return constantes.get(expressao)
+
+
+def pares_dart() -> List[Tuple[str, str, str, str]]:
+    """(arquivo, idSistema, idServico, versaoSistema) de cada PedidoDados da biblioteca Dart."""
+    fontes = {caminho: caminho.read_text(encoding="utf-8") for caminho in RAIZ_DART.rglob("*.dart")}
+    constantes = _constantes(fontes)
+    pares = set()
+    for caminho, fonte in fontes.items():
+        for m in re.finditer(r"PedidoDados\(", fonte):
+            trecho = fonte[m.end():m.end() + 400].split("PedidoDados(")[0]
+            campos = {
+                campo: (re.search(_CAMPO.format(campo), trecho) or [None, None])[1]
+                for campo in ("idSistema", "idServico", "versaoSistema")
+            }
+            id_sistema = _resolver(campos["idSistema"], constantes)
+            id_servico = _resolver(campos["idServico"], constantes)
+            if not id_sistema or not id_servico:
+                continue  # pedido montado a partir de outro (fromJson, cópias)
+            # PedidoDados serializa versaoSistema ausente como '1.0'
+            versao = _resolver(campos["versaoSistema"], constantes) if campos["versaoSistema"] else "1.0"
+            pares.add((caminho.relative_to(RAIZ_DART).as_posix(), id_sistema, id_servico, versao))
+    return sorted(pares)
+
+
+PARES_DART = pares_dart() if RAIZ_DART.is_dir() else []
+
+
+def test_biblioteca_dart_encontrada():
+    if not RAIZ_DART.is_dir():
+        pytest.skip("biblioteca Dart fora da árvore")
+    assert len(PARES_DART) >= len(CATALOGO) // 2
+
+
+@pytest.mark.parametrize("arquivo,id_sistema,id_servico,versao", PARES_DART)
+def test_par_dart_no_catalogo(arquivo, id_sistema, id_servico, versao):
+    servico = CATALOGO.get((id_sistema, id_servico))
+
+    assert servico is not None, f"{arquivo}: ({id_sistema}, {id_servico}) fora do catálogo"
+    if versao is not None:
+        assert servico.versao_sistema == versao, f"{arquivo}: versaoSistema {versao}"
+
+
+def test_relpsn_consulta_com_id_do_parcsn_especial():
+    body = {
+        "contratante": {"numero": "11111111000191", "tipo": 2},
+        "autorPedidoDados": {"numero": "11111111000191", "tipo": 2},
+        "contribuinte": {"numero": "22222222000191", "tipo": 2},
+        "pedidoDados": {"idSistema": "RELPSN", "idServico": "OBTERPARC174", "versaoSistema": "1.0", "dados": "1"},
+    }
+
+    assert validar_requisicao("/Consultar", body).id_sistema == "RELPSN"
+    with pytest.raises(ValueError, match="pertence ao idSistema"):
+        validar_requisicao("/Consultar", {**body, "pedidoDados": {**body["pedidoDados"], "idSistema": "PERTSN"}})
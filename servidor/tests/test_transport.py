@@ -0,0 +1,99 @@
+"""Testes dos transportes HTTP."""
+
+import pytest
+
+from src.transport import Http1Transport, Transport, _ConexaoTlsRetomavel, _PoolPorCertificado
+from tests.conftest import criar_identidade
+
+
+class _Cliente:
+    def __init__(self):
+        self.fechado = False
+
+    def close(self):
+        self.fechado = True
+
+
+def test_transport_exige_post():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_clientes_por_certificado_ficam_limitados():
+    pool = _PoolPorCertificado(lambda identidade: _Cliente(), maximo=2)
+    identidades = [criar_identidade(f"Tenant {i}") for i in range(3)]
+
+    primeiro = pool.obter(identidades[0])
+    segundo = pool.obter(identidades[1])
+    assert pool.obter(identidades[0]) is primeiro
+
+    pool.obter(identidades[2])
+
+    assert len(pool) == 2
+    # identidades[1] era a menos usada: foi descartada e fechada, a primeira continua
+    assert segundo.fechado and not primeiro.fechado
+    assert pool.obter(identidades[0]) is primeiro
+
+
+def test_fechar_libera_todos_os_clientes():
+    pool = _PoolPorCertificado(lambda identidade: _Cliente(), maximo=2)
+    clientes = [pool.obter(criar_identidade(nome)) for nome in ("A", "B")]
+
+    pool.fechar()
+
+    assert len(pool) == 0
+    assert all(cliente.fechado for cliente in clientes)
+
+
+def test_sessoes_por_certificado_ficam_limitadas():
+    transporte = Http1Transport(max_certificados=2)
+    identidades = [criar_identidade(f"Tenant {i}") for i in range(3)]
+
+    primeira = transporte._sessao(identidades[0])
+    transporte._sessao(identidades[1])
+    assert transporte._sessao(identidades[0]) is primeira
+
+    transporte._sessao(identidades[2])
+
+    assert len(transporte._sessoes) == 2
+    # identidades[1] era a menos usada: foi descartada, a primeira continua
+    assert transporte._sessao(identidades[0]) is primeira
+
+
+def test_cliente_descartado_e_fechado(monkeypatch):
+    transporte = Http1Transport(max_certificados=1)
+    criados = []
+
+    def criar(identidade):
+        criados.append(_Cliente())
+        return criados[-1]
+
+    monkeypatch.setattr(transporte._sessoes, "_criar", criar)
+    transporte._sessao(criar_identidade("A"))
+    transporte._sessao(criar_identidade("B"))
+
+    assert [cliente.fechado for cliente in criados] == [True, False]
+
+
+def test_ultimo_uso_limitado():
+    transporte = Http1Transport(max_certificados=2)
+    identidades = [criar_identidade(f"Tenant {i}") for i in range(3)]
+    for identidade in identidades:
+        transporte._marcar_uso(identidade)
+
+    assert transporte.ocioso_ha(identidades[0]) is None
+    assert transporte.ocioso_ha(identidades[2]) is not None
+
+
+def test_conexoes_http1_guardam_a_sessao_tls():
+    transporte = Http1Transport()
+    identidade = criar_identidade()
+    sessao = transporte._sessao(identidade)
+
+    pool = sessao.get_adapter("https://gateway.apiserpro.serpro.gov.br").poolmanager.connection_from_url(
+        "https://gateway.apiserpro.serpro.gov.br"
+    )
+
+    assert pool.ConnectionCls is _ConexaoTlsRetomavel
+    # Socket que não é TLS deste contexto é ignorado
+    transporte._contexto_tls(identidade).guardar_sessao(object())
@@ -0,0 +1,93 @@
+"""Testes da contabilização de uso com escopo de credencial."""
+
+import threading
+
+import pytest
+
+from src import usage
+from src.business_logic import process_consultar_uso, process_proxy_serpro
+from src.tenant_scope import CredencialAusenteError, escopo_da_credencial
+from src.usage import FileUsageStore, SQLiteUsageStore, UsageAccounting, UsageStore
+from tests.test_idempotency import BODY_EMITIR
+
+
+def _consultar(access_token: str, **filtros):
+    return process_consultar_uso({"access_token": access_token, **filtros})
+
+
+def test_store_abstrata():
+    with pytest.raises(TypeError):
+        UsageStore()
+
+
+def test_consulta_exige_credencial(transporte):
+    with pytest.raises(CredencialAusenteError):
+        process_consultar_uso({})
+
+
+def test_consulta_so_enxerga_o_proprio_uso(transporte):
+    process_proxy_serpro({
+        "endpoint": "/Emitir",
+        "body": BODY_EMITIR,
+        "access_token": "token-a",
+        "jwt_token": "jwt",
+    })
+
+    proprio = _consultar("token-a")
+    alheio = _consultar("token-b")
+
+    assert [linha["chamadas"] for linha in proprio["servicos"]] == [1]
+    assert proprio["tenants"][0]["tenant"] == "11111111000191"
+    assert alheio == {"servicos": [], "tenants": []}
+
+
+@pytest.mark.parametrize("criar", [
+    lambda caminho: SQLiteUsageStore(str(caminho / "uso.db")),
+    lambda caminho: FileUsageStore(str(caminho / "uso.jsonl")),
+])
+def test_stores_persistidos_filtram_por_escopo(tmp_path, criar):
+    contabilidade = UsageAccounting(store=criar(tmp_path), intervalo=0)
+    escopo_a = escopo_da_credencial(access_token="token-a")
+    escopo_b = escopo_da_credencial(access_token="token-b")
+    contabilidade.registrar_chamada(escopo_a, "111", "PGMEI/GERARDASPDF21", 10, 20, 0.1)
+    contabilidade.registrar_chamada(escopo_b, "222", "PGMEI/GERARDASPDF21", 10, 20, 0.1)
+    contabilidade.gravar()
+
+    linhas = contabilidade.consultar(escopo_a)["servicos"]
+
+    assert [(linha["tenant"], linha["chamadas"]) for linha in linhas] == [("111", 1)]
+
+
+def test_latencia_maxima_e_da_propria_hora(monkeypatch):
+    contabilidade = UsageAccounting(intervalo=0)
+    agora = [10 * 3600 + 5]
+    monkeypatch.setattr(usage.time, "time", lambda: agora[0])
+    escopo = escopo_da_credencial(access_token="token-a")
+
+    contabilidade.registrar_chamada(escopo, "111", "PGMEI/GERARDASPDF21", 10, 20, 2.0)
+    contabilidade.gravar()
+    agora[0] = 11 * 3600 + 5
+    contabilidade.registrar_chamada(escopo, "111", "PGMEI/GERARDASPDF21", 10, 20, 0.5)
+    contabilidade.gravar()
+
+    def maxima(hora):
+        periodo = f"1970-01-01T{hora}"
+        return contabilidade.consultar(escopo, desde=periodo, ate=periodo)["servicos"][0]["latencia_max_ms"]
+
+    assert (maxima(10), maxima(11)) == (2000.0, 500.0)
+
+
+def test_fragmentos_de_threads_encerradas_sao_recolhidos():
+    contabilidade = UsageAccounting(intervalo=0)
+    escopo = escopo_da_credencial(access_token="token-a")
+
+    for _ in range(5):
+        thread = threading.Thread(
+            target=contabilidade.registrar_chamada, args=(escopo, "111", "PGMEI/GERARDASPDF21", 10, 20, 0.1)
+        )
+        thread.start()
+        thread.join()
+    contabilidade.gravar()
+
+    assert contabilidade._fragmentos == []
+    assert contabilidade.consultar(escopo)["servicos"][0]["chamadas"] == 5